@@ -0,0 +1,96 @@
+# auth_cache.py - cache dos utilizadores autenticados por token
+#
+# Evita descodificar o JWT e fazer um SELECT ao vendedor/cliente em cada pedido
+# autenticado (por exemplo a cada atualização de localização). As entradas
+# duram pouco e são apagadas quando o perfil ou a subscrição mudam.
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+
+
+# Principal
+@dataclass(frozen=True)
+class Principal:
+    """Resumo do utilizador autenticado guardado em cache."""
+
+    kind: str  # "vendor" ou "client"
+    id: int
+    subscription_active: bool = False
+    subscription_valid_until: datetime | None = None
+
+
+# PrincipalCache
+class PrincipalCache:
+    """LRU limitado a ``maxsize`` entradas, cada uma válida ``ttl`` segundos
+    (nunca para além da expiração do próprio token)."""
+
+    # __init__
+    def __init__(self, maxsize: int = 10000, ttl: float = 30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # (tipo, token) -> (principal, instante em que expira)
+        self._entries: OrderedDict[tuple[str, str], tuple[Principal, float]] = OrderedDict()
+        self._tokens: dict[tuple[str, int], set[tuple[str, str]]] = {}
+        self._lock = threading.Lock()
+
+    # __len__
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # get
+    def get(self, kind: str, token: str) -> Principal | None:
+        key = (kind, token)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    # put
+    def put(self, token: str, principal: Principal, token_exp: float | None = None):
+        """Guarda ``principal``; ``token_exp`` é o ``exp`` (epoch) do token."""
+        key = (principal.kind, token)
+        expires = time.monotonic() + self.ttl
+        if token_exp is not None:
+            expires = min(expires, time.monotonic() + token_exp - time.time())
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (principal, expires)
+            self._tokens.setdefault((principal.kind, principal.id), set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+
+    # invalidate
+    def invalidate(self, kind: str, principal_id: int):
+        """Apaga todas as entradas de um vendedor ou cliente."""
+        with self._lock:
+            for key in list(self._tokens.get((kind, principal_id), ())):
+                self._remove(key)
+
+    # clear
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tokens.clear()
+
+    # _remove
+    def _remove(self, key: tuple[str, str]):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        owner = (entry[0].kind, entry[0].id)
+        keys = self._tokens.get(owner)
+        if keys:
+            keys.discard(key)
+            if not keys:
+                del self._tokens[owner]
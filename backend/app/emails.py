@@ -0,0 +1,236 @@
+# emails.py - envio de emails em segundo plano
+#
+# Os endpoints só põem a mensagem numa fila e respondem logo; um ou mais
+# workers enviam-nas reutilizando a mesma ligação SMTP (sem STARTTLS e login a
+# cada email) e voltam a tentar, com espera crescente, quando o envio falha.
+import asyncio
+import smtplib
+import time
+from dataclasses import dataclass
+from email import policy
+from email.message import EmailMessage
+
+
+# OutgoingEmail
+@dataclass
+class OutgoingEmail:
+    to: str
+    subject: str
+    body: str
+    attempts: int = 0
+
+
+# build_message
+def build_message(sender: str, email: OutgoingEmail) -> EmailMessage:
+    msg = EmailMessage(policy=policy.SMTP.clone(max_line_length=1000))
+    msg["From"] = sender
+    msg["To"] = email.to
+    msg["Subject"] = email.subject
+    msg.set_content(email.body)
+    return msg
+
+
+# SMTPSender
+class SMTPSender:
+    """Ligação SMTP persistente: abre (STARTTLS + login) só quando é preciso e
+    volta a ligar se o servidor a fechou ou se esteve parada ``idle_timeout`` s."""
+
+    # __init__
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        user: str | None = None,
+        password: str | None = None,
+        starttls: bool = True,
+        timeout: float = 30.0,
+        idle_timeout: float = 60.0,
+    ):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.connections = 0
+        self._smtp: smtplib.SMTP | None = None
+        self._last_used = 0.0
+
+    # _connect
+    def _connect(self) -> smtplib.SMTP:
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                smtp.starttls()
+            if self.user and self.password:
+                smtp.login(self.user, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        self.connections += 1
+        return smtp
+
+    # send
+    def send(self, msg: EmailMessage):
+        if self._smtp is not None and time.monotonic() - self._last_used > self.idle_timeout:
+            self.close()
+        if self._smtp is None:
+            self._smtp = self._connect()
+        try:
+            self._smtp.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            # a ligação guardada já não serve: uma nova tentativa com outra
+            self._smtp = self._connect()
+            self._smtp.send_message(msg)
+        except Exception:
+            # erro a meio de uma transação: não reutilizar esta ligação
+            self.close()
+            raise
+        self._last_used = time.monotonic()
+
+    # close
+    def close(self):
+        smtp, self._smtp = self._smtp, None
+        if smtp is None:
+            return
+        try:
+            smtp.quit()
+        except Exception:
+            smtp.close()
+
+
+# EmailQueue
+class EmailQueue:
+    """Fila de emails com ``workers`` tarefas, cada uma com o seu SMTPSender.
+
+    ``enqueue`` pode ser chamado do event loop ou de uma thread (endpoints
+    síncronos). Um email que falha volta à fila após ``backoff * 2**tentativa``
+    segundos (no máximo ``max_backoff``) e desiste-se dele ao fim de
+    ``max_attempts`` tentativas.
+    """
+
+    # __init__
+    def __init__(
+        self,
+        sender_factory,
+        from_address: str | None,
+        workers: int = 1,
+        max_attempts: int = 5,
+        backoff: float = 1.0,
+        max_backoff: float = 60.0,
+    ):
+        self.sender_factory = sender_factory
+        self.from_address = from_address
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._queue: asyncio.Queue | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._senders: list = []
+        self._retry_handles: set[asyncio.TimerHandle] = set()
+
+    # pending
+    def pending(self) -> int:
+        queued = self._queue.qsize() if self._queue else 0
+        return queued + len(self._retry_handles)
+
+    # metrics
+    def metrics(self) -> dict:
+        return {"pending": self.pending(), "sent": self.sent, "failed": self.failed, "retries": self.retries}
+
+    # start
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._senders = [self.sender_factory() for _ in range(self.workers)]
+        self._tasks = [asyncio.create_task(self._worker(sender)) for sender in self._senders]
+
+    # stop
+    async def stop(self, timeout: float = 10.0):
+        """Espera (até ``timeout`` s) que a fila esvazie e fecha as ligações."""
+        if self._loop is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print("❌ Emails por enviar ao encerrar:", self.pending())
+        for handle in self._retry_handles:
+            handle.cancel()
+        self._retry_handles.clear()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for sender in self._senders:
+            await asyncio.to_thread(sender.close)
+        self._loop = None
+        self._tasks = []
+
+    # enqueue
+    def enqueue(self, to: str, subject: str, body: str):
+        email = OutgoingEmail(to, subject, body)
+        loop = self._loop
+        if loop is None:
+            # sem fila a correr (por exemplo num script): envia já
+            self._deliver_now(email)
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._queue.put_nowait(email)
+        else:
+            loop.call_soon_threadsafe(self._queue.put_nowait, email)
+
+    # _deliver_now
+    def _deliver_now(self, email: OutgoingEmail):
+        sender = self.sender_factory()
+        try:
+            sender.send(build_message(self.from_address, email))
+            self.sent += 1
+        except Exception as e:
+            self.failed += 1
+            print("❌ Erro ao enviar email:", str(e))
+        finally:
+            sender.close()
+
+    # _worker
+    async def _worker(self, sender):
+        while True:
+            email = await self._queue.get()
+            email.attempts += 1
+            try:
+                await asyncio.to_thread(sender.send, build_message(self.from_address, email))
+            except Exception as e:
+                if email.attempts < self.max_attempts:
+                    # o task_done só é feito quando voltar à fila, para o
+                    # stop() também esperar pelos emails em espera
+                    self._retry_later(email)
+                    continue
+                self.failed += 1
+                print(f"❌ Erro ao enviar email para {email.to} ({email.attempts} tentativas):", str(e))
+            else:
+                self.sent += 1
+                print("✅ Email enviado com sucesso para", email.to)
+            self._queue.task_done()
+
+    # _retry_later
+    def _retry_later(self, email: OutgoingEmail):
+        self.retries += 1
+        delay = min(self.backoff * 2 ** (email.attempts - 1), self.max_backoff)
+        handle = None
+
+        # requeue
+        def requeue():
+            self._retry_handles.discard(handle)
+            self._queue.put_nowait(email)
+            self._queue.task_done()
+
+        handle = self._loop.call_later(delay, requeue)
+        self._retry_handles.add(handle)
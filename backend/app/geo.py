@@ -0,0 +1,100 @@
+# geo.py - funções de geometria para coordenadas GPS
+from math import radians, degrees, sin, cos, sqrt, atan2
+
+EARTH_RADIUS_M = 6371000
+
+
+# haversine
+def haversine(lat1, lon1, lat2, lon2):
+    R = EARTH_RADIUS_M
+    phi1 = radians(lat1)
+    phi2 = radians(lat2)
+    dphi = radians(lat2 - lat1)
+    dlambda = radians(lon2 - lon1)
+    a = sin(dphi / 2) ** 2 + cos(phi1) * cos(phi2) * sin(dlambda / 2) ** 2
+    c = 2 * atan2(sqrt(a), sqrt(1 - a))
+    return R * c
+
+
+# bounding_box
+def bounding_box(lat: float, lng: float, radius_m: float) -> tuple[float, float, float, float]:
+    """Caixa ``(sul, oeste, norte, este)`` que contém o círculo de raio ``radius_m``.
+
+    Se passar o antimeridiano, ``oeste`` fica maior do que ``este``.
+    """
+    dlat = degrees(radius_m / EARTH_RADIUS_M)
+    south, north = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+    if south <= -90.0 or north >= 90.0:
+        return south, -180.0, north, 180.0
+    dlng = degrees(radius_m / (EARTH_RADIUS_M * cos(radians(lat))))
+    if dlng >= 180.0:
+        return south, -180.0, north, 180.0
+    west, east = lng - dlng, lng + dlng
+    if west < -180.0:
+        west += 360.0
+    if east > 180.0:
+        east -= 360.0
+    return south, west, north, east
+
+
+# --------------------------
+# Geohash
+# --------------------------
+GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+# geohash_encode
+def geohash_encode(lat: float, lng: float, precision: int = 5) -> str:
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bit, ch, even = 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            ch = (ch << 1) | 1
+            rng[0] = mid
+        else:
+            ch <<= 1
+            rng[1] = mid
+        even = not even
+        bit += 1
+        if bit == 5:
+            chars.append(GEOHASH_BASE32[ch])
+            bit, ch = 0, 0
+    return "".join(chars)
+
+
+# geohash_cell_size
+def geohash_cell_size(precision: int) -> tuple[float, float]:
+    """Altura e largura (em graus) de uma célula geohash com ``precision`` carateres."""
+    bits = 5 * precision
+    lng_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+    return 180.0 / 2**lat_bits, 360.0 / 2**lng_bits
+
+
+# geohash_cover
+def geohash_cover(south: float, west: float, north: float, east: float, precision: int) -> set[str]:
+    """Células geohash que cobrem a caixa ``[south, west, north, east]``."""
+    height, width = geohash_cell_size(precision)
+    lng_ranges = [(west, east)] if west <= east else [(west, 180.0), (-180.0, east)]
+    cells = set()
+    first_row = int((max(south, -90.0) + 90.0) // height)
+    last_row = int((min(north, 90.0 - 1e-9) + 90.0) // height)
+    for lo, hi in lng_ranges:
+        first_col = int((max(lo, -180.0) + 180.0) // width)
+        last_col = int((min(hi, 180.0 - 1e-9) + 180.0) // width)
+        for row in range(first_row, last_row + 1):
+            lat = -90.0 + (row + 0.5) * height
+            for col in range(first_col, last_col + 1):
+                cells.add(geohash_encode(lat, -180.0 + (col + 0.5) * width, precision))
+    return cells
+
+
+# cover_cell_count
+def cover_cell_count(south: float, west: float, north: float, east: float, precision: int) -> int:
+    height, width = geohash_cell_size(precision)
+    span_lng = east - west if west <= east else 360.0 - (west - east)
+    return (int((north - south) // height) + 2) * (int(span_lng // width) + 2)
@@ -0,0 +1,195 @@
+# geometry.py - cálculos sobre muitos pontos de uma vez (NumPy)
+#
+# As funções de geo.py tratam um par de pontos de cada vez; aqui os trajetos e
+# os candidatos das pesquisas por raio são processados como arrays.
+from math import hypot
+
+import numpy as np
+
+from .geo import EARTH_RADIUS_M
+
+
+# haversine_np
+def haversine_np(lat1, lng1, lat2, lng2) -> np.ndarray:
+    """Distância em metros entre pontos (aceita arrays ou escalares)."""
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = np.radians(np.asarray(lng2) - np.asarray(lng1))
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+# point_arrays
+def point_arrays(points: list[dict], with_time: bool = False):
+    """Converte pontos ``{"lat", "lng", "t"}`` em arrays de latitude e longitude
+    e, com ``with_time``, instantes em segundos (``None`` se faltar algum ``t``)."""
+    lat = np.fromiter((p["lat"] for p in points), dtype=float, count=len(points))
+    lng = np.fromiter((p["lng"] for p in points), dtype=float, count=len(points))
+    if not with_time:
+        return lat, lng
+    times = [p.get("t") for p in points]
+    if not times or not all(times):
+        return lat, lng, None
+    # o NumPy interpreta as datas ISO em C, muito mais depressa do que fromisoformat
+    iso = [t if isinstance(t, str) else t.isoformat() for t in times]
+    t = np.array(iso, dtype="datetime64[us]").astype(np.int64) / 1e6
+    return lat, lng, t
+
+
+# segment_distances
+def segment_distances(lat: np.ndarray, lng: np.ndarray) -> np.ndarray:
+    """Distância de cada segmento consecutivo do trajeto."""
+    if len(lat) < 2:
+        return np.zeros(0)
+    return haversine_np(lat[:-1], lng[:-1], lat[1:], lng[1:])
+
+
+# path_length
+def path_length(points: list[dict]) -> float:
+    """Distância total, em metros, de uma lista de pontos ``{"lat", "lng"}``."""
+    lat, lng = point_arrays(points)
+    return float(segment_distances(lat, lng).sum())
+
+
+# route_stats
+def route_stats(points: list[dict]) -> dict:
+    """Distância, duração, velocidades e caixa de um trajeto num só cálculo."""
+    lat, lng, t = point_arrays(points, with_time=True)
+    segments = segment_distances(lat, lng)
+    stats = {
+        "distance_m": float(segments.sum()),
+        "duration_s": 0.0,
+        "avg_speed_mps": None,
+        "max_speed_mps": None,
+        "bbox": None,
+    }
+    if len(lat):
+        stats["bbox"] = [float(lat.min()), float(lng.min()), float(lat.max()), float(lng.max())]
+    if t is not None and len(t) > 1:
+        stats["duration_s"] = float(t[-1] - t[0])
+        if stats["duration_s"] > 0:
+            stats["avg_speed_mps"] = stats["distance_m"] / stats["duration_s"]
+        dt = np.diff(t)
+        moving = dt > 0
+        if moving.any():
+            stats["max_speed_mps"] = float((segments[moving] / dt[moving]).max())
+    return stats
+
+
+# within_radius
+def within_radius(
+    lat: float, lng: float, ids: list[int], lats, lngs, radius_m: float
+) -> list[tuple[int, float]]:
+    """Candidatos a menos de ``radius_m`` metros de ``(lat, lng)`` como
+    ``(id, distância)``, do mais próximo para o mais afastado."""
+    if not ids:
+        return []
+    distances = haversine_np(lat, lng, np.asarray(lats, dtype=float), np.asarray(lngs, dtype=float))
+    inside = np.flatnonzero(distances <= radius_m)
+    inside = inside[np.argsort(distances[inside], kind="stable")]
+    return [(ids[i], float(distances[i])) for i in inside]
+
+
+# Importância dada ao primeiro e último ponto: ficam sempre
+ENDPOINT_IMPORTANCE = 1e9
+
+
+# Abaixo deste número de pontos o segmento é tratado em Python puro (mais
+# rápido do que o custo fixo de cada operação NumPy)
+SMALL_SEGMENT = 32
+
+
+# _farthest
+def _farthest(x: np.ndarray, y: np.ndarray, first: int, last: int) -> tuple[int, float]:
+    """Ponto entre ``first`` e ``last`` mais afastado do segmento que os une."""
+    px, py = x[first + 1:last], y[first + 1:last]
+    dx, dy = x[last] - x[first], y[last] - y[first]
+    length2 = dx * dx + dy * dy
+    if length2 == 0:
+        dist = np.hypot(px - x[first], py - y[first])
+    else:
+        # distância ao segmento (não à reta), para trajetos que voltam ao início
+        u = np.clip(((px - x[first]) * dx + (py - y[first]) * dy) / length2, 0.0, 1.0)
+        dist = np.hypot(px - (x[first] + u * dx), py - (y[first] + u * dy))
+    split = int(dist.argmax())
+    return split + first + 1, float(dist[split])
+
+
+# _farthest_small
+def _farthest_small(x: list[float], y: list[float], first: int, last: int) -> tuple[int, float]:
+    x0, y0 = x[first], y[first]
+    dx, dy = x[last] - x0, y[last] - y0
+    length2 = dx * dx + dy * dy
+    best, best_dist = first + 1, -1.0
+    for i in range(first + 1, last):
+        px, py = x[i] - x0, y[i] - y0
+        u = 0.0 if length2 == 0 else min(max((px * dx + py * dy) / length2, 0.0), 1.0)
+        dist = hypot(px - u * dx, py - u * dy)
+        if dist > best_dist:
+            best, best_dist = i, dist
+    return best, best_dist
+
+
+# simplification_importance
+def simplification_importance(lat: np.ndarray, lng: np.ndarray) -> np.ndarray:
+    """Importância de cada ponto segundo Douglas-Peucker.
+
+    Um ponto fica no trajeto simplificado com tolerância ``tol`` (metros) se e
+    só se a sua importância for maior do que ``tol``; ordenar pela importância
+    dá os ``N`` pontos mais relevantes. Calcula-se uma vez (ao fechar o
+    trajeto) e serve depois para qualquer tolerância.
+    """
+    count = len(lat)
+    importance = np.zeros(count)
+    if count == 0:
+        return importance
+    importance[0] = importance[-1] = ENDPOINT_IMPORTANCE
+    if count < 3:
+        return importance
+    # projeção local em metros (suficiente para a escala de um trajeto)
+    lat0 = np.radians(lat.mean())
+    x = np.radians(lng) * EARTH_RADIUS_M * np.cos(lat0)
+    y = np.radians(lat) * EARTH_RADIUS_M
+    xs, ys = x.tolist(), y.tolist()
+
+    stack = [(0, count - 1, ENDPOINT_IMPORTANCE)]
+    while stack:
+        first, last, ceiling = stack.pop()
+        if last - first < 2:
+            continue
+        if last - first < SMALL_SEGMENT:
+            split, value = _farthest_small(xs, ys, first, last)
+        else:
+            split, value = _farthest(x, y, first, last)
+        # um ponto nunca é mais importante do que o que dividiu o seu segmento
+        value = min(value, ceiling)
+        importance[split] = value
+        stack.append((first, split, value))
+        stack.append((split, last, value))
+    return importance
+
+
+# simplify_points
+def simplify_points(
+    points: list[dict],
+    tolerance_m: float | None = None,
+    max_points: int | None = None,
+    importance=None,
+) -> list[dict]:
+    """Trajeto simplificado (Douglas-Peucker) com tolerância em metros e/ou
+    número máximo de pontos. ``importance`` evita recalcular a importância."""
+    if not points or (tolerance_m is None and max_points is None):
+        return points
+    if importance is None:
+        lat, lng = point_arrays(points)
+        importance = simplification_importance(lat, lng)
+    importance = np.asarray(importance, dtype=float)
+    keep = np.ones(len(points), dtype=bool)
+    if tolerance_m is not None:
+        keep &= importance > tolerance_m
+    if max_points is not None and keep.sum() > max_points:
+        candidates = np.flatnonzero(keep)
+        ranked = candidates[np.argsort(-importance[candidates], kind="stable")[:max_points]]
+        keep[:] = False
+        keep[ranked] = True
+    return [points[i] for i in np.flatnonzero(keep)]
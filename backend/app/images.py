@@ -0,0 +1,137 @@
+# images.py - miniaturas e versões comprimidas das fotos de perfil
+#
+# A foto original (muitas vezes vários MB, tirada com o telemóvel) continua
+# guardada, mas o mapa e as listas usam versões pequenas em WebP e JPEG,
+# geradas em segundo plano depois do upload.
+import json
+import os
+import tempfile
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+from sqlalchemy import update
+
+from .uploads import FILE_MODE
+
+# Lado (px) de cada versão; até THUMBNAIL_MAX são quadradas (pins e avatares),
+# acima disso mantêm a proporção da foto
+VARIANT_SIZES = (64, 256, 1024)
+THUMBNAIL_MAX = 256
+
+# formato -> (formato Pillow, extensão, opções de gravação)
+VARIANT_FORMATS = {
+    "webp": ("WEBP", ".webp", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", ".jpg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+
+# variant_path
+def variant_path(path: str, size: int, fmt: str) -> str:
+    """``profile_photos/abc.png`` -> ``profile_photos/abc_64.webp``."""
+    return f"{os.path.splitext(path)[0]}_{size}{VARIANT_FORMATS[fmt][1]}"
+
+
+# variant_urls
+def variant_urls(path: str) -> dict[str, dict[str, str]]:
+    return {str(size): {fmt: variant_path(path, size, fmt) for fmt in VARIANT_FORMATS} for size in VARIANT_SIZES}
+
+
+# _resize
+def _resize(image: Image.Image, size: int) -> Image.Image:
+    if size <= THUMBNAIL_MAX:
+        # quadrado ao centro, sem aumentar fotos mais pequenas
+        side = min(size, *image.size)
+        return ImageOps.fit(image, (side, side), Image.Resampling.LANCZOS)
+    copy = image.copy()
+    copy.thumbnail((size, size), Image.Resampling.LANCZOS)
+    return copy
+
+
+# _save_atomic
+def _save_atomic(image: Image.Image, target: str, fmt: str):
+    pil_format, _, options = VARIANT_FORMATS[fmt]
+    if pil_format == "JPEG" and image.mode != "RGB":
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A") if "A" in image.getbands() else None)
+        image = background
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target) or ".", prefix=".variant-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            image.save(f, pil_format, **options)
+            # o mkstemp cria o ficheiro com 0600
+            os.fchmod(f.fileno(), FILE_MODE)
+        os.replace(tmp, target)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+# generate_variants
+def generate_variants(path: str, root: str = ".") -> dict[str, dict[str, str]] | None:
+    """Cria ao lado de ``path`` as versões de VARIANT_SIZES em cada formato e
+    devolve os caminhos (ver variant_urls); ``None`` se não for uma imagem."""
+    urls = variant_urls(path)
+    if all(os.path.exists(os.path.join(root, p)) for formats in urls.values() for p in formats.values()):
+        # nomes por hash (uploads.py): a mesma foto já foi processada
+        return urls
+    source = os.path.join(root, path)
+    try:
+        with Image.open(source) as image:
+            # nos JPEG o descodificador já reduz a imagem (muito mais rápido)
+            image.draft("RGB", (max(VARIANT_SIZES), max(VARIANT_SIZES)))
+            image = ImageOps.exif_transpose(image)
+            image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+    except (UnidentifiedImageError, OSError):
+        return None
+    for size in VARIANT_SIZES:
+        resized = _resize(image, size)
+        for fmt in VARIANT_FORMATS:
+            _save_atomic(resized, os.path.join(root, variant_path(path, size, fmt)), fmt)
+    return urls
+
+
+# ImagePipeline
+class ImagePipeline:
+    """Gera as versões das fotos em ``workers`` threads (o Pillow liberta o GIL
+    ao redimensionar e comprimir) e guarda-as na linha do vendedor/cliente."""
+
+    # __init__
+    def __init__(self, session_factory, root: str = ".", workers: int = 2):
+        self.session_factory = session_factory
+        self.root = root
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="images")
+        self.completed = 0
+        self.failed = 0
+
+    # submit
+    def submit(self, model, owner_id: int, path: str) -> Future:
+        """Processa a foto ``path`` de ``model`` (Vendor ou Client) ``owner_id``."""
+        return self._executor.submit(self._process, model, owner_id, path)
+
+    # _process
+    def _process(self, model, owner_id: int, path: str):
+        try:
+            variants = generate_variants(path, self.root)
+            if variants is None:
+                return None
+            db = self.session_factory()
+            try:
+                # só se a foto não tiver entretanto mudado
+                db.execute(
+                    update(model)
+                    .where(model.id == owner_id, model.profile_photo == path)
+                    .values(photo_variants=json.dumps(variants))
+                )
+                db.commit()
+            finally:
+                db.close()
+            self.completed += 1
+            return variants
+        except Exception as e:
+            self.failed += 1
+            print("❌ Erro ao gerar versões da foto:", path, str(e))
+            raise
+
+    # shutdown
+    def shutdown(self, wait: bool = False):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,249 @@
+# live.py - estado em memória das localizações dos vendedores
+#
+# As atualizações de localização (1 por segundo por vendedor) ficam em memória
+# e são gravadas na base de dados em lote pelo flusher, em vez de cada pedido
+# fazer os seus próprios commits.
+import asyncio
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+
+from sqlalchemy import insert, update
+
+from . import models
+from .geo import haversine
+from .spatial import GeoIndex
+
+
+# LivePosition
+@dataclass
+class LivePosition:
+    """Última posição conhecida de um vendedor com trajeto ativo."""
+
+    vendor_id: int
+    route_id: int
+    lat: float | None = None
+    lng: float | None = None
+    t: datetime | None = None
+
+
+# RouteProgress
+@dataclass
+class RouteProgress:
+    """Distância acumulada desde o último flush e último ponto de um trajeto."""
+
+    distance_m: float
+    last_lat: float
+    last_lng: float
+    last_point_at: datetime
+
+
+# LiveLocationStore
+class LiveLocationStore:
+    # __init__
+    def __init__(self, session_factory):
+        self.session_factory = session_factory
+        self.positions: dict[int, LivePosition] = {}
+        # posições conhecidas indexadas para pesquisas por raio
+        self.index = GeoIndex()
+        # passa a True depois de carregar os trajetos abertos
+        self.seeded = False
+        self._pending_points: list[dict] = []
+        self._pending_routes: dict[int, RouteProgress] = {}
+        # vendor_id -> (route_id, lat, lng)
+        self._pending_vendors: dict[int, tuple[int, float, float]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake: asyncio.Event | None = None
+        # pontos descartados por o trajeto já ter sido fechado
+        self.discarded = 0
+
+    # get
+    def get(self, vendor_id: int) -> LivePosition | None:
+        return self.positions.get(vendor_id)
+
+    # activate
+    def activate(self, vendor_id: int, route_id: int, lat=None, lng=None, t=None) -> LivePosition:
+        """Regista o trajeto ativo de um vendedor (e o último ponto, se houver)."""
+        position = LivePosition(vendor_id=vendor_id, route_id=route_id, lat=lat, lng=lng, t=t)
+        with self._lock:
+            self.positions[vendor_id] = position
+            if lat is not None and lng is not None:
+                self.index.update(vendor_id, lat, lng)
+            else:
+                self.index.remove(vendor_id)
+        return position
+
+    # deactivate
+    def deactivate(self, vendor_id: int):
+        """Remove o vendedor do mapa; os pontos pendentes continuam a ser gravados."""
+        with self._lock:
+            self.positions.pop(vendor_id, None)
+            self._pending_vendors.pop(vendor_id, None)
+            self.index.remove(vendor_id)
+
+    # update
+    def update(self, vendor_id: int, lat: float, lng: float, t: datetime) -> LivePosition:
+        """Atualiza a posição em memória e acumula o ponto para o próximo flush."""
+        with self._lock:
+            position = self.positions[vendor_id]
+            step = 0.0
+            if position.lat is not None and position.lng is not None:
+                step = haversine(position.lat, position.lng, lat, lng)
+            position.lat, position.lng, position.t = lat, lng, t
+            self.index.update(vendor_id, lat, lng)
+
+            progress = self._pending_routes.get(position.route_id)
+            if progress:
+                progress.distance_m += step
+                progress.last_lat, progress.last_lng, progress.last_point_at = lat, lng, t
+            else:
+                self._pending_routes[position.route_id] = RouteProgress(step, lat, lng, t)
+            self._pending_points.append({"route_id": position.route_id, "lat": lat, "lng": lng, "t": t})
+            self._pending_vendors[vendor_id] = (position.route_id, lat, lng)
+            return position
+
+    # observe
+    def observe(self, vendor_id: int, route_id: int, lat: float, lng: float, t: datetime) -> LivePosition:
+        """Regista um ponto recebido de outro worker: só muda a posição, nada fica
+        por gravar (esse worker grava-o)."""
+        with self._lock:
+            position = self.positions.get(vendor_id)
+            if position is None or position.route_id != route_id:
+                position = LivePosition(vendor_id=vendor_id, route_id=route_id)
+                self.positions[vendor_id] = position
+            position.lat, position.lng, position.t = lat, lng, t
+            self.index.update(vendor_id, lat, lng)
+            return position
+
+    # nearby
+    def nearby(self, lat: float, lng: float, radius_m: float) -> list[tuple[int, float]]:
+        """Vendedores ativos a menos de ``radius_m`` metros (ver GeoIndex.nearby)."""
+        with self._lock:
+            return self.index.nearby(lat, lng, radius_m)
+
+    # in_area
+    def in_area(self, area) -> list[int]:
+        """Vendedores ativos cuja posição está dentro de ``area`` (realtime.Area)."""
+        with self._lock:
+            positions = list(self.positions.values())
+        return [p.vendor_id for p in positions if p.lat is not None and area.contains(p.lat, p.lng)]
+
+    # seed
+    def seed(self):
+        """Carrega para memória os trajetos abertos (por exemplo após reiniciar)."""
+        db = self.session_factory()
+        try:
+            routes = (
+                db.query(models.Route)
+                .filter(models.Route.end_time == None)
+                .order_by(models.Route.start_time)
+                .all()
+            )
+            for r in routes:
+                self.activate(r.vendor_id, r.id, r.last_lat, r.last_lng, r.last_point_at)
+            self.seeded = True
+        finally:
+            db.close()
+
+    # pending_count
+    def pending_count(self) -> int:
+        return len(self._pending_points)
+
+    # has_pending
+    def has_pending(self, vendor_id: int) -> bool:
+        """Se o trajeto ativo do vendedor tem pontos por gravar neste worker."""
+        with self._lock:
+            position = self.positions.get(vendor_id)
+            return position is not None and position.route_id in self._pending_routes
+
+    # flush
+    def flush(self) -> int:
+        """Grava numa única transação os pontos, distâncias e posições pendentes.
+
+        Com vários workers o trajeto pode ter sido fechado noutro entretanto: os
+        pontos de trajetos já fechados são descartados, para não mudarem a
+        distância, a importância dos pontos e as estatísticas já calculadas.
+        """
+        with self._flush_lock:
+            with self._lock:
+                points, self._pending_points = self._pending_points, []
+                routes, self._pending_routes = self._pending_routes, {}
+                vendors, self._pending_vendors = self._pending_vendors, {}
+            if not points and not vendors:
+                return 0
+
+            db = self.session_factory()
+            try:
+                # primeiro os trajetos: o UPDATE bloqueia a linha, por isso ou
+                # corre antes de stop_route a trancar (e os pontos entram no
+                # fecho) ou depois, e aí já vê end_time preenchido
+                open_routes = set()
+                for route_id, progress in routes.items():
+                    result = db.execute(
+                        update(models.Route)
+                        .where(models.Route.id == route_id, models.Route.end_time == None)
+                        .values(
+                            distance_m=models.Route.distance_m + progress.distance_m,
+                            last_lat=progress.last_lat,
+                            last_lng=progress.last_lng,
+                            last_point_at=progress.last_point_at,
+                        )
+                    )
+                    if result.rowcount:
+                        open_routes.add(route_id)
+                kept = [p for p in points if p["route_id"] in open_routes]
+                if kept:
+                    db.execute(insert(models.RoutePoint), kept)
+                positions = [
+                    {"id": vid, "current_lat": lat, "current_lng": lng}
+                    for vid, (route_id, lat, lng) in vendors.items()
+                    if route_id in open_routes
+                ]
+                if positions:
+                    db.execute(update(models.Vendor), positions)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                print("❌ Erro ao gravar localizações:", str(e))
+                self._requeue(points, routes, vendors)
+                return 0
+            finally:
+                db.close()
+            self.discarded += len(points) - len(kept)
+            return len(kept)
+
+    # _requeue
+    def _requeue(self, points, routes, vendors):
+        with self._lock:
+            self._pending_points[:0] = points
+            for route_id, progress in routes.items():
+                newer = self._pending_routes.get(route_id)
+                if newer:
+                    newer.distance_m += progress.distance_m
+                else:
+                    self._pending_routes[route_id] = progress
+            for vendor_id, position in vendors.items():
+                if vendor_id in self.positions:
+                    self._pending_vendors.setdefault(vendor_id, position)
+
+    # request_flush
+    def request_flush(self):
+        """Antecipa o próximo flush (chamado no event loop)."""
+        if self._wake is not None:
+            self._wake.set()
+
+    # run_flusher
+    async def run_flusher(self, interval: float):
+        self._wake = asyncio.Event()
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+                await asyncio.to_thread(self.flush)
+        except asyncio.CancelledError:
+            await asyncio.to_thread(self.flush)
+            raise
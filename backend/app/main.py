@@ -1,41 +1,112 @@
 # main.py - aplicação FastAPI com rotas principais e PATCH otimizado
 
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Form, Body, WebSocket, WebSocketDisconnect, Request
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Form, Body, Query, Response, WebSocket, WebSocketDisconnect, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.orm import Session, defer
 from passlib.context import CryptContext
-from . import models, schemas
+from . import models, schemas, migrations
+from .live import LiveLocationStore
+from .realtime import Area, ConnectionManager
+from .pubsub import create_pubsub
+from .auth_cache import Principal, PrincipalCache
+from .stats import add_route_to_daily_stats
+from .emails import EmailQueue, SMTPSender
+from .images import ImagePipeline
+from .media import MediaFiles
+from .passwords import PasswordHasher
+from .uploads import FORM_OVERHEAD_BYTES, UploadSizeLimit, save_upload
+from .stories import run_story_sweeper
+from .subscriptions import run_subscription_sweeper, subscription_is_valid
+from .geo import bounding_box
+from .geometry import path_length, point_arrays, route_stats, simplification_importance, simplify_points, within_radius
 import stripe
-from datetime import datetime, timedelta
-from app.database import SessionLocal, engine, get_db
+from datetime import date, datetime, timedelta
+from .database import SessionLocal, engine, get_db
 import os
-import shutil
-from uuid import uuid4
 from secrets import token_urlsafe
-from email.message import EmailMessage
-from email import policy
-import smtplib
 import time
 import json
 import asyncio
 import base64
+from contextlib import asynccontextmanager
+from typing import Literal
 import hmac
 import hashlib
-from math import radians, sin, cos, sqrt, atan2
 from fastapi.responses import HTMLResponse
 
 # Diretório para guardar fotos de perfil
 PROFILE_PHOTO_DIR = "profile_photos"
 os.makedirs(PROFILE_PHOTO_DIR, exist_ok=True)
 
-# Diretório para stories dos vendedores
-STORY_DIR = "stories"
+# Diretório para stories dos vendedores (o sweeper apaga aqui os ficheiros
+# sem story na base de dados: deve ser só desta instalação)
+STORY_DIR = os.getenv("STORY_DIR", "stories")
 os.makedirs(STORY_DIR, exist_ok=True)
 
+# Tamanho máximo (bytes) de cada upload
+PROFILE_PHOTO_MAX_BYTES = int(os.getenv("PROFILE_PHOTO_MAX_BYTES", str(10 * 1024 * 1024)))
+STORY_MAX_BYTES = int(os.getenv("STORY_MAX_BYTES", str(50 * 1024 * 1024)))
+
+
+# upload_body_limit
+def upload_body_limit(scope) -> int | None:
+    """Tamanho máximo do corpo dos pedidos com upload (ver UploadSizeLimit)."""
+    if scope["method"] not in ("POST", "PATCH"):
+        return None
+    path = scope["path"]
+    if path.startswith("/vendors/") and path.endswith("/stories"):
+        return STORY_MAX_BYTES + FORM_OVERHEAD_BYTES
+    if path in ("/vendors/", "/clients/") or (path.startswith("/vendors/") and path.endswith("/profile")):
+        return PROFILE_PHOTO_MAX_BYTES + FORM_OVERHEAD_BYTES
+    return None
+
+# Threads que geram as versões das fotos de perfil (ver images.py)
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+
+# Intervalo (segundos) entre gravações em lote das localizações
+LIVE_FLUSH_INTERVAL = float(os.getenv("LIVE_FLUSH_INTERVAL", "5"))
+
+# Intervalo (segundos) entre verificações das subscrições expiradas (0 desliga)
+SUBSCRIPTION_SWEEP_INTERVAL = float(os.getenv("SUBSCRIPTION_SWEEP_INTERVAL", "60"))
+
+# Intervalo (segundos) entre remoções das stories expiradas (ver stories.py; 0 desliga)
+STORY_SWEEP_INTERVAL = float(os.getenv("STORY_SWEEP_INTERVAL", "300"))
+
+# Máximo de vendedores num pedido de stories em lote
+MAX_STORY_VENDORS = 200
+
+
+# lifespan
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    live_store.seed()
+    manager.load_positions((p.vendor_id, p.lat, p.lng) for p in live_store.positions.values())
+    tasks = [asyncio.create_task(live_store.run_flusher(LIVE_FLUSH_INTERVAL))]
+    if SUBSCRIPTION_SWEEP_INTERVAL > 0:
+        tasks.append(asyncio.create_task(
+            run_subscription_sweeper(SessionLocal, SUBSCRIPTION_SWEEP_INTERVAL, invalidate_vendors)
+        ))
+    if STORY_SWEEP_INTERVAL > 0:
+        tasks.append(asyncio.create_task(run_story_sweeper(SessionLocal, STORY_SWEEP_INTERVAL, STORY_DIR)))
+    await pubsub.start(apply_remote_event)
+    await email_queue.start()
+    yield
+    await email_queue.stop()
+    await pubsub.stop()
+    for task in reversed(tasks):
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    password_hasher.shutdown()
+    image_pipeline.shutdown()
+
+
 # Inicializar app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Endpoint raiz simples para verificação de funcionamento
 @app.get("/")
@@ -43,6 +114,9 @@ app = FastAPI()
 def read_root():
     return {"status": "ok"}
 
+# Limitar o tamanho dos uploads antes de o formulário ser lido
+app.add_middleware(UploadSizeLimit, limit_for=upload_body_limit)
+
 # Habilitar CORS (permitir acesso do frontend)
 origins = ["*"]  # Em produção, usar domínios específicos
 app.add_middleware(
@@ -51,17 +125,29 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 # Montar rota para servir fotos publicamente
-app.mount("/profile_photos", StaticFiles(directory=PROFILE_PHOTO_DIR), name="profile_photos")
-app.mount("/stories", StaticFiles(directory=STORY_DIR), name="stories")
+app.mount("/profile_photos", MediaFiles(directory=PROFILE_PHOTO_DIR), name="profile_photos")
+app.mount("/stories", MediaFiles(directory=STORY_DIR), name="stories")
 
-# Criar as tabelas na base de dados
+# Criar as tabelas na base de dados (e colunas novas em tabelas antigas)
 models.Base.metadata.create_all(bind=engine)
+migrations.add_missing_columns(engine)
+migrations.add_missing_indexes(engine)
+
+# Localizações em memória, gravadas em lote pelo flusher
+live_store = LiveLocationStore(SessionLocal)
+
+# Miniaturas e versões comprimidas das fotos, geradas em segundo plano
+image_pipeline = ImagePipeline(SessionLocal, workers=IMAGE_WORKERS)
 
 # Contexto para hash de password
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Threads dedicadas ao bcrypt (ver passwords.py)
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+password_hasher = PasswordHasher(pwd_context, workers=PASSWORD_HASH_WORKERS)
 
 # Configuração do Stripe
 stripe.api_key = os.getenv("STRIPE_API_KEY", "")
@@ -80,17 +166,6 @@ def validate_password(password: str):
         )
 
 
-# haversine
-def haversine(lat1, lon1, lat2, lon2):
-    R = 6371000
-    phi1 = radians(lat1)
-    phi2 = radians(lat2)
-    dphi = radians(lat2 - lat1)
-    dlambda = radians(lon2 - lon1)
-    a = sin(dphi / 2) ** 2 + cos(phi1) * cos(phi2) * sin(dlambda / 2) ** 2
-    c = 2 * atan2(sqrt(a), sqrt(1 - a))
-    return R * c
-
 # Configuração de e-mail (Gmail por padrão)
 SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
 SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
@@ -98,54 +173,38 @@ SMTP_USER = os.getenv("SMTP_USER")
 SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
 
 
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") != "0"
+# Workers da fila de emails (cada um com a sua ligação SMTP)
+EMAIL_WORKERS = int(os.getenv("EMAIL_WORKERS", "1"))
+
+
+# smtp_sender
+def smtp_sender() -> SMTPSender:
+    return SMTPSender(SMTP_SERVER, SMTP_PORT, SMTP_USER, SMTP_PASSWORD, starttls=SMTP_STARTTLS)
+
+
+email_queue = EmailQueue(smtp_sender, SMTP_USER, workers=EMAIL_WORKERS)
+
+
 # send_email
 def send_email(to: str, subject: str, body: str):
+    """Põe o email na fila (ver emails.py); quem chama não espera pelo envio."""
     if not SMTP_USER or not SMTP_PASSWORD:
         print("❌ Credenciais de email não definidas")
         return
 
-    msg = EmailMessage(policy=policy.SMTP.clone(max_line_length=1000))
-    msg["From"] = SMTP_USER
-    msg["To"] = to
-    msg["Subject"] = subject
-    msg.set_content(body)
+    print(f"📤 Enviando email para: {to}")
+    email_queue.enqueue(to, subject, body)
 
-    try:
-        print(f"📤 Enviando email para: {to}")
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(SMTP_USER, SMTP_PASSWORD)
-            server.send_message(msg)
-        print("✅ Email enviado com sucesso para", to)
-    except Exception as e:
-        print("❌ Erro ao enviar email:", str(e))
-
-
-# Gerenciador de WebSockets
-class ConnectionManager:
-    # __init__
-    def __init__(self):
-        self.active_connections: list[WebSocket] = []
-
-    # connect
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-
-    # disconnect
-    def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-
-    # broadcast
-    async def broadcast(self, message: dict):
-        for connection in list(self.active_connections):
-            try:
-                await connection.send_json(message)
-            except Exception:
-                self.disconnect(connection)
 
-manager = ConnectionManager()
+# Gerenciador de WebSockets (fila por ligação, ver realtime.py)
+WS_MAX_PENDING = int(os.getenv("WS_MAX_PENDING", "500"))
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+manager = ConnectionManager(max_pending=WS_MAX_PENDING, send_timeout=WS_SEND_TIMEOUT)
+
+# Eventos partilhados com os outros workers (ver pubsub.py)
+PUBSUB_URL = os.getenv("PUBSUB_URL", "")
+pubsub = create_pubsub(PUBSUB_URL)
 
 # --------------------------
 # Autenticação JWT simples
@@ -153,6 +212,11 @@ manager = ConnectionManager()
 SECRET_KEY = os.getenv("SECRET_KEY", "secret")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Cache dos utilizadores autenticados (ver auth_cache.py)
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "30"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+principal_cache = PrincipalCache(maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL)
+
 # _b64
 def _b64(data: dict | bytes) -> str:
     if isinstance(data, dict):
@@ -212,6 +276,50 @@ def get_current_client(token: str = Depends(oauth2_scheme), db: Session = Depend
         raise HTTPException(status_code=401, detail="Client not found")
     return client
 
+# get_vendor_principal
+def get_vendor_principal(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> Principal:
+    """Como get_current_vendor, mas sem ir à base de dados enquanto o token
+    estiver em cache (por exemplo nas atualizações de localização)."""
+    principal = principal_cache.get("vendor", token)
+    if principal is None:
+        payload = decode_token(token)
+        row = (
+            db.query(models.Vendor.id, models.Vendor.subscription_active, models.Vendor.subscription_valid_until)
+            .filter(models.Vendor.id == payload.get("sub"))
+            .first()
+        )
+        if not row:
+            raise HTTPException(status_code=401, detail="Vendor not found")
+        principal = Principal("vendor", row.id, bool(row.subscription_active), row.subscription_valid_until)
+        principal_cache.put(token, principal, payload.get("exp"))
+    return principal
+
+# get_client_principal
+def get_client_principal(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> Principal:
+    """Como get_current_client, com o mesmo cache de get_vendor_principal."""
+    principal = principal_cache.get("client", token)
+    if principal is None:
+        payload = decode_token(token)
+        if payload.get("type") != "client":
+            raise HTTPException(status_code=401, detail="Invalid token")
+        client_id = db.query(models.Client.id).filter(models.Client.id == payload.get("sub")).scalar()
+        if client_id is None:
+            raise HTTPException(status_code=401, detail="Client not found")
+        principal = Principal("client", client_id)
+        principal_cache.put(token, principal, payload.get("exp"))
+    return principal
+
+# invalidate_principal
+def invalidate_principal(kind: str, principal_id: int):
+    """Esquece os tokens em cache de um vendedor/cliente, neste e nos outros workers."""
+    principal_cache.invalidate(kind, principal_id)
+    pubsub.publish({"kind": "invalidate", "principal": kind, "id": principal_id})
+
+# invalidate_vendors
+def invalidate_vendors(vendor_ids: list[int]):
+    for vendor_id in vendor_ids:
+        invalidate_principal("vendor", vendor_id)
+
 # --------------------------
 # Sessão de base de dados (mantemos o get_db antigo, mas agora já está importado corretamente também)
 # --------------------------
@@ -234,13 +342,13 @@ def get_admin(request: Request):
 # --------------------------
 # Subscrip\xE7\xE3o
 # --------------------------
-def verify_active_subscription(vendor: models.Vendor, db: Session):
-    """Ensure subscription is active and not expired."""
-    if vendor.subscription_active and vendor.subscription_valid_until and vendor.subscription_valid_until < datetime.utcnow():
-        vendor.subscription_active = False
-        db.commit()
-        db.refresh(vendor)
-    if not vendor.subscription_active:
+def verify_active_subscription(vendor: models.Vendor | Principal):
+    """Ensure subscription is active and not expired.
+
+    Só compara datas: quem marca as subscrições expiradas como inativas é o
+    run_subscription_sweeper (ver subscriptions.py).
+    """
+    if not subscription_is_valid(vendor.subscription_active, vendor.subscription_valid_until):
         raise HTTPException(status_code=403, detail="Subscription inactive")
 
 # --------------------------
@@ -250,7 +358,9 @@ def verify_active_subscription(vendor: models.Vendor, db: Session):
 # login
 def login(credentials: schemas.UserLogin, db: Session = Depends(get_db)):
     vendor = db.query(models.Vendor).filter(models.Vendor.email == credentials.email).first()
-    if not vendor or not pwd_context.verify(credentials.password, vendor.hashed_password):
+    # devolve a ligação ao pool enquanto o bcrypt espera pela sua vez
+    db.close()
+    if not vendor or not password_hasher.verify(credentials.password, vendor.hashed_password):
         raise HTTPException(status_code=400, detail="Incorrect email or password")
     if not vendor.email_confirmed:
         raise HTTPException(status_code=400, detail="Email not confirmed")
@@ -296,7 +406,9 @@ async def generate_token(
         raise HTTPException(status_code=400, detail="Email and password required")
 
     vendor = db.query(models.Vendor).filter(models.Vendor.email == email).first()
-    if not vendor or not pwd_context.verify(password, vendor.hashed_password):
+    # devolve a ligação ao pool enquanto o bcrypt espera pela sua vez
+    db.close()
+    if not vendor or not await password_hasher.verify_async(password, vendor.hashed_password):
         raise HTTPException(status_code=400, detail="Incorrect email or password")
     if not vendor.email_confirmed:
         raise HTTPException(status_code=400, detail="Email not confirmed")
@@ -319,14 +431,9 @@ async def create_client(
     if db_client:
         raise HTTPException(status_code=400, detail="Email already registered")
     validate_password(password)
-    hashed_password = pwd_context.hash(password)
-
-    ext = os.path.splitext(profile_photo.filename)[1]
-    file_name = f"{uuid4().hex}{ext}"
-    file_path = os.path.join(PROFILE_PHOTO_DIR, file_name)
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(profile_photo.file, buffer)
+    hashed_password = await password_hasher.hash_async(password)
 
+    file_name = await save_upload(profile_photo, PROFILE_PHOTO_DIR, PROFILE_PHOTO_MAX_BYTES)
     public_path = f"profile_photos/{file_name}"
 
     new_client = models.Client(
@@ -339,6 +446,7 @@ async def create_client(
     db.add(new_client)
     db.commit()
     db.refresh(new_client)
+    image_pipeline.submit(models.Client, new_client.id, public_path)
 
     confirm_link = f"{os.getenv('BASE_URL', 'http://localhost:8000')}/confirm-client-email/{new_client.confirmation_token}"
     send_email(
@@ -365,7 +473,9 @@ def confirm_client_email(token: str, db: Session = Depends(get_db)):
 # generate_client_token
 def generate_client_token(credentials: schemas.UserLogin, db: Session = Depends(get_db)):
     client = db.query(models.Client).filter(models.Client.email == credentials.email).first()
-    if not client or not pwd_context.verify(credentials.password, client.hashed_password):
+    # devolve a ligação ao pool enquanto o bcrypt espera pela sua vez
+    db.close()
+    if not client or not password_hasher.verify(credentials.password, client.hashed_password):
         raise HTTPException(status_code=400, detail="Incorrect email or password")
     if not client.email_confirmed:
         raise HTTPException(status_code=400, detail="Email not confirmed")
@@ -398,14 +508,9 @@ async def create_vendor(
     if db_vendor:
         raise HTTPException(status_code=400, detail="Email already registered")
     validate_password(password)
-    hashed_password = pwd_context.hash(password)
-
-    ext = os.path.splitext(profile_photo.filename)[1]
-    file_name = f"{uuid4().hex}{ext}"
-    file_path = os.path.join(PROFILE_PHOTO_DIR, file_name)
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(profile_photo.file, buffer)
+    hashed_password = await password_hasher.hash_async(password)
 
+    file_name = await save_upload(profile_photo, PROFILE_PHOTO_DIR, PROFILE_PHOTO_MAX_BYTES)
     public_path = f"profile_photos/{file_name}"
 
     new_vendor = models.Vendor(
@@ -420,6 +525,7 @@ async def create_vendor(
     db.add(new_vendor)
     db.commit()
     db.refresh(new_vendor)
+    image_pipeline.submit(models.Vendor, new_vendor.id, public_path)
 
     confirm_link = f"{os.getenv('BASE_URL', 'http://localhost:8000')}/confirm-email/{new_vendor.confirmation_token}"
     send_email(
@@ -479,7 +585,7 @@ def password_reset(token: str, new_password: str = Form(...), db: Session = Depe
     if not vendor or not vendor.password_reset_expires or vendor.password_reset_expires < datetime.utcnow():
         raise HTTPException(status_code=400, detail="Invalid or expired token")
     validate_password(new_password)
-    vendor.hashed_password = pwd_context.hash(new_password)
+    vendor.hashed_password = password_hasher.hash(new_password)
     vendor.password_reset_token = None
     vendor.password_reset_expires = None
     db.commit()
@@ -491,23 +597,100 @@ def password_reset(token: str, new_password: str = Form(...), db: Session = Depe
 @app.get("/vendors/", response_model=list[schemas.VendorOut])
 # list_vendors
 def list_vendors(db: Session = Depends(get_db)):
-    vendors = db.query(models.Vendor).all()
-    for v in vendors:
-        if v.reviews:
-            v.rating_average = sum(r.rating for r in v.reviews) / len(v.reviews)
-        else:
-            v.rating_average = None
-
-        active_route = (
-            db.query(models.Route)
-            .filter(models.Route.vendor_id == v.id, models.Route.end_time == None)
-            .first()
-        )
-        if not active_route:
+    # trajeto ativo calculado na mesma query (a média já está no vendedor)
+    has_active_route = (
+        select(models.Route.id)
+        .where(models.Route.vendor_id == models.Vendor.id, models.Route.end_time == None)
+        .exists()
+    )
+    rows = db.query(models.Vendor, has_active_route).all()
+
+    vendors = []
+    for v, active in rows:
+        live = live_store.get(v.id)
+        if live:
+            if live.lat is not None:
+                v.current_lat, v.current_lng = live.lat, live.lng
+        elif not active:
             v.current_lat = None
             v.current_lng = None
+        vendors.append(v)
     return vendors
 
+# --------------------------
+# Vendedores perto de um ponto
+# --------------------------
+# Raio máximo aceite em /vendors/nearby (metros)
+NEARBY_MAX_RADIUS = 50000
+
+
+# active_in_box
+def active_in_box(south: float, west: float, north: float, east: float) -> tuple:
+    """Condições SQL: vendedor com trajeto aberto e posição dentro da caixa
+    (que pode atravessar o antimeridiano)."""
+    lng_filter = (
+        models.Vendor.current_lng.between(west, east)
+        if west <= east
+        else (models.Vendor.current_lng >= west) | (models.Vendor.current_lng <= east)
+    )
+    has_active_route = (
+        select(models.Route.id)
+        .where(models.Route.vendor_id == models.Vendor.id, models.Route.end_time == None)
+        .exists()
+    )
+    return models.Vendor.current_lat.between(south, north), lng_filter, has_active_route
+
+
+# nearby_from_db
+def nearby_from_db(db: Session, lat: float, lng: float, radius_m: float) -> list[tuple[int, float]]:
+    """Pesquisa na base de dados: caixa em SQL (índice ix_vendors_location) e
+    depois distância exata de todos os candidatos de uma vez."""
+    rows = (
+        db.query(models.Vendor.id, models.Vendor.current_lat, models.Vendor.current_lng)
+        .filter(*active_in_box(*bounding_box(lat, lng, radius_m)))
+        .all()
+    )
+    return within_radius(lat, lng, [r[0] for r in rows], [r[1] for r in rows], [r[2] for r in rows], radius_m)
+
+
+@app.get("/vendors/nearby", response_model=list[schemas.NearbyVendorOut])
+# list_nearby_vendors
+def list_nearby_vendors(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    radius_m: float = Query(500, gt=0, le=NEARBY_MAX_RADIUS),
+    product: str | None = None,
+    limit: int = Query(50, ge=1, le=200),
+    db: Session = Depends(get_db),
+):
+    """Vendedores ativos a menos de ``radius_m`` metros, do mais próximo para o
+    mais afastado."""
+    if live_store.seeded:
+        found = live_store.nearby(lat, lng, radius_m)
+    else:
+        found = nearby_from_db(db, lat, lng, radius_m)
+    if not found:
+        return []
+
+    query = db.query(models.Vendor).filter(models.Vendor.id.in_([vendor_id for vendor_id, _ in found]))
+    if product:
+        query = query.filter(models.Vendor.product == product)
+    vendors = {v.id: v for v in query.all()}
+
+    result = []
+    for vendor_id, distance in found:
+        v = vendors.get(vendor_id)
+        if not v:
+            continue
+        live = live_store.get(vendor_id)
+        if live and live.lat is not None:
+            v.current_lat, v.current_lng = live.lat, live.lng
+        v.distance_m = distance
+        result.append(v)
+        if len(result) == limit:
+            break
+    return result
+
 # --------------------------
 # Favoritos de clientes
 # --------------------------
@@ -517,7 +700,7 @@ def add_favorite(
     client_id: int,
     vendor_id: int,
     db: Session = Depends(get_db),
-    current_client: models.Client = Depends(get_current_client),
+    current_client: Principal = Depends(get_client_principal),
 ):
     if current_client.id != client_id:
         raise HTTPException(status_code=403, detail="Not authorized")
@@ -538,19 +721,17 @@ def add_favorite(
 def list_favorites(
     client_id: int,
     db: Session = Depends(get_db),
-    current_client: models.Client = Depends(get_current_client),
+    current_client: Principal = Depends(get_client_principal),
 ):
     if current_client.id != client_id:
         raise HTTPException(status_code=403, detail="Not authorized")
-    favs = db.query(models.Favorite).filter_by(client_id=client_id).all()
-    vendors = [db.query(models.Vendor).get(f.vendor_id) for f in favs]
-    for v in vendors:
-        if v.reviews:
-            v.rating_average = sum(r.rating for r in v.reviews) / len(v.reviews)
-        else:
-            v.rating_average = None
-        if v.last_seen:
-            v.last_seen = v.last_seen.isoformat()
+    vendors = (
+        db.query(models.Vendor)
+        .join(models.Favorite, models.Favorite.vendor_id == models.Vendor.id)
+        .filter(models.Favorite.client_id == client_id)
+        .order_by(models.Favorite.id)
+        .all()
+    )
     return vendors
 
 
@@ -560,7 +741,7 @@ def remove_favorite(
     client_id: int,
     vendor_id: int,
     db: Session = Depends(get_db),
-    current_client: models.Client = Depends(get_current_client),
+    current_client: Principal = Depends(get_client_principal),
 ):
     if current_client.id != client_id:
         raise HTTPException(status_code=403, detail="Not authorized")
@@ -607,191 +788,417 @@ async def update_vendor_profile(
         new_pass = new_password if new_password is not None else password
         if not old_password:
             raise HTTPException(status_code=400, detail="Old password required")
-        if not pwd_context.verify(old_password, vendor.hashed_password):
+        if not await password_hasher.verify_async(old_password, vendor.hashed_password):
             raise HTTPException(status_code=400, detail="Old password incorrect")
         validate_password(new_pass)
-        vendor.hashed_password = pwd_context.hash(new_pass)
+        vendor.hashed_password = await password_hasher.hash_async(new_pass)
     if product:
         vendor.product = product
     if profile_photo:
-        ext = os.path.splitext(profile_photo.filename)[1]
-        file_name = f"{uuid4().hex}{ext}"
-        file_path = os.path.join(PROFILE_PHOTO_DIR, file_name)
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(profile_photo.file, buffer)
+        file_name = await save_upload(profile_photo, PROFILE_PHOTO_DIR, PROFILE_PHOTO_MAX_BYTES)
         vendor.profile_photo = f"profile_photos/{file_name}"
+        vendor.photo_variants = None
     if pin_color:
         vendor.pin_color = pin_color
 
     db.commit()
     db.refresh(vendor)
+    if profile_photo:
+        image_pipeline.submit(models.Vendor, vendor.id, vendor.profile_photo)
+    invalidate_principal("vendor", vendor.id)
     return vendor
 
 # --------------------------
 # Atualizar localização do vendedor
 # --------------------------
+# load_active_route
+def load_active_route(vendor_id: int) -> models.Route | None:
+    """Trajeto aberto mais recente do vendedor; corre numa thread, com a sua sessão."""
+    db = SessionLocal()
+    try:
+        return (
+            db.query(models.Route)
+            .filter(models.Route.vendor_id == vendor_id, models.Route.end_time == None)
+            .order_by(models.Route.start_time.desc())
+            .first()
+        )
+    finally:
+        db.close()
+
+
 @app.put("/vendors/{vendor_id}/location")
 # update_vendor_location
 async def update_vendor_location(
     vendor_id: int,
     lat: float = Body(...),
     lng: float = Body(...),
-    db: Session = Depends(get_db),
-    current_vendor: models.Vendor = Depends(get_current_vendor),
+    current_vendor: Principal = Depends(get_vendor_principal),
 ):
-    vendor = db.query(models.Vendor).filter(models.Vendor.id == vendor_id).first()
-    if not vendor:
-        raise HTTPException(status_code=404, detail="Vendor not found")
     if current_vendor.id != vendor_id:
         raise HTTPException(status_code=403, detail="Not authorized")
 
-    verify_active_subscription(current_vendor, db)
+    verify_active_subscription(current_vendor)
 
     # only allow updates if the vendor has an active route
-    active_route = (
-        db.query(models.Route)
-        .filter(models.Route.vendor_id == vendor_id, models.Route.end_time == None)
-        .order_by(models.Route.start_time.desc())
-        .first()
-    )
-    if not active_route:
-        raise HTTPException(status_code=400, detail="Location sharing inactive")
+    if not live_store.get(vendor_id):
+        # só na primeira atualização depois de um reinício (ou noutro worker):
+        # a query corre fora do event loop
+        active_route = await asyncio.to_thread(load_active_route, vendor_id)
+        if not active_route:
+            raise HTTPException(status_code=400, detail="Location sharing inactive")
+        # outro pedido pode tê-lo ativado enquanto a query corria
+        if not live_store.get(vendor_id):
+            live_store.activate(
+                vendor_id, active_route.id, active_route.last_lat, active_route.last_lng, active_route.last_point_at
+            )
 
-    vendor.current_lat = lat
-    vendor.current_lng = lng
-    db.commit()
+    # o ponto fica em memória e é gravado em lote pelo flusher
+    live = live_store.update(vendor_id, lat, lng, datetime.utcnow())
+
+    manager.broadcast({"vendor_id": vendor_id, "lat": live.lat, "lng": live.lng})
+    pubsub.publish({
+        "kind": "location",
+        "vendor_id": vendor_id,
+        "route_id": live.route_id,
+        "lat": live.lat,
+        "lng": live.lng,
+        "t": live.t.isoformat(),
+    })
+    return {"message": "Localização atualizada com sucesso"}
 
-    if active_route:
-        points = json.loads(active_route.points or "[]")
-        points.append({"lat": lat, "lng": lng, "t": datetime.utcnow().isoformat()})
-        active_route.points = json.dumps(points)
-        db.commit()
 
-    await manager.broadcast({"vendor_id": vendor_id, "lat": lat, "lng": lng})
-    return {"message": "Localização atualizada com sucesso"}
+# apply_remote_event
+def apply_remote_event(event: dict):
+    """Aplica um evento publicado por outro worker: atualiza a posição em
+    memória e avisa os WebSockets ligados a este worker."""
+    kind = event.get("kind")
+    if kind == "invalidate":
+        principal_cache.invalidate(event["principal"], event["id"])
+        return
+    vendor_id = event["vendor_id"]
+    if kind == "location":
+        live_store.observe(
+            vendor_id, event["route_id"], event["lat"], event["lng"], datetime.fromisoformat(event["t"])
+        )
+        manager.broadcast({"vendor_id": vendor_id, "lat": event["lat"], "lng": event["lng"]})
+    elif kind == "start":
+        live_store.activate(vendor_id, event["route_id"])
+        live_store.request_flush()
+    elif kind == "stop":
+        live_store.deactivate(vendor_id)
+        live_store.request_flush()
+        manager.broadcast({"vendor_id": vendor_id, "lat": None, "lng": None, "remove": True})
 
 # --------------------------
 # Iniciar e terminar trajetos
 # --------------------------
+# get_route_points
+def get_route_points(
+    db: Session,
+    routes: list[models.Route],
+    tolerance_m: float | None = None,
+    max_points: int | None = None,
+) -> dict[int, list[dict]]:
+    """Carrega os pontos de vários trajetos numa única query à tabela route_points.
+
+    Com ``tolerance_m``/``max_points`` devolve o trajeto simplificado; nos
+    trajetos fechados a tolerância é aplicada logo na query, pela importância
+    guardada em cada ponto.
+    """
+    result = {r.id: json.loads(r.points) if r.points else [] for r in routes}
+    if not result:
+        return result
+    simplify = tolerance_m is not None or max_points is not None
+    importance = {route_id: [None] * len(points) for route_id, points in result.items()}
+    query = db.query(models.RoutePoint).filter(models.RoutePoint.route_id.in_(list(result)))
+    if tolerance_m is not None:
+        query = query.filter(
+            or_(models.RoutePoint.importance > tolerance_m, models.RoutePoint.importance == None)
+        )
+    rows = query.order_by(models.RoutePoint.route_id, models.RoutePoint.t, models.RoutePoint.id).all()
+    for p in rows:
+        result[p.route_id].append({"lat": p.lat, "lng": p.lng, "t": p.t.isoformat()})
+        importance[p.route_id].append(p.importance)
+    if simplify:
+        for route_id, points in result.items():
+            values = importance[route_id]
+            # trajetos ainda abertos (sem importância guardada) são simplificados aqui
+            result[route_id] = simplify_points(
+                points, tolerance_m, max_points, None if None in values else values
+            )
+    return result
+
+
+# close_route
+def close_route(db: Session, route: models.Route) -> list[dict]:
+    """Fecha um trajeto: guarda a distância final, a importância de cada ponto
+    e soma-o às estatísticas do dia. Os pontos originais ficam todos; devolve-os."""
+    route.end_time = route.end_time or datetime.utcnow()
+    rows = (
+        db.query(models.RoutePoint.id, models.RoutePoint.lat, models.RoutePoint.lng, models.RoutePoint.t)
+        .filter(models.RoutePoint.route_id == route.id)
+        .order_by(models.RoutePoint.t, models.RoutePoint.id)
+        .all()
+    )
+    points = json.loads(route.points) if route.points else []
+    points += [{"lat": lat, "lng": lng, "t": t.isoformat()} for _, lat, lng, t in rows]
+    route.distance_m = path_length(points)
+    if rows:
+        lat, lng = point_arrays(points)
+        values = simplification_importance(lat, lng)[len(points) - len(rows):]
+        db.execute(
+            update(models.RoutePoint),
+            [{"id": row[0], "importance": float(v)} for row, v in zip(rows, values)],
+        )
+    add_route_to_daily_stats(db, route)
+    return points
+
+
+# serialize_route
+def serialize_route(route: models.Route, points: list[dict] | None = None) -> dict:
+    data = {
+        "id": route.id,
+        "start_time": route.start_time.isoformat(),
+        "end_time": route.end_time.isoformat() if route.end_time else None,
+        "distance_m": route.distance_m,
+    }
+    if points is not None:
+        data["points"] = points
+    return data
+
+
+# encode_route_cursor
+def encode_route_cursor(route: models.Route) -> str:
+    return _b64({"s": route.start_time.isoformat(), "id": route.id})
+
+
+# decode_route_cursor
+def decode_route_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        data = json.loads(_b64decode(cursor))
+        return datetime.fromisoformat(data["s"]), int(data["id"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
 @app.post("/vendors/{vendor_id}/routes/start", response_model=schemas.RouteOut)
 # start_route
 def start_route(
     vendor_id: int,
     db: Session = Depends(get_db),
-    current_vendor: models.Vendor = Depends(get_current_vendor),
+    current_vendor: Principal = Depends(get_vendor_principal),
 ):
     if current_vendor.id != vendor_id:
         raise HTTPException(status_code=403, detail="Not authorized")
 
-    verify_active_subscription(current_vendor, db)
+    verify_active_subscription(current_vendor)
 
     # close any previously active routes to avoid duplicates
-    active_routes = (
+    live_store.deactivate(vendor_id)
+    live_store.flush()
+    open_routes = (
         db.query(models.Route)
         .filter(models.Route.vendor_id == vendor_id, models.Route.end_time == None)
+        .with_for_update()
         .all()
     )
-    for r in active_routes:
-        pts = json.loads(r.points or "[]")
-        dist = 0.0
-        for p1, p2 in zip(pts, pts[1:]):
-            dist += haversine(p1["lat"], p1["lng"], p2["lat"], p2["lng"])
-        r.distance_m = dist
-        r.end_time = datetime.utcnow()
-
-    route = models.Route(vendor_id=vendor_id, points="[]")
+    for r in open_routes:
+        close_route(db, r)
+
+    route = models.Route(vendor_id=vendor_id)
     db.add(route)
     db.commit()
     db.refresh(route)
-    return {
-        "id": route.id,
-        "start_time": route.start_time.isoformat(),
-        "end_time": route.end_time,
-        "distance_m": route.distance_m,
-        "points": [],
-    }
+    live_store.activate(vendor_id, route.id)
+    pubsub.publish({"kind": "start", "vendor_id": vendor_id, "route_id": route.id})
+    return serialize_route(route, [])
+
+
+# finish_routes
+def finish_routes(vendor_id: int) -> dict:
+    """Grava os pontos pendentes e fecha os trajetos abertos do vendedor.
+
+    Corre numa thread, com a sua própria sessão, do lock à gravação.
+    """
+    live_store.flush()
+    db = SessionLocal()
+    try:
+        routes = (
+            db.query(models.Route)
+            .filter(models.Route.vendor_id == vendor_id, models.Route.end_time == None)
+            .order_by(models.Route.start_time.desc())
+            .with_for_update()
+            .all()
+        )
+        if not routes:
+            raise HTTPException(status_code=404, detail="Route not found")
+
+        latest = routes[0]
+        # distância final a partir de todos os pontos gravados (inclui os de outros
+        # workers), importância de cada ponto e estatísticas diárias
+        for r in routes[1:]:
+            close_route(db, r)
+        points = close_route(db, latest)
+
+        # Clear vendor's current location so clients remove it from the map
+        db.execute(
+            update(models.Vendor)
+            .where(models.Vendor.id == vendor_id)
+            .values(current_lat=None, current_lng=None)
+        )
+        db.commit()
+        db.refresh(latest)
+        return serialize_route(latest, points)
+    finally:
+        db.close()
 
 
 @app.post("/vendors/{vendor_id}/routes/stop", response_model=schemas.RouteOut)
 # stop_route
 async def stop_route(
     vendor_id: int,
-    db: Session = Depends(get_db),
-    current_vendor: models.Vendor = Depends(get_current_vendor),
+    current_vendor: Principal = Depends(get_vendor_principal),
 ):
     if current_vendor.id != vendor_id:
         raise HTTPException(status_code=403, detail="Not authorized")
 
-    verify_active_subscription(current_vendor, db)
-    routes = (
-        db.query(models.Route)
-        .filter(models.Route.vendor_id == vendor_id, models.Route.end_time == None)
-        .order_by(models.Route.start_time.desc())
-        .all()
-    )
-    if not routes:
-        raise HTTPException(status_code=404, detail="Route not found")
+    verify_active_subscription(current_vendor)
+    live_store.deactivate(vendor_id)
+    # os outros workers gravam já os pontos que receberam deste vendedor; os
+    # que só chegarem depois de o trajeto ser fechado são descartados (live.py)
+    pubsub.publish({"kind": "stop", "vendor_id": vendor_id})
+    route = await asyncio.to_thread(finish_routes, vendor_id)
 
-    latest = routes[0]
-    for r in routes:
-        pts = json.loads(r.points or "[]")
-        dist = 0.0
-        for p1, p2 in zip(pts, pts[1:]):
-            dist += haversine(p1["lat"], p1["lng"], p2["lat"], p2["lng"])
-        r.distance_m = dist
-        r.end_time = datetime.utcnow()
-
-    # Clear vendor's current location so clients remove it from the map
-    current_vendor.current_lat = None
-    current_vendor.current_lng = None
-    db.commit()
-    for r in routes:
-        db.refresh(r)
-    db.refresh(current_vendor)
     # Notify via websocket that the vendor stopped sharing location
-    await manager.broadcast({
+    manager.broadcast({
     "vendor_id": vendor_id,
     "lat": None,
     "lng": None,
     "remove": True  # 👈 Esta linha é essencial!
 })
 
-    return {
-        "id": latest.id,
-        "start_time": latest.start_time.isoformat(),
-        "end_time": latest.end_time.isoformat(),
-        "distance_m": latest.distance_m,
-        "points": json.loads(latest.points or "[]"),
-    }
+    return route
 
 
-@app.get("/vendors/{vendor_id}/routes", response_model=list[schemas.RouteOut])
+# Máximo de trajetos por página em ?limit=
+MAX_ROUTES_PAGE = 200
+
+
+@app.get(
+    "/vendors/{vendor_id}/routes",
+    response_model=list[schemas.RouteOut | schemas.RouteSummaryOut],
+)
 # list_routes
 def list_routes(
     vendor_id: int,
+    response: Response,
+    tolerance_m: float | None = Query(None, ge=0),
+    max_points: int | None = Query(None, ge=2),
+    fields: Literal["full", "summary"] = "full",
+    limit: int | None = Query(None, ge=1, le=MAX_ROUTES_PAGE),
+    cursor: str | None = None,
     db: Session = Depends(get_db),
-    current_vendor: models.Vendor = Depends(get_current_vendor),
+    current_vendor: Principal = Depends(get_vendor_principal),
 ):
+    # ?tolerance_m= e ?max_points= devolvem trajetos simplificados (Douglas-Peucker)
+    # ?fields=summary devolve só id/início/fim/distância, sem ler os pontos nem
+    # gravar os pendentes: a distância do trajeto aberto pode estar atrasada
+    # até LIVE_FLUSH_INTERVAL segundos
+    # ?limit= pagina; a próxima página pede-se com ?cursor=<X-Next-Cursor>
     if current_vendor.id != vendor_id:
         raise HTTPException(status_code=403, detail="Not authorized")
-    routes = (
+    if fields == "full" and live_store.has_pending(vendor_id):
+        live_store.flush()
+    query = db.query(models.Route).filter(models.Route.vendor_id == vendor_id)
+    if fields == "summary":
+        query = query.options(defer(models.Route.points))
+    if cursor:
+        start_time, route_id = decode_route_cursor(cursor)
+        query = query.filter(
+            or_(
+                models.Route.start_time < start_time,
+                and_(models.Route.start_time == start_time, models.Route.id < route_id),
+            )
+        )
+    query = query.order_by(models.Route.start_time.desc(), models.Route.id.desc())
+    if limit:
+        routes = query.limit(limit + 1).all()
+        if len(routes) > limit:
+            routes = routes[:limit]
+            response.headers["X-Next-Cursor"] = encode_route_cursor(routes[-1])
+    else:
+        routes = query.all()
+
+    if fields == "summary":
+        return [serialize_route(r) for r in routes]
+    points = get_route_points(db, routes, tolerance_m, max_points)
+    return [serialize_route(r, points[r.id]) for r in routes]
+
+
+@app.get("/vendors/{vendor_id}/routes/{route_id}", response_model=schemas.RouteOut)
+# get_route
+def get_route(
+    vendor_id: int,
+    route_id: int,
+    tolerance_m: float | None = Query(None, ge=0),
+    max_points: int | None = Query(None, ge=2),
+    db: Session = Depends(get_db),
+    current_vendor: Principal = Depends(get_vendor_principal),
+):
+    if current_vendor.id != vendor_id:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    route = (
         db.query(models.Route)
-        .filter(models.Route.vendor_id == vendor_id)
-        .order_by(models.Route.start_time.desc())
-        .all()
+        .filter(models.Route.id == route_id, models.Route.vendor_id == vendor_id)
+        .first()
     )
-    result = []
-    for r in routes:
-        result.append(
-            {
-                "id": r.id,
-                "start_time": r.start_time.isoformat(),
-                "end_time": r.end_time.isoformat() if r.end_time else None,
-                "distance_m": r.distance_m,
-                "points": json.loads(r.points or "[]"),
-            }
-        )
-    return result
+    if not route:
+        raise HTTPException(status_code=404, detail="Route not found")
+    if route.end_time is None and live_store.has_pending(vendor_id):
+        live_store.flush()
+    return serialize_route(route, get_route_points(db, [route], tolerance_m, max_points)[route.id])
+
+
+@app.get("/vendors/{vendor_id}/routes/{route_id}/stats", response_model=schemas.RouteStatsOut)
+# get_route_stats
+def get_route_stats(
+    vendor_id: int,
+    route_id: int,
+    db: Session = Depends(get_db),
+    current_vendor: Principal = Depends(get_vendor_principal),
+):
+    if current_vendor.id != vendor_id:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    route = (
+        db.query(models.Route)
+        .filter(models.Route.id == route_id, models.Route.vendor_id == vendor_id)
+        .first()
+    )
+    if not route:
+        raise HTTPException(status_code=404, detail="Route not found")
+    if route.end_time is None and live_store.has_pending(vendor_id):
+        live_store.flush()
+    return {"id": route.id, **route_stats(get_route_points(db, [route])[route.id])}
+
+
+@app.get("/vendors/{vendor_id}/stats/daily", response_model=list[schemas.DailyStatOut])
+# list_daily_stats
+def list_daily_stats(
+    vendor_id: int,
+    from_date: date | None = Query(None, alias="from"),
+    to_date: date | None = Query(None, alias="to"),
+    db: Session = Depends(get_db),
+    current_vendor: Principal = Depends(get_vendor_principal),
+):
+    """Distância, tempo ativo e número de trajetos por dia (trajetos fechados)."""
+    if current_vendor.id != vendor_id:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    query = db.query(models.DailyStat).filter(models.DailyStat.vendor_id == vendor_id)
+    if from_date:
+        query = query.filter(models.DailyStat.date >= from_date)
+    if to_date:
+        query = query.filter(models.DailyStat.date <= to_date)
+    return query.order_by(models.DailyStat.date).all()
 
 
 @app.get("/vendors/{vendor_id}/paid-weeks", response_model=list[schemas.PaidWeekOut])
@@ -799,7 +1206,7 @@ def list_routes(
 def list_paid_weeks(
     vendor_id: int,
     db: Session = Depends(get_db),
-    current_vendor: models.Vendor = Depends(get_current_vendor),
+    current_vendor: Principal = Depends(get_vendor_principal),
 ):
     if current_vendor.id != vendor_id:
         raise HTTPException(status_code=403, detail="Not authorized")
@@ -866,11 +1273,48 @@ def create_checkout_session(
 @app.websocket("/ws/locations")
 # websocket_locations
 async def websocket_locations(websocket: WebSocket):
-    await manager.connect(websocket)
+    # ?format=array pede mensagens compactas [vendor_id, lat, lng]
+    # ?batch_ms=1000 agrupa as atualizações de cada intervalo (500 a 2000 ms)
+    # ?bbox=sul,oeste,norte,este limita logo à partida a zona do mapa
+    # ?snapshot=1 envia primeiro os vendedores ativos e depois alterações
+    # numeradas; ?since=<seq>&epoch=<epoch> retoma a partir da última recebida
+    params = websocket.query_params
+    batch_interval = None
+    batch_ms = params.get("batch_ms")
+    if batch_ms and batch_ms.isdigit():
+        batch_interval = int(batch_ms) / 1000
+    area = None
+    if params.get("bbox"):
+        try:
+            area = Area.from_message({"bbox": params["bbox"].split(",")})
+        except (ValueError, TypeError):
+            area = None
+    since = params.get("since")
+    since = int(since) if since and since.isdigit() else None
+    await manager.connect(
+        websocket,
+        params.get("format", "json"),
+        batch_interval,
+        area=area,
+        sequenced=params.get("snapshot") == "1" or since is not None,
+        since=since,
+        epoch=params.get("epoch"),
+    )
     try:
         while True:
-            await websocket.receive_text()
+            # o cliente pode limitar as atualizações à zona do mapa que está a
+            # ver: {"bbox": [sul, oeste, norte, este]} ou {"geohashes": [...]}
+            text = await websocket.receive_text()
+            try:
+                area = Area.from_message(json.loads(text))
+            except (ValueError, TypeError, AttributeError):
+                manager.send_to(websocket, {"type": "error", "detail": "Invalid subscription"})
+                continue
+            manager.set_area(websocket, area)
+            manager.send_to(websocket, {"type": "subscribed"})
     except WebSocketDisconnect:
+        pass
+    finally:
         manager.disconnect(websocket)
 
 # --------------------------
@@ -882,7 +1326,7 @@ def create_review(
     vendor_id: int,
     review: schemas.ReviewCreate,
     db: Session = Depends(get_db),
-    current_client: models.Client = Depends(get_current_client),
+    current_client: Principal = Depends(get_client_principal),
 ):
     vendor = db.query(models.Vendor).filter(models.Vendor.id == vendor_id).first()
     if not vendor:
@@ -894,11 +1338,24 @@ def create_review(
         comment=review.comment,
     )
     db.add(new_rev)
+    change_vendor_rating(db, vendor_id, review.rating, 1)
     db.commit()
     db.refresh(new_rev)
     return new_rev
 
 
+# change_vendor_rating
+def change_vendor_rating(db: Session, vendor_id: int, rating: int, count: int):
+    """Atualiza a soma e o número de avaliações do vendedor na mesma transação."""
+    db.query(models.Vendor).filter(models.Vendor.id == vendor_id).update(
+        {
+            models.Vendor.rating_sum: func.coalesce(models.Vendor.rating_sum, 0) + rating * count,
+            models.Vendor.rating_count: func.coalesce(models.Vendor.rating_count, 0) + count,
+        },
+        synchronize_session=False,
+    )
+
+
 
 @app.get("/vendors/{vendor_id}/reviews", response_model=list[schemas.ReviewOut])
 # list_reviews
@@ -960,7 +1417,15 @@ def delete_review(
     )
     if not review:
         raise HTTPException(status_code=404, detail="Review not found")
-    review.active = False
+    # desativar só se ainda estiver ativa: com dois pedidos em simultâneo só
+    # um altera a linha e desconta a avaliação do vendedor
+    result = db.execute(
+        update(models.Review)
+        .where(models.Review.id == review_id, models.Review.active == True)
+        .values(active=False)
+    )
+    if result.rowcount == 1:
+        change_vendor_rating(db, vendor_id, review.rating, -1)
     db.commit()
     return {"status": "deleted"}
 
@@ -975,11 +1440,7 @@ async def create_story(
 ):
     if current_vendor.id != vendor_id:
         raise HTTPException(status_code=403, detail="Not authorized")
-    ext = os.path.splitext(file.filename)[1]
-    file_name = f"{uuid4().hex}{ext}"
-    file_path = os.path.join(STORY_DIR, file_name)
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    file_name = await save_upload(file, STORY_DIR, STORY_MAX_BYTES)
     created = datetime.utcnow()
     story = models.Story(
         vendor_id=vendor_id,
@@ -1016,6 +1477,74 @@ def list_stories(vendor_id: int, db: Session = Depends(get_db)):
         for s in stories
     ]
 
+
+# etag_matches
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+@app.get("/vendors/stories", response_model=list[schemas.VendorStoriesOut])
+# list_vendors_stories
+def list_vendors_stories(
+    request: Request,
+    vendor_ids: str | None = None,
+    bbox: str | None = None,
+    db: Session = Depends(get_db),
+):
+    """Stories ativas, agrupadas por vendedor, de ``vendor_ids=1,2,3`` e/ou
+    dos vendedores ativos dentro de ``bbox=sul,oeste,norte,este``, numa só
+    consulta. Só aparecem os vendedores que têm stories.
+
+    A resposta traz um ETag; com ``If-None-Match`` igual responde 304 sem corpo,
+    para o mapa poder repetir o pedido a cada poucos segundos.
+    """
+    if vendor_ids is None and bbox is None:
+        raise HTTPException(status_code=400, detail="vendor_ids or bbox required")
+    query = db.query(models.Story).filter(models.Story.expires_at > datetime.utcnow())
+    if vendor_ids is not None:
+        try:
+            ids = {int(v) for v in vendor_ids.split(",") if v.strip()}
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid vendor_ids")
+        if len(ids) > MAX_STORY_VENDORS:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_STORY_VENDORS} vendors")
+        query = query.filter(models.Story.vendor_id.in_(ids))
+    if bbox is not None:
+        try:
+            area = Area.from_message({"bbox": bbox.split(",")})
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=400, detail="Invalid bbox")
+        if live_store.seeded:
+            query = query.filter(models.Story.vendor_id.in_(live_store.in_area(area)))
+        else:
+            in_area = select(models.Vendor.id).where(*active_in_box(*area.bbox))
+            query = query.filter(models.Story.vendor_id.in_(in_area))
+
+    rows = (
+        query.with_entities(
+            models.Story.vendor_id, models.Story.id, models.Story.media_path, models.Story.created_at
+        )
+        .order_by(models.Story.vendor_id, models.Story.created_at.desc())
+        .all()
+    )
+    grouped = {}
+    for vendor_id, story_id, media_path, created_at in rows:
+        grouped.setdefault(vendor_id, []).append(
+            {"id": story_id, "media_url": media_path, "created_at": created_at.isoformat()}
+        )
+    body = json.dumps(
+        [{"vendor_id": vendor_id, "stories": items} for vendor_id, items in grouped.items()],
+        separators=(",", ":"),
+    ).encode()
+    etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 # --------------------------
 # Webhook do Stripe
 # --------------------------
@@ -1044,6 +1573,7 @@ async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
             )
             db.add(paid)
             db.commit()
+            invalidate_principal("vendor", vendor_id)
     return {"status": "success"}
 
 # --------------------------
@@ -1063,8 +1593,25 @@ def admin_deactivate_vendor(vendor_id: int, db: Session = Depends(get_db), admin
         raise HTTPException(status_code=404, detail="Vendor not found")
     vendor.subscription_active = False
     db.commit()
+    invalidate_principal("vendor", vendor_id)
     return {"status": "deactivated"}
 
+@app.get("/admin/metrics")
+# admin_metrics
+def admin_metrics(admin: bool = Depends(get_admin)):
+    return {
+        "password_hashing": password_hasher.metrics(),
+        "auth_cache": {
+            "size": len(principal_cache),
+            "hits": principal_cache.hits,
+            "misses": principal_cache.misses,
+        },
+        "live_pending_points": live_store.pending_count(),
+        "live_discarded_points": live_store.discarded,
+        "email": email_queue.metrics(),
+        "images": {"completed": image_pipeline.completed, "failed": image_pipeline.failed},
+    }
+
 @app.get("/vendors/me", response_model=schemas.VendorOut)
 def get_my_vendor_profile(current_vendor: models.Vendor = Depends(get_current_vendor)):
     return current_vendor
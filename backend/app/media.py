@@ -0,0 +1,46 @@
+# media.py - envio das fotos e stories com cabeçalhos de cache
+#
+# Os ficheiros gravados por uploads.py têm como nome o SHA-256 do conteúdo (as
+# versões de images.py acrescentam _<tamanho>), por isso nunca mudam: o ETag
+# é o próprio hash e podem ficar em cache (telemóvel ou CDN) indefinidamente.
+# Pedidos Range (vídeos das stories) e If-None-Match são tratados pelo
+# FileResponse/StaticFiles do Starlette.
+import os
+import re
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+# <hash>.ext ou <hash>_<tamanho>.ext
+CONTENT_NAME = re.compile(r"([0-9a-f]{64}(?:_\d+)?)\.[A-Za-z0-9]+")
+
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+# ficheiros antigos com nome aleatório (uuid), de antes do armazenamento por hash
+LEGACY_CACHE = "public, max-age=86400"
+
+
+# media_headers
+def media_headers(file_name: str) -> dict[str, str]:
+    match = CONTENT_NAME.fullmatch(file_name)
+    if not match:
+        return {"cache-control": LEGACY_CACHE}
+    return {"cache-control": IMMUTABLE_CACHE, "etag": f'"{match.group(1)}"'}
+
+
+# MediaFiles
+class MediaFiles(StaticFiles):
+    """StaticFiles com ETag forte e Cache-Control imutável para nomes por hash."""
+
+    # file_response
+    def file_response(self, full_path, stat_result: os.stat_result, scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        response = FileResponse(
+            full_path,
+            status_code=status_code,
+            stat_result=stat_result,
+            headers=media_headers(os.path.basename(full_path)),
+        )
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
@@ -0,0 +1,228 @@
+# migrations.py - migrações de dados para bases de dados já existentes
+#
+# Uso: python -m backend.app.migrations [route-points|route-progress|vendor-ratings|daily-stats|photo-variants]
+import argparse
+import json
+from datetime import datetime
+
+from sqlalchemy import func, inspect, select, text, update
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.orm import Session
+
+from . import models
+from .geometry import path_length
+from .stats import route_activity
+
+
+# add_missing_columns
+def add_missing_columns(engine) -> list[str]:
+    """Acrescenta às tabelas existentes as colunas novas dos modelos.
+
+    ``create_all`` só cria tabelas em falta; esta função cobre colunas
+    adicionadas depois. É idempotente e tolera outro worker ter adicionado a
+    mesma coluna em simultâneo.
+    """
+    inspector = inspect(engine)
+    added = []
+    for table in models.Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+            except (OperationalError, ProgrammingError):
+                continue
+            added.append(f"{table.name}.{column.name}")
+    return added
+
+
+# add_missing_indexes
+def add_missing_indexes(engine) -> list[str]:
+    """Cria os índices dos modelos que faltam em tabelas já existentes."""
+    inspector = inspect(engine)
+    added = []
+    for table in models.Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {i["name"] for i in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            try:
+                index.create(bind=engine, checkfirst=True)
+            except (OperationalError, ProgrammingError):
+                continue
+            added.append(index.name)
+    return added
+
+
+# parse_point_time
+def parse_point_time(value: str | None) -> datetime:
+    if not value:
+        return datetime.utcnow()
+    return datetime.fromisoformat(value)
+
+
+# migrate_route_points
+def migrate_route_points(db: Session, batch_size: int = 100) -> int:
+    """Move os pontos guardados em JSON em ``Route.points`` para ``route_points``.
+
+    Cada trajeto é migrado na mesma transação em que o blob é limpo, por isso a
+    migração pode ser interrompida e repetida sem duplicar pontos.
+    """
+    migrated = 0
+    while True:
+        routes = (
+            db.query(models.Route)
+            .filter(models.Route.points != None)
+            .order_by(models.Route.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not routes:
+            return migrated
+        for route in routes:
+            points = json.loads(route.points or "[]")
+            db.add_all(
+                [
+                    models.RoutePoint(
+                        route_id=route.id,
+                        lat=p["lat"],
+                        lng=p["lng"],
+                        t=parse_point_time(p.get("t")),
+                    )
+                    for p in points
+                ]
+            )
+            route.points = None
+            migrated += 1
+        db.commit()
+
+
+# backfill_route_progress
+def backfill_route_progress(db: Session) -> int:
+    """Calcula distância e último ponto dos trajetos abertos criados antes da
+    acumulação incremental, para que continuem a somar a partir daí."""
+    routes = (
+        db.query(models.Route)
+        .filter(models.Route.end_time == None, models.Route.last_lat == None)
+        .all()
+    )
+    updated = 0
+    for route in routes:
+        rows = (
+            db.query(models.RoutePoint)
+            .filter(models.RoutePoint.route_id == route.id)
+            .order_by(models.RoutePoint.t, models.RoutePoint.id)
+            .all()
+        )
+        points = json.loads(route.points) if route.points else []
+        points += [{"lat": p.lat, "lng": p.lng, "t": p.t.isoformat()} for p in rows]
+        if not points:
+            continue
+        route.distance_m = path_length(points)
+        route.last_lat = points[-1]["lat"]
+        route.last_lng = points[-1]["lng"]
+        route.last_point_at = parse_point_time(points[-1].get("t"))
+        updated += 1
+    db.commit()
+    return updated
+
+
+# backfill_vendor_ratings
+def backfill_vendor_ratings(db: Session) -> int:
+    """Recalcula ``rating_sum``/``rating_count`` de todos os vendedores a partir
+    das avaliações ativas, numa única instrução."""
+    active = (models.Review.vendor_id == models.Vendor.id, models.Review.active == True)
+    result = db.execute(
+        update(models.Vendor).values(
+            rating_sum=select(func.coalesce(func.sum(models.Review.rating), 0)).where(*active).scalar_subquery(),
+            rating_count=select(func.count(models.Review.id)).where(*active).scalar_subquery(),
+        )
+    )
+    db.commit()
+    return result.rowcount
+
+
+# backfill_daily_stats
+def backfill_daily_stats(db: Session) -> int:
+    """Reconstrói a tabela ``daily_stats`` a partir de todos os trajetos fechados."""
+    totals: dict[tuple[int, object], list] = {}
+    routes = db.query(models.Route).filter(models.Route.end_time != None).yield_per(1000)
+    for route in routes:
+        distance, seconds = route_activity(route)
+        total = totals.setdefault((route.vendor_id, route.start_time.date()), [0.0, 0.0, 0])
+        total[0] += distance
+        total[1] += seconds
+        total[2] += 1
+    db.query(models.DailyStat).delete()
+    db.add_all(
+        [
+            models.DailyStat(vendor_id=vendor_id, date=day, distance_m=d, active_seconds=s, route_count=c)
+            for (vendor_id, day), (d, s, c) in totals.items()
+        ]
+    )
+    db.commit()
+    return len(totals)
+
+
+# generate_missing_photo_variants
+def generate_missing_photo_variants(db: Session, root: str = ".") -> int:
+    """Gera as versões (ver images.py) das fotos de perfil enviadas antes de existirem."""
+    from .images import generate_variants
+
+    count = 0
+    for model in (models.Vendor, models.Client):
+        rows = db.execute(
+            select(model.id, model.profile_photo).where(model.profile_photo != None, model.photo_variants == None)
+        ).all()
+        for owner_id, path in rows:
+            variants = generate_variants(path, root)
+            if variants is None:
+                continue
+            db.execute(update(model).where(model.id == owner_id).values(photo_variants=json.dumps(variants)))
+            db.commit()
+            count += 1
+    return count
+
+
+# main
+def main():
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Migrações de dados do Sunny Sales")
+    parser.add_argument(
+        "command",
+        nargs="?",
+        choices=["route-points", "route-progress", "vendor-ratings", "daily-stats", "photo-variants"],
+    )
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.command in (None, "route-points"):
+            count = migrate_route_points(db)
+            print(f"✅ {count} trajetos migrados para route_points")
+        if args.command in (None, "route-progress"):
+            count = backfill_route_progress(db)
+            print(f"✅ {count} trajetos abertos com distância recalculada")
+        if args.command in (None, "vendor-ratings"):
+            count = backfill_vendor_ratings(db)
+            print(f"✅ {count} vendedores com avaliações recalculadas")
+        if args.command in (None, "daily-stats"):
+            count = backfill_daily_stats(db)
+            print(f"✅ {count} dias de estatísticas reconstruídos")
+        if args.command in (None, "photo-variants"):
+            count = generate_missing_photo_variants(db)
+            print(f"✅ {count} fotos de perfil com versões geradas")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
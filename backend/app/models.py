@@ -1,7 +1,8 @@
 # models.py - define as tabelas no PostgreSQL
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Boolean, Date, DateTime, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime
+import json
 from .database import Base
 
 # Vendor
@@ -25,10 +26,30 @@ class Vendor(Base):
     confirmation_token = Column(String, nullable=True, index=True)
     password_reset_token = Column(String, nullable=True, index=True)
     password_reset_expires = Column(DateTime, nullable=True)
+    # soma e número das avaliações ativas, mantidos a cada review criada/apagada
+    rating_sum = Column(Integer, default=0)
+    rating_count = Column(Integer, default=0)
+    # versões da foto de perfil (JSON, ver images.py), preenchidas em segundo plano
+    photo_variants = Column(String, nullable=True)
 
     reviews = relationship("Review", back_populates="vendor")
     routes = relationship("Route", back_populates="vendor")
 
+    # pesquisa por caixa em /vendors/nearby quando não há posições em memória
+    __table_args__ = (Index("ix_vendors_location", "current_lat", "current_lng"),)
+
+    @property
+    # rating_average
+    def rating_average(self) -> float | None:
+        if not self.rating_count:
+            return None
+        return self.rating_sum / self.rating_count
+
+    @property
+    # profile_photo_variants
+    def profile_photo_variants(self) -> dict | None:
+        return json.loads(self.photo_variants) if self.photo_variants else None
+
 
 # Client
 class Client(Base):
@@ -45,10 +66,17 @@ class Client(Base):
     confirmation_token = Column(String, nullable=True, index=True)
     password_reset_token = Column(String, nullable=True, index=True)
     password_reset_expires = Column(DateTime, nullable=True)
+    # versões da foto de perfil (JSON, ver images.py)
+    photo_variants = Column(String, nullable=True)
 
     favorites = relationship("Favorite", back_populates="client")
     reviews = relationship("Review", back_populates="client")
 
+    @property
+    # profile_photo_variants
+    def profile_photo_variants(self) -> dict | None:
+        return json.loads(self.photo_variants) if self.photo_variants else None
+
 
 # Review
 class Review(Base):
@@ -88,10 +116,52 @@ class Route(Base):
     vendor_id = Column(Integer, ForeignKey("vendors.id"))
     start_time = Column(DateTime, default=datetime.utcnow)
     end_time = Column(DateTime, nullable=True)
-    points = Column(String)
+    # Legado: pontos em JSON; os novos pontos vivem em route_points
+    points = Column(String, nullable=True)
     distance_m = Column(Float, default=0.0)
+    # Último ponto recebido, para acumular distance_m a cada atualização
+    last_lat = Column(Float, nullable=True)
+    last_lng = Column(Float, nullable=True)
+    last_point_at = Column(DateTime, nullable=True)
 
     vendor = relationship("Vendor", back_populates="routes")
+    point_rows = relationship("RoutePoint", back_populates="route", order_by="RoutePoint.t")
+
+    # histórico de um vendedor, do mais recente para o mais antigo
+    __table_args__ = (Index("ix_routes_vendor_start", "vendor_id", "start_time"),)
+
+
+# RoutePoint
+class RoutePoint(Base):
+    """Pontos GPS de um trajeto, um registo por atualização de localização."""
+
+    __tablename__ = "route_points"
+
+    id = Column(Integer, primary_key=True, index=True)
+    route_id = Column(Integer, ForeignKey("routes.id"), index=True)
+    lat = Column(Float)
+    lng = Column(Float)
+    t = Column(DateTime, default=datetime.utcnow)
+    # importância Douglas-Peucker (metros), calculada quando o trajeto fecha
+    importance = Column(Float, nullable=True)
+
+    route = relationship("Route", back_populates="point_rows")
+
+
+# DailyStat
+class DailyStat(Base):
+    """Totais diários de cada vendedor, somados quando um trajeto fecha."""
+
+    __tablename__ = "daily_stats"
+
+    id = Column(Integer, primary_key=True, index=True)
+    vendor_id = Column(Integer, ForeignKey("vendors.id"), index=True)
+    date = Column(Date)
+    distance_m = Column(Float, default=0.0)
+    active_seconds = Column(Float, default=0.0)
+    route_count = Column(Integer, default=0)
+
+    __table_args__ = (UniqueConstraint("vendor_id", "date", name="uq_daily_stats_vendor_date"),)
 
 
 # PaidWeek
@@ -128,6 +198,7 @@ class Story(Base):
     """Stories efêmeras publicadas pelos vendedores."""
 
     __tablename__ = "stories"
+    __table_args__ = (Index("ix_stories_vendor_expires", "vendor_id", "expires_at"),)
 
     id = Column(Integer, primary_key=True, index=True)
     vendor_id = Column(Integer, ForeignKey("vendors.id"))
@@ -0,0 +1,80 @@
+# passwords.py - hash e verificação de passwords fora do event loop
+#
+# O bcrypt demora 100-300 ms por chamada. Corre num conjunto próprio de threads
+# (o bcrypt liberta o GIL), com um limite de chamadas em simultâneo, para que
+# uma rajada de logins não pare os WebSockets nem as atualizações de
+# localização nem ocupe todas as threads dos endpoints síncronos.
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+# PasswordHasher
+class PasswordHasher:
+    """Executa ``context.hash``/``context.verify`` em ``workers`` threads.
+
+    ``hash``/``verify`` são para endpoints síncronos (esperam pelo resultado na
+    thread do pedido); ``hash_async``/``verify_async`` para endpoints async.
+    """
+
+    # __init__
+    def __init__(self, context, workers: int = 2):
+        self.context = context
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password")
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.max_queued = 0
+        self.completed = 0
+
+    # _submit
+    def _submit(self, fn, *args) -> Future:
+        with self._lock:
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+        return self._executor.submit(self._run, fn, *args)
+
+    # _run
+    def _run(self, fn, *args):
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.completed += 1
+
+    # hash
+    def hash(self, password: str) -> str:
+        return self._submit(self.context.hash, password).result()
+
+    # verify
+    def verify(self, password: str, hashed: str) -> bool:
+        return self._submit(self.context.verify, password, hashed).result()
+
+    # hash_async
+    async def hash_async(self, password: str) -> str:
+        return await asyncio.wrap_future(self._submit(self.context.hash, password))
+
+    # verify_async
+    async def verify_async(self, password: str, hashed: str) -> bool:
+        return await asyncio.wrap_future(self._submit(self.context.verify, password, hashed))
+
+    # metrics
+    def metrics(self) -> dict:
+        """Threads, chamadas em curso, em fila (e o máximo já visto) e concluídas."""
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "active": self.active,
+                "queued": self.queued,
+                "max_queued": self.max_queued,
+                "completed": self.completed,
+            }
+
+    # shutdown
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,279 @@
+# pubsub.py - partilha dos eventos de localização entre workers
+#
+# Cada worker do uvicorn tem o seu ConnectionManager e o seu LiveLocationStore.
+# Os eventos publicados aqui chegam aos restantes workers, que os aplicam como
+# se a atualização tivesse sido feita localmente (mas sem a voltar a gravar).
+#   PUBSUB_URL vazio                 -> InProcessPubSub (um só processo)
+#   PUBSUB_URL=redis://host:6379     -> RedisPubSub (qualquer servidor RESP)
+import asyncio
+import json
+from typing import Callable
+from urllib.parse import unquote, urlparse
+from uuid import uuid4
+
+# Canal onde os workers trocam eventos
+DEFAULT_CHANNEL = "sunny_sales:locations"
+# Eventos à espera de serem publicados; acima disso são descartados
+MAX_QUEUED = 10000
+
+
+# RedisError
+class RedisError(Exception):
+    """Erro devolvido pelo servidor ou resposta inválida."""
+
+
+# encode_command
+def encode_command(*args: str | bytes) -> bytes:
+    """Codifica um comando no protocolo RESP."""
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+# read_reply
+async def read_reply(reader: asyncio.StreamReader):
+    """Lê uma resposta RESP (string, inteiro, bulk ou lista)."""
+    line = await reader.readuntil(b"\r\n")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest
+    if kind == b"-":
+        raise RedisError(rest.decode())
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        size = int(rest)
+        if size < 0:
+            return None
+        return (await reader.readexactly(size + 2))[:-2]
+    if kind == b"*":
+        size = int(rest)
+        if size < 0:
+            return None
+        return [await read_reply(reader) for _ in range(size)]
+    raise RedisError(f"Resposta inválida: {line!r}")
+
+
+# PubSub
+class PubSub:
+    """Base comum dos backends.
+
+    ``publish`` não bloqueia e pode ser chamado de qualquer thread (por exemplo
+    de um endpoint síncrono). Os eventos do próprio worker não lhe são
+    entregues: esse já os aplicou localmente.
+    """
+
+    # __init__
+    def __init__(self):
+        self.node_id = uuid4().hex
+        self.handler: Callable[[dict], None] | None = None
+        self.published = 0
+        self.received = 0
+        self.dropped = 0
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    # start
+    async def start(self, handler: Callable[[dict], None]):
+        self.handler = handler
+        self._loop = asyncio.get_running_loop()
+
+    # stop
+    async def stop(self):
+        self.handler = None
+        self._loop = None
+
+    # publish
+    def publish(self, event: dict):
+        loop = self._loop
+        if loop is None:
+            return
+        data = {**event, "src": self.node_id}
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._send(data)
+            return
+        try:
+            loop.call_soon_threadsafe(self._send, data)
+        except RuntimeError:
+            # o loop já fechou (a encerrar)
+            pass
+
+    # _send
+    def _send(self, data: dict):
+        raise NotImplementedError
+
+    # _deliver
+    def _deliver(self, data: dict):
+        if data.get("src") == self.node_id or self.handler is None:
+            return
+        self.received += 1
+        try:
+            self.handler(data)
+        except Exception as e:
+            print("❌ Erro ao aplicar evento de outro worker:", str(e))
+
+
+# InProcessBroker
+class InProcessBroker:
+    """Liga as instâncias de InProcessPubSub do mesmo processo."""
+
+    # __init__
+    def __init__(self):
+        self.nodes: set["InProcessPubSub"] = set()
+
+
+# Broker usado por omissão (um só worker)
+default_broker = InProcessBroker()
+
+
+# InProcessPubSub
+class InProcessPubSub(PubSub):
+    """Backend para um único processo: entrega aos outros nós do mesmo broker."""
+
+    # __init__
+    def __init__(self, broker: InProcessBroker | None = None):
+        super().__init__()
+        self.broker = broker or default_broker
+
+    # start
+    async def start(self, handler: Callable[[dict], None]):
+        await super().start(handler)
+        self.broker.nodes.add(self)
+
+    # stop
+    async def stop(self):
+        self.broker.nodes.discard(self)
+        await super().stop()
+
+    # _send
+    def _send(self, data: dict):
+        self.published += 1
+        for node in list(self.broker.nodes):
+            if node is not self and node._loop is not None:
+                node._loop.call_soon_threadsafe(node._deliver, data)
+
+
+# RedisPubSub
+class RedisPubSub(PubSub):
+    """Backend entre processos sobre o protocolo do Redis (PUBLISH/SUBSCRIBE).
+
+    Usa duas ligações: uma para publicar, em lote, os eventos acumulados e
+    outra subscrita ao canal. Se a ligação cair, volta a ligar; os eventos
+    perdidos entretanto não são repetidos (a posição seguinte substitui-os).
+    """
+
+    # __init__
+    def __init__(self, url: str, channel: str = DEFAULT_CHANNEL, reconnect_delay: float = 1.0):
+        super().__init__()
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.channel = channel
+        self.reconnect_delay = reconnect_delay
+        self.connected = asyncio.Event()
+        self._queue: asyncio.Queue[bytes] | None = None
+        self._tasks: list[asyncio.Task] = []
+
+    # start
+    async def start(self, handler: Callable[[dict], None]):
+        await super().start(handler)
+        self.connected = asyncio.Event()
+        self._queue = asyncio.Queue(MAX_QUEUED)
+        self._tasks = [
+            asyncio.create_task(self._run_publisher()),
+            asyncio.create_task(self._run_subscriber()),
+        ]
+
+    # stop
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await super().stop()
+
+    # _send
+    def _send(self, data: dict):
+        try:
+            self._queue.put_nowait(json.dumps(data, separators=(",", ":")).encode())
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    # _connect
+    async def _connect(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            writer.write(encode_command("AUTH", self.password))
+            await writer.drain()
+            await read_reply(reader)
+        return reader, writer
+
+    # _run_publisher
+    async def _run_publisher(self):
+        while True:
+            try:
+                reader, writer = await self._connect()
+                try:
+                    while True:
+                        batch = [await self._queue.get()]
+                        while not self._queue.empty():
+                            batch.append(self._queue.get_nowait())
+                        writer.write(b"".join(encode_command("PUBLISH", self.channel, m) for m in batch))
+                        await writer.drain()
+                        for _ in batch:
+                            await read_reply(reader)
+                        self.published += len(batch)
+                finally:
+                    writer.close()
+            except asyncio.CancelledError:
+                raise
+            except (OSError, asyncio.IncompleteReadError, RedisError) as e:
+                print("❌ Ligação de publicação ao pub/sub perdida:", str(e))
+                await asyncio.sleep(self.reconnect_delay)
+
+    # _run_subscriber
+    async def _run_subscriber(self):
+        while True:
+            try:
+                reader, writer = await self._connect()
+                try:
+                    writer.write(encode_command("SUBSCRIBE", self.channel))
+                    await writer.drain()
+                    while True:
+                        reply = await read_reply(reader)
+                        if not isinstance(reply, list) or len(reply) != 3:
+                            continue
+                        if reply[0] == b"subscribe":
+                            self.connected.set()
+                        elif reply[0] == b"message":
+                            try:
+                                data = json.loads(reply[2])
+                            except ValueError:
+                                continue
+                            self._deliver(data)
+                finally:
+                    self.connected.clear()
+                    writer.close()
+            except asyncio.CancelledError:
+                raise
+            except (OSError, asyncio.IncompleteReadError, RedisError, ValueError) as e:
+                print("❌ Subscrição do pub/sub perdida:", str(e))
+                await asyncio.sleep(self.reconnect_delay)
+
+
+# create_pubsub
+def create_pubsub(url: str | None, channel: str = DEFAULT_CHANNEL) -> PubSub:
+    """Escolhe o backend a partir de ``PUBSUB_URL``."""
+    if not url:
+        return InProcessPubSub()
+    scheme = urlparse(url).scheme
+    if scheme == "redis":
+        return RedisPubSub(url, channel)
+    raise ValueError(f"PUBSUB_URL não suportado: {url}")
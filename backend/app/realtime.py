@@ -0,0 +1,443 @@
+# realtime.py - distribuição das localizações pelos WebSockets ligados
+import asyncio
+import itertools
+import json
+from collections import OrderedDict, deque
+from typing import Callable
+from uuid import uuid4
+
+from fastapi import WebSocket
+
+from .geo import geohash_encode, geohash_cover, cover_cell_count
+
+# Precisão (carateres) das células geohash usadas no índice de subscrições
+INDEX_PRECISION = 5
+# Máximo de células indexadas por subscrição; acima disso baixa a precisão
+MAX_AREA_CELLS = 64
+
+
+# Formatos de mensagem que o cliente pode pedir em /ws/locations?format=
+FORMATS = ("json", "array")
+# Limites (segundos) do intervalo de agrupamento pedido em ?batch_ms=
+MIN_BATCH_INTERVAL = 0.5
+MAX_BATCH_INTERVAL = 2.0
+# Eventos guardados para retomar ligações com ?since=
+HISTORY_SIZE = 5000
+
+
+# LocationEvent
+class LocationEvent:
+    """Mensagem a distribuir, codificada uma única vez por formato.
+
+    ``json`` é o objeto original (``{"vendor_id", "lat", "lng"}``); ``array`` é
+    a forma compacta ``[vendor_id, lat, lng]``, usada só para localizações.
+    Para clientes em modo sequenciado é acrescentado o número de sequência
+    (``"seq"`` no objeto, último elemento na lista).
+    """
+
+    __slots__ = ("payload", "vendor_id", "seq", "_frames")
+
+    # __init__
+    def __init__(self, payload: dict, seq: int | None = None):
+        self.payload = payload
+        self.vendor_id = payload.get("vendor_id")
+        self.seq = seq
+        self._frames: dict[tuple[str, bool], str] = {}
+
+    # frame
+    def frame(self, fmt: str, sequenced: bool = False) -> str:
+        sequenced = sequenced and self.seq is not None
+        text = self._frames.get((fmt, sequenced))
+        if text is None:
+            if fmt == "array" and self.vendor_id is not None and "type" not in self.payload:
+                data = [self.vendor_id, self.payload.get("lat"), self.payload.get("lng")]
+                if sequenced:
+                    data.append(self.seq)
+            elif sequenced:
+                data = {**self.payload, "seq": self.seq}
+            else:
+                data = self.payload
+            text = json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+            self._frames[(fmt, sequenced)] = text
+        return text
+
+
+# Area
+class Area:
+    """Zona do mapa que um cliente está a ver: caixa ou lista de geohashes."""
+
+    # __init__
+    def __init__(self, bbox: tuple[float, float, float, float] | None = None, geohashes: list[str] | None = None):
+        self.bbox = bbox
+        self.geohashes = tuple(g.lower() for g in geohashes or ())
+        if bbox:
+            south, west, north, east = bbox
+            precision = INDEX_PRECISION
+            while precision > 1 and cover_cell_count(south, west, north, east, precision) > MAX_AREA_CELLS:
+                precision -= 1
+            self.cells = geohash_cover(south, west, north, east, precision)
+        else:
+            self.cells = {g[:INDEX_PRECISION] for g in self.geohashes}
+
+    @classmethod
+    # from_message
+    def from_message(cls, data: dict) -> "Area | None":
+        """Interpreta ``{"bbox": [s, w, n, e]}`` ou ``{"geohashes": [...]}``."""
+        bbox = data.get("bbox")
+        geohashes = data.get("geohashes")
+        if bbox:
+            south, west, north, east = (float(v) for v in bbox)
+            if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+                raise ValueError("invalid bbox")
+            return cls(bbox=(south, west, north, east))
+        if geohashes:
+            if not all(isinstance(g, str) and g for g in geohashes):
+                raise ValueError("invalid geohashes")
+            return cls(geohashes=geohashes)
+        return None
+
+    # contains
+    def contains(self, lat: float, lng: float) -> bool:
+        if self.bbox:
+            south, west, north, east = self.bbox
+            in_lng = west <= lng <= east if west <= east else (lng >= west or lng <= east)
+            return south <= lat <= north and in_lng
+        cell = geohash_encode(lat, lng, max(len(g) for g in self.geohashes))
+        return any(cell.startswith(g) for g in self.geohashes)
+
+
+# batch_frame
+def batch_frame(events: list[LocationEvent], fmt: str, sequenced: bool = False) -> str:
+    """Junta vários eventos numa só mensagem, reutilizando o texto já codificado."""
+    frames = ",".join(event.frame(fmt, sequenced) for event in events)
+    if fmt == "array":
+        return f"[{frames}]"
+    return f'{{"type":"batch","updates":[{frames}]}}'
+
+
+# Subscriber
+class Subscriber:
+    """Fila de envio de um WebSocket, servida por uma tarefa própria.
+
+    A fila guarda no máximo uma mensagem por vendedor: uma atualização nova
+    substitui a que ainda não foi enviada. Se mesmo assim passar de
+    ``max_pending``, as mensagens mais antigas são descartadas.
+
+    Com ``batch_interval`` as atualizações acumuladas durante cada intervalo
+    seguem numa única mensagem com a última posição de cada vendedor.
+
+    Em modo sequenciado (``snapshot`` definido) a fila nunca perde eventos em
+    silêncio: se transbordar é substituída por um snapshot novo.
+    """
+
+    _keys = itertools.count()
+
+    # __init__
+    def __init__(
+        self,
+        websocket: WebSocket,
+        max_pending: int,
+        fmt: str = "json",
+        batch_interval: float | None = None,
+        snapshot: Callable[["Subscriber"], str] | None = None,
+    ):
+        self.websocket = websocket
+        self.format = fmt
+        self.batch_interval = batch_interval
+        self.snapshot = snapshot
+        self.sequenced = snapshot is not None
+        self.needs_snapshot = False
+        self.max_pending = max_pending
+        self.pending: OrderedDict = OrderedDict()
+        self.dropped = 0
+        self.area: Area | None = None
+        # instante (loop.time) em que começou o envio em curso
+        self.sending_since: float | None = None
+        self._ready = asyncio.Event()
+        self.task: asyncio.Task | None = None
+
+    # push
+    def push(self, event: LocationEvent):
+        key = event.vendor_id
+        if key is None:
+            key = ("_", next(self._keys))
+        self.pending.pop(key, None)
+        self.pending[key] = event
+        if len(self.pending) > self.max_pending:
+            if self.sequenced:
+                self.dropped += len(self.pending)
+                self.request_snapshot()
+                return
+            while len(self.pending) > self.max_pending:
+                self.pending.popitem(last=False)
+                self.dropped += 1
+        self._ready.set()
+
+    # request_snapshot
+    def request_snapshot(self):
+        """Descarta a fila e envia o estado completo na próxima escrita."""
+        self.pending.clear()
+        self.needs_snapshot = True
+        self._ready.set()
+
+    # run
+    async def run(self):
+        while True:
+            await self._ready.wait()
+            if self.batch_interval and not self.needs_snapshot:
+                await asyncio.sleep(self.batch_interval)
+            self._ready.clear()
+            if self.needs_snapshot:
+                # o snapshot já inclui tudo o que estava na fila
+                self.needs_snapshot = False
+                self.pending.clear()
+                await self._send(self.snapshot(self))
+                continue
+            if self.batch_interval:
+                events = list(self.pending.values())
+                self.pending.clear()
+                updates = [e for e in events if e.vendor_id is not None]
+                for event in events:
+                    if event.vendor_id is None:
+                        await self._send(event.frame(self.format))
+                if updates:
+                    await self._send(batch_frame(updates, self.format, self.sequenced))
+                continue
+            while self.pending and not self.needs_snapshot:
+                _, event = self.pending.popitem(last=False)
+                await self._send(event.frame(self.format, self.sequenced))
+
+    # _send
+    async def _send(self, text: str):
+        self.sending_since = asyncio.get_running_loop().time()
+        await self.websocket.send_text(text)
+        self.sending_since = None
+
+
+# ConnectionManager
+class ConnectionManager:
+    """Liga os WebSockets às atualizações dos vendedores.
+
+    Clientes sem zona recebem tudo; os restantes ficam indexados pelas células
+    geohash da zona que enviaram e só recebem vendedores dessa zona.
+
+    Cada atualização de vendedor recebe um número de sequência. Os clientes em
+    modo sequenciado recebem primeiro um snapshot dos vendedores ativos e
+    depois só as alterações; ao voltar a ligar com ``since``/``epoch`` recebem
+    apenas o que perderam, se ainda estiver no histórico.
+    """
+
+    # __init__
+    def __init__(self, max_pending: int = 500, send_timeout: float = 10.0, history_size: int = HISTORY_SIZE):
+        self.max_pending = max_pending
+        self.send_timeout = send_timeout
+        # identifica esta instância: números de sequência só valem dentro dela
+        self.epoch = uuid4().hex[:8]
+        self.seq = 0
+        self.history: deque[LocationEvent] = deque(maxlen=history_size)
+        self.subscribers: dict[WebSocket, Subscriber] = {}
+        self.unfiltered: set[Subscriber] = set()
+        self.cells: dict[str, set[Subscriber]] = {}
+        self.vendor_positions: dict[int, tuple[float, float, str]] = {}
+        self._watchdog: asyncio.Task | None = None
+
+    @property
+    # active_connections
+    def active_connections(self) -> list[WebSocket]:
+        return list(self.subscribers)
+
+    # connect
+    async def connect(
+        self,
+        websocket: WebSocket,
+        fmt: str = "json",
+        batch_interval: float | None = None,
+        area: Area | None = None,
+        sequenced: bool = False,
+        since: int | None = None,
+        epoch: str | None = None,
+    ):
+        await websocket.accept()
+        if batch_interval is not None:
+            batch_interval = min(max(batch_interval, MIN_BATCH_INTERVAL), MAX_BATCH_INTERVAL)
+        subscriber = Subscriber(
+            websocket,
+            self.max_pending,
+            fmt if fmt in FORMATS else "json",
+            batch_interval,
+            self.snapshot_frame if sequenced else None,
+        )
+        self.subscribers[websocket] = subscriber
+        self._index(subscriber, area)
+        if sequenced:
+            missed = self.events_since(since, epoch)
+            if missed is None:
+                subscriber.request_snapshot()
+            for event in missed or ():
+                position = event.payload.get("lat"), event.payload.get("lng")
+                if area is None or None in position or area.contains(*position):
+                    subscriber.push(event)
+        subscriber.task = asyncio.create_task(self._write(subscriber))
+        if self._watchdog is None or self._watchdog.done():
+            self._watchdog = asyncio.create_task(self._watch_slow_sends())
+
+    # events_since
+    def events_since(self, since: int | None, epoch: str | None) -> list[LocationEvent] | None:
+        """Eventos posteriores a ``since`` ou ``None`` se já não for possível retomar."""
+        if since is None or epoch != self.epoch or since > self.seq:
+            return None
+        if since == self.seq:
+            return []
+        if not self.history or since < self.history[0].seq - 1:
+            return None
+        start = since + 1 - self.history[0].seq
+        return list(itertools.islice(self.history, start, None))
+
+    # snapshot_frame
+    def snapshot_frame(self, subscriber: Subscriber) -> str:
+        """Vendedores ativos (na zona do cliente) como ``[vendor_id, lat, lng]``."""
+        area = subscriber.area
+        vendors = [
+            [vendor_id, lat, lng]
+            for vendor_id, (lat, lng, _) in self.vendor_positions.items()
+            if area is None or area.contains(lat, lng)
+        ]
+        return json.dumps(
+            {"type": "snapshot", "epoch": self.epoch, "seq": self.seq, "vendors": vendors},
+            separators=(",", ":"),
+        )
+
+    # load_positions
+    def load_positions(self, positions):
+        """Carrega posições ``(vendor_id, lat, lng)`` já conhecidas, p.ex. no arranque."""
+        for vendor_id, lat, lng in positions:
+            if lat is not None and lng is not None:
+                self.vendor_positions[vendor_id] = (lat, lng, geohash_encode(lat, lng, INDEX_PRECISION))
+
+    # _write
+    async def _write(self, subscriber: Subscriber):
+        try:
+            await subscriber.run()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # ligação fechada
+            self.disconnect(subscriber.websocket)
+            await self._close(subscriber.websocket)
+
+    # _close
+    async def _close(self, websocket: WebSocket):
+        try:
+            await websocket.close()
+        except Exception:
+            pass
+
+    # _watch_slow_sends
+    async def _watch_slow_sends(self):
+        """Fecha as ligações com um envio parado há mais de ``send_timeout``.
+
+        Uma única tarefa verifica todas as ligações, em vez de um timeout por
+        mensagem enviada.
+        """
+        loop = asyncio.get_running_loop()
+        while self.subscribers:
+            await asyncio.sleep(self.send_timeout / 2)
+            now = loop.time()
+            for subscriber in list(self.subscribers.values()):
+                if subscriber.sending_since is not None and now - subscriber.sending_since > self.send_timeout:
+                    self.disconnect(subscriber.websocket)
+                    asyncio.create_task(self._close(subscriber.websocket))
+
+    # disconnect
+    def disconnect(self, websocket: WebSocket):
+        subscriber = self.subscribers.pop(websocket, None)
+        if not subscriber:
+            return
+        self._unindex(subscriber)
+        if subscriber.task and subscriber.task is not asyncio.current_task():
+            subscriber.task.cancel()
+
+    # send_to
+    def send_to(self, websocket: WebSocket, message: dict):
+        subscriber = self.subscribers.get(websocket)
+        if subscriber:
+            subscriber.push(LocationEvent(message))
+
+    # set_area
+    def set_area(self, websocket: WebSocket, area: Area | None):
+        """Define a zona seguida por uma ligação (``None`` volta a receber tudo).
+
+        Clientes em modo sequenciado recebem um snapshot da zona nova.
+        """
+        subscriber = self.subscribers.get(websocket)
+        if not subscriber:
+            return
+        self._unindex(subscriber)
+        self._index(subscriber, area)
+        if subscriber.sequenced:
+            subscriber.request_snapshot()
+
+    # _index
+    def _index(self, subscriber: Subscriber, area: Area | None):
+        subscriber.area = area
+        if area is None:
+            self.unfiltered.add(subscriber)
+            return
+        for cell in area.cells:
+            self.cells.setdefault(cell, set()).add(subscriber)
+
+    # _unindex
+    def _unindex(self, subscriber: Subscriber):
+        self.unfiltered.discard(subscriber)
+        if subscriber.area:
+            for cell in subscriber.area.cells:
+                members = self.cells.get(cell)
+                if members:
+                    members.discard(subscriber)
+                    if not members:
+                        del self.cells[cell]
+
+    # _subscribers_for
+    def _subscribers_for(self, cell: str | None) -> set[Subscriber]:
+        found = set()
+        if cell:
+            for length in range(1, len(cell) + 1):
+                found |= self.cells.get(cell[:length], set())
+        return found
+
+    # broadcast
+    def broadcast(self, message: dict):
+        """Coloca a mensagem na fila das ligações interessadas e retorna de imediato.
+
+        Quem estava a ver a posição anterior do vendedor também recebe a
+        atualização, para saber que ele saiu da zona. A mensagem é codificada
+        uma vez por formato e o mesmo texto é enviado a todas as ligações.
+        Deve ser chamado a partir do event loop.
+        """
+        vendor_id = message.get("vendor_id")
+        if vendor_id is None:
+            event = LocationEvent(message)
+        else:
+            self.seq += 1
+            event = LocationEvent(message, self.seq)
+            self.history.append(event)
+        lat, lng = message.get("lat"), message.get("lng")
+        previous = self.vendor_positions.get(vendor_id)
+        if lat is None or lng is None:
+            current = None
+            self.vendor_positions.pop(vendor_id, None)
+        else:
+            current = (lat, lng, geohash_encode(lat, lng, INDEX_PRECISION))
+            self.vendor_positions[vendor_id] = current
+
+        for subscriber in self.unfiltered:
+            subscriber.push(event)
+        if not self.cells:
+            return
+        candidates = set()
+        for position in (current, previous):
+            if position:
+                candidates |= self._subscribers_for(position[2])
+        for subscriber in candidates:
+            if any(p and subscriber.area.contains(p[0], p[1]) for p in (current, previous)):
+                subscriber.push(event)
@@ -1,6 +1,7 @@
 # schemas.py - define os formatos de dados para entrada e saída
 from pydantic import BaseModel
 from typing import Optional, Literal
+from datetime import date, datetime
 
 # UserLogin
 class UserLogin(BaseModel):
@@ -35,14 +36,21 @@ class VendorOut(BaseModel):
     current_lat: Optional[float] = None
     current_lng: Optional[float] = None
     rating_average: Optional[float] = None
+    # {"64": {"webp": ..., "jpeg": ...}, "256": ..., "1024": ...}
+    profile_photo_variants: Optional[dict[str, dict[str, str]]] = None
     subscription_active: Optional[bool] = None
-    subscription_valid_until: Optional[str] = None
-    last_seen: Optional[str] = None
+    subscription_valid_until: Optional[datetime] = None
+    last_seen: Optional[datetime] = None
     # Config
     class Config:
         orm_mode = True
 
 
+# NearbyVendorOut
+class NearbyVendorOut(VendorOut):
+    distance_m: float
+
+
 # ClientCreate
 class ClientCreate(BaseModel):
     name: str
@@ -57,6 +65,7 @@ class ClientOut(BaseModel):
     name: str
     email: str
     profile_photo: str
+    profile_photo_variants: Optional[dict[str, dict[str, str]]] = None
 
     # Config
     class Config:
@@ -97,14 +106,41 @@ class RoutePoint(BaseModel):
     t: str
 
 
-# RouteOut
-class RouteOut(BaseModel):
+# RouteSummaryOut
+class RouteSummaryOut(BaseModel):
     id: int
     start_time: str
     end_time: Optional[str]
     distance_m: float
+
+    # Config
+    class Config:
+        orm_mode = True
+
+
+# RouteOut
+class RouteOut(RouteSummaryOut):
     points: list[RoutePoint]
 
+
+# RouteStatsOut
+class RouteStatsOut(BaseModel):
+    id: int
+    distance_m: float
+    duration_s: float
+    avg_speed_mps: Optional[float] = None
+    max_speed_mps: Optional[float] = None
+    # [sul, oeste, norte, este]
+    bbox: Optional[list[float]] = None
+
+
+# DailyStatOut
+class DailyStatOut(BaseModel):
+    date: date
+    distance_m: float
+    active_seconds: float
+    route_count: int
+
     # Config
     class Config:
         orm_mode = True
@@ -113,8 +149,8 @@ class RouteOut(BaseModel):
 # PaidWeekOut
 class PaidWeekOut(BaseModel):
     id: int
-    start_date: str
-    end_date: str
+    start_date: datetime
+    end_date: datetime
     receipt_url: Optional[str] = None
 
     # Config
@@ -131,3 +167,9 @@ class StoryOut(BaseModel):
     # Config
     class Config:
         orm_mode = True
+
+
+# VendorStoriesOut
+class VendorStoriesOut(BaseModel):
+    vendor_id: int
+    stories: list[StoryOut]
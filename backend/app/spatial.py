@@ -0,0 +1,65 @@
+# spatial.py - índice espacial das posições dos vendedores ativos
+from .geo import bounding_box, cover_cell_count, geohash_cover, geohash_encode
+from .geometry import within_radius
+
+# Precisão (carateres) das células do índice: ~4,9 x 4,9 km
+INDEX_PRECISION = 5
+# Acima deste número de células a pesquisa percorre todos os vendedores
+MAX_QUERY_CELLS = 64
+
+
+# GeoIndex
+class GeoIndex:
+    """Grelha geohash em memória: cada célula guarda os vendedores lá dentro.
+
+    Uma pesquisa por raio só olha para as células que cobrem a caixa do círculo
+    e calcula a distância de todos os candidatos de uma vez (``within_radius``).
+    """
+
+    # __init__
+    def __init__(self, precision: int = INDEX_PRECISION):
+        self.precision = precision
+        self.cells: dict[str, set[int]] = {}
+        self.points: dict[int, tuple[float, float, str]] = {}
+
+    # __len__
+    def __len__(self) -> int:
+        return len(self.points)
+
+    # update
+    def update(self, vendor_id: int, lat: float, lng: float):
+        cell = geohash_encode(lat, lng, self.precision)
+        previous = self.points.get(vendor_id)
+        if previous and previous[2] != cell:
+            self._discard(vendor_id, previous[2])
+        self.points[vendor_id] = (lat, lng, cell)
+        self.cells.setdefault(cell, set()).add(vendor_id)
+
+    # remove
+    def remove(self, vendor_id: int):
+        previous = self.points.pop(vendor_id, None)
+        if previous:
+            self._discard(vendor_id, previous[2])
+
+    # _discard
+    def _discard(self, vendor_id: int, cell: str):
+        members = self.cells.get(cell)
+        if members:
+            members.discard(vendor_id)
+            if not members:
+                del self.cells[cell]
+
+    # nearby
+    def nearby(self, lat: float, lng: float, radius_m: float) -> list[tuple[int, float]]:
+        """Vendedores a menos de ``radius_m`` metros, como ``(vendor_id, distância)``
+        ordenados do mais próximo para o mais afastado."""
+        south, west, north, east = bounding_box(lat, lng, radius_m)
+        if cover_cell_count(south, west, north, east, self.precision) > MAX_QUERY_CELLS:
+            candidates = self.points.keys()
+        else:
+            candidates = set()
+            for cell in geohash_cover(south, west, north, east, self.precision):
+                candidates |= self.cells.get(cell, set())
+        ids = list(candidates)
+        points = [self.points[vendor_id] for vendor_id in ids]
+        return within_radius(lat, lng, ids, [p[0] for p in points], [p[1] for p in points], radius_m)
@@ -0,0 +1,47 @@
+# stats.py - totais diários de distância por vendedor
+#
+# Cada trajeto conta para o dia (UTC) em que começou. Os totais são somados
+# quando o trajeto fecha, para que o gráfico de estatísticas não tenha de ler
+# trajetos nem pontos.
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import models
+
+
+# route_activity
+def route_activity(route: models.Route) -> tuple[float, float]:
+    """Distância e segundos ativos de um trajeto fechado."""
+    seconds = 0.0
+    if route.start_time and route.end_time:
+        seconds = max((route.end_time - route.start_time).total_seconds(), 0.0)
+    return route.distance_m or 0.0, seconds
+
+
+# add_route_to_daily_stats
+def add_route_to_daily_stats(db: Session, route: models.Route):
+    """Soma um trajeto que fechou ao total do seu dia (na transação de ``db``)."""
+    distance, seconds = route_activity(route)
+    day = (route.start_time or datetime.utcnow()).date()
+    values = {
+        models.DailyStat.distance_m: models.DailyStat.distance_m + distance,
+        models.DailyStat.active_seconds: models.DailyStat.active_seconds + seconds,
+        models.DailyStat.route_count: models.DailyStat.route_count + 1,
+    }
+    match = db.query(models.DailyStat).filter(
+        models.DailyStat.vendor_id == route.vendor_id, models.DailyStat.date == day
+    )
+    if match.update(values, synchronize_session=False):
+        return
+    try:
+        # outro worker pode criar a mesma linha ao mesmo tempo
+        with db.begin_nested():
+            db.add(
+                models.DailyStat(
+                    vendor_id=route.vendor_id, date=day, distance_m=distance, active_seconds=seconds, route_count=1
+                )
+            )
+    except IntegrityError:
+        match.update(values, synchronize_session=False)
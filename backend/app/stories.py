@@ -0,0 +1,108 @@
+# stories.py - remoção das stories expiradas
+#
+# As stories duram 2 horas. Em vez de as deixar acumular (e filtrar por
+# expires_at em cada leitura), um sweeper periódico apaga de uma vez as linhas
+# expiradas e, a seguir, os ficheiros da pasta que nenhuma story usa.
+#
+# Os ficheiros são partilhados (o nome é o hash do conteúdo, ver uploads.py) e
+# um upload do mesmo conteúdo pode voltar a gravá-lo a qualquer momento, antes
+# de a story nova existir na base de dados. Por isso só se apagam ficheiros
+# sem stories e sem alterações há FILE_GRACE_SECONDS, e a data é verificada de
+# novo depois de o ficheiro ser afastado do caminho público (_remove_if_stale).
+import asyncio
+import os
+import time
+from datetime import datetime
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from . import models
+
+# Linhas apagadas por DELETE
+SWEEP_BATCH = 500
+# Um ficheiro gravado há menos tempo do que isto não é apagado: pode estar a
+# ser associado a uma story nova
+FILE_GRACE_SECONDS = 600
+# Prefixo do ficheiro enquanto é apagado (os temporários começam por ".")
+TRASH_PREFIX = ".sweep-"
+
+
+# _remove_if_stale
+def _remove_if_stale(path: str, cutoff: float) -> bool:
+    """Apaga ``path`` se não foi gravado depois de ``cutoff``.
+
+    O ficheiro é primeiro renomeado e a data vista já fora do caminho: se um
+    upload o substituiu antes disso, a data é recente e volta ao lugar (o
+    conteúdo é o mesmo); se o substituiu depois, o novo fica e só o antigo é
+    apagado.
+    """
+    trash = os.path.join(os.path.dirname(path), TRASH_PREFIX + os.path.basename(path))
+    try:
+        os.rename(path, trash)
+    except FileNotFoundError:
+        return False
+    if os.path.getmtime(trash) >= cutoff:
+        os.replace(trash, path)
+        return False
+    os.unlink(trash)
+    return True
+
+
+# expire_stories
+def expire_stories(db: Session, directory: str, now: datetime | None = None) -> tuple[int, int]:
+    """Apaga as stories expiradas e os ficheiros de ``directory`` que nenhuma
+    story usa; devolve (linhas, ficheiros).
+
+    A pasta é sempre percorrida, por isso um ficheiro poupado pelo período de
+    graça (ou deixado por uma story que nunca chegou a ser gravada) é apagado
+    num sweep seguinte.
+    """
+    now = now or datetime.utcnow()
+    ids = list(db.scalars(select(models.Story.id).where(models.Story.expires_at <= now)))
+    for start in range(0, len(ids), SWEEP_BATCH):
+        db.execute(delete(models.Story).where(models.Story.id.in_(ids[start:start + SWEEP_BATCH])))
+    db.commit()
+
+    # as stories que restam são só as das últimas 2 horas
+    in_use = {os.path.basename(path) for path in db.scalars(select(models.Story.media_path).distinct()) if path}
+    cutoff = time.time() - FILE_GRACE_SECONDS
+    removed = 0
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not entry.is_file(follow_symlinks=False) or entry.name in in_use:
+                continue
+            try:
+                if entry.stat().st_mtime >= cutoff:
+                    continue
+                if entry.name.startswith("."):
+                    # temporários abandonados (uploads interrompidos, sweeps a meio)
+                    os.unlink(entry.path)
+                    continue
+            except FileNotFoundError:
+                continue
+            if _remove_if_stale(entry.path, cutoff):
+                removed += 1
+    return len(ids), removed
+
+
+# run_story_sweeper
+async def run_story_sweeper(session_factory, interval: float, directory: str):
+    """Corre expire_stories a cada ``interval`` segundos."""
+
+    # sweep
+    def sweep():
+        db = session_factory()
+        try:
+            return expire_stories(db, directory)
+        except Exception as e:
+            db.rollback()
+            print("❌ Erro ao apagar stories expiradas:", str(e))
+            return 0, 0
+        finally:
+            db.close()
+
+    # o primeiro sweep só ao fim de um intervalo, não durante o arranque
+    while True:
+        await asyncio.sleep(interval)
+        await asyncio.to_thread(sweep)
@@ -0,0 +1,63 @@
+# subscriptions.py - expiração das subscrições em segundo plano
+#
+# Os pedidos só comparam subscription_valid_until com a hora atual; marcar as
+# subscrições expiradas como inativas é feito aqui, num único UPDATE periódico,
+# para que as atualizações de localização nunca escrevam na base de dados.
+import asyncio
+from datetime import datetime
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from . import models
+
+
+# subscription_is_valid
+def subscription_is_valid(active: bool, valid_until: datetime | None, now: datetime | None = None) -> bool:
+    """Subscrição ativa e ainda dentro da validade (sem validade conta como válida)."""
+    if not active:
+        return False
+    return valid_until is None or valid_until >= (now or datetime.utcnow())
+
+
+# expire_subscriptions
+def expire_subscriptions(db: Session, now: datetime | None = None) -> list[int]:
+    """Desativa de uma vez as subscrições expiradas e devolve os vendedores afetados."""
+    expired = (
+        models.Vendor.subscription_active == True,
+        models.Vendor.subscription_valid_until < (now or datetime.utcnow()),
+    )
+    vendor_ids = db.scalars(select(models.Vendor.id).where(*expired)).all()
+    if vendor_ids:
+        db.execute(
+            update(models.Vendor)
+            .where(models.Vendor.id.in_(vendor_ids), *expired)
+            .values(subscription_active=False)
+        )
+        db.commit()
+    return list(vendor_ids)
+
+
+# run_subscription_sweeper
+async def run_subscription_sweeper(session_factory, interval: float, on_expired=None):
+    """Corre expire_subscriptions a cada ``interval`` segundos; ``on_expired``
+    recebe os ids desativados (por exemplo para limpar caches)."""
+
+    # sweep
+    def sweep() -> list[int]:
+        db = session_factory()
+        try:
+            return expire_subscriptions(db)
+        except Exception as e:
+            db.rollback()
+            print("❌ Erro ao expirar subscrições:", str(e))
+            return []
+        finally:
+            db.close()
+
+    # a primeira verificação só ao fim de um intervalo, não durante o arranque
+    while True:
+        await asyncio.sleep(interval)
+        vendor_ids = await asyncio.to_thread(sweep)
+        if vendor_ids and on_expired:
+            on_expired(vendor_ids)
@@ -0,0 +1,121 @@
+# uploads.py - gravação dos ficheiros enviados (fotos de perfil e stories)
+#
+# O ficheiro é lido em blocos e escrito num ficheiro temporário fora do event
+# loop; o limite de tamanho é verificado a cada bloco e só no fim o ficheiro é
+# renomeado (de forma atómica) para o nome definitivo. Um upload cancelado ou
+# demasiado grande nunca deixa ficheiros a meio na pasta servida.
+#
+# O tamanho do pedido inteiro é limitado antes disso (UploadSizeLimit): o
+# FastAPI lê o formulário todo para disco antes de chamar o endpoint, por isso
+# um pedido demasiado grande é recusado logo pelo Content-Length ou assim que
+# passar do limite, sem ser gravado.
+#
+# O nome definitivo é o SHA-256 do conteúdo: o mesmo ficheiro enviado duas
+# vezes ocupa o disco uma só vez e, como um nome nunca muda de conteúdo, pode
+# ficar em cache para sempre (ver media.py).
+import asyncio
+import hashlib
+import os
+import re
+import tempfile
+
+from fastapi import HTTPException, UploadFile
+from starlette.middleware.body_limit import RequestBodyLimitResponder
+
+# Tamanho de cada bloco lido do upload
+CHUNK_SIZE = 1024 * 1024
+
+
+# Extensões aceites no nome do ficheiro (as outras são descartadas)
+SAFE_EXTENSION = re.compile(r"\.[A-Za-z0-9]{1,10}")
+
+# Permissões dos ficheiros publicados: as de um ficheiro criado normalmente
+# (os temporários nascem com 0600 e um servidor web ou CDN com outro
+# utilizador não os conseguiria ler)
+_umask = os.umask(0)
+os.umask(_umask)
+FILE_MODE = 0o666 & ~_umask
+
+# Margem para os restantes campos do formulário e cabeçalhos multipart
+FORM_OVERHEAD_BYTES = 64 * 1024
+
+
+# UploadSizeLimit
+class UploadSizeLimit:
+    """Middleware ASGI: recusa com 413 os pedidos cujo corpo passa do limite
+    devolvido por ``limit_for(scope)`` (``None`` = sem limite), antes de o
+    formulário ser lido."""
+
+    # __init__
+    def __init__(self, app, limit_for):
+        self.app = app
+        self.limit_for = limit_for
+
+    # __call__
+    async def __call__(self, scope, receive, send):
+        limit = self.limit_for(scope) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+        await RequestBodyLimitResponder(self.app, limit)(scope, receive, send)
+
+
+# _write
+def _write(tmp, digest, chunk: bytes):
+    tmp.write(chunk)
+    digest.update(chunk)
+
+
+# _commit
+def _commit(tmp, final_path: str):
+    # mesmo que o conteúdo já exista é substituído (continua a ocupar o disco
+    # uma só vez): o ficheiro fica com data recente e, se o sweeper das
+    # stories o tiver acabado de apagar, volta a existir (ver stories.py)
+    tmp.flush()
+    os.fchmod(tmp.fileno(), FILE_MODE)
+    os.fsync(tmp.fileno())
+    tmp.close()
+    os.replace(tmp.name, final_path)
+
+
+# _discard
+def _discard(tmp):
+    tmp.close()
+    try:
+        os.unlink(tmp.name)
+    except FileNotFoundError:
+        pass
+
+
+# save_upload
+async def save_upload(upload: UploadFile, directory: str, max_bytes: int) -> str:
+    """Grava ``upload`` em ``directory`` e devolve o nome do ficheiro
+    (``<sha256><extensão>``), que pode já existir.
+
+    Responde 413 assim que passar de ``max_bytes``.
+    """
+    ext = os.path.splitext(upload.filename or "")[1].lower()
+    if not SAFE_EXTENSION.fullmatch(ext):
+        ext = ""
+    digest = hashlib.sha256()
+    # na mesma pasta, para o os.replace não atravessar sistemas de ficheiros
+    tmp = await asyncio.to_thread(
+        tempfile.NamedTemporaryFile, dir=directory, prefix=".upload-", delete=False
+    )
+    written = 0
+    try:
+        while True:
+            chunk = await upload.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            written += len(chunk)
+            if written > max_bytes:
+                raise HTTPException(status_code=413, detail="File too large")
+            await asyncio.to_thread(_write, tmp, digest, chunk)
+        file_name = f"{digest.hexdigest()}{ext}"
+        await asyncio.to_thread(_commit, tmp, os.path.join(directory, file_name))
+    except BaseException:
+        # também em cancelamentos: fechar e apagar é rápido, pode ser já aqui
+        _discard(tmp)
+        raise
+    return file_name
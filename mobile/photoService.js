@@ -0,0 +1,14 @@
+// Serviço para escolher a versão da foto de perfil adequada ao tamanho mostrado
+import { BASE_URL } from './config';
+
+// photoUrl
+// size: 64 (pins do mapa), 256 (listas) ou 1024 (detalhe); usa a foto
+// original enquanto as versões ainda não foram geradas
+export function photoUrl(item, size = 256) {
+  if (!item || !item.profile_photo) return null;
+  // base
+  const base = BASE_URL.replace(/\/$/, '');
+  // variant
+  const variant = item.profile_photo_variants && item.profile_photo_variants[String(size)];
+  return `${base}/${variant ? variant.jpeg : item.profile_photo}`;
+}
@@ -13,6 +13,7 @@ import { Text, Button, List } from 'react-native-paper';
 import AsyncStorage from '@react-native-async-storage/async-storage';
 import axios from 'axios';
 import { BASE_URL } from '../config';
+import { photoUrl } from '../photoService';
 import { getFavorites } from '../favoritesService';
 import { theme } from '../theme';
 
@@ -127,9 +128,7 @@ export default function ClientDashboardScreen({ navigation }) {
         <View style={styles.favoriteList}>
           {favorites.map((item) => {
             // photoUri
-            const photoUri = item.profile_photo
-              ? `${BASE_URL.replace(/\/$/, '')}/${item.profile_photo}`
-              : null;
+            const photoUri = photoUrl(item, 256);
             return (
               <TouchableOpacity
                 key={item.id.toString()}
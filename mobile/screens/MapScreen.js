@@ -15,6 +15,7 @@ import AsyncStorage from "@react-native-async-storage/async-storage";
 import LeafletMap from "../LeafletMap";
 import axios from "axios";
 import { BASE_URL } from "../config";
+import { photoUrl } from "../photoService";
 import { theme } from "../theme";
 import { isNotificationsEnabled, getNotificationRadius } from "../settingsService";
 import { subscribe as subscribeLocations } from "../socketService";
@@ -27,6 +28,7 @@ import * as Location from "expo-location";
 import useProximityNotifications from "../useProximityNotifications";
 import { MaterialCommunityIcons } from "@expo/vector-icons";
 import { getFavorites, addFavorite, removeFavorite } from "../favoritesService";
+import { vendorsWithUnseenStories } from "../storiesFeedService";
 import t from "../i18n";
 
 export default function MapScreen({ navigation }) {
@@ -45,6 +47,7 @@ export default function MapScreen({ navigation }) {
   const [zoomLevel, setZoomLevel] = useState(13);
   const [notifEnabled, setNotifEnabled] = useState(true);
   const [notifRadius, setNotifRadius] = useState(20);
+  const [storyVendorIds, setStoryVendorIds] = useState([]);
   // mapRef
   const mapRef = useRef(null);
   // watchRef
@@ -267,6 +270,32 @@ export default function MapScreen({ navigation }) {
   // Enviar notificações de proximidade se estiver ativo
   useProximityNotifications(filteredVendors, notifRadius, favoriteIds, notifEnabled);
 
+  // visibleIdsKey
+  const visibleIdsKey = filteredVendors.map((v) => v.id).sort((a, b) => a - b).join(",");
+
+  // Anel de stories nos pins: um só pedido para todos os vendedores visíveis,
+  // repetido a cada 30 s (normalmente 304, sem corpo)
+  useEffect(() => {
+    if (!visibleIdsKey) {
+      setStoryVendorIds([]);
+      return undefined;
+    }
+    // ids
+    const ids = visibleIdsKey.split(",").map(Number);
+    // load
+    const load = async () => {
+      try {
+        setStoryVendorIds(await vendorsWithUnseenStories(ids));
+      } catch (err) {
+        console.log("Erro ao buscar stories:", err);
+      }
+    };
+    load();
+    // interval
+    const interval = setInterval(load, 30000);
+    return () => clearInterval(interval);
+  }, [visibleIdsKey]);
+
   return (
     <View style={styles.container}>
       {loadingLocation ? (
@@ -284,15 +313,17 @@ export default function MapScreen({ navigation }) {
           markers={[
             ...filteredVendors.map((v) => {
               // photo
-              const photo = v.profile_photo
-                ? `${BASE_URL.replace(/\/$/, "")}/${v.profile_photo}`
-                : null;
+              const photo = photoUrl(v, 64);
+              // border
+              const border = storyVendorIds.includes(v.id)
+                ? "3px solid #E1306C"
+                : `2px solid ${v.pin_color || "#FFB6C1"}`;
               return {
                 latitude: v.current_lat,
                 longitude: v.current_lng,
                 title: v.name || "Vendedor",
                 iconHtml: photo
-                  ? `<div class="gm-pin" style="border: 2px solid ${v.pin_color || "#FFB6C1"};"><img src="${photo}" /></div>`
+                  ? `<div class="gm-pin" style="border: ${border};"><img src="${photo}" /></div>`
                   : null,
                 selected: v.id === selectedVendorId,
               };
@@ -377,9 +408,7 @@ export default function MapScreen({ navigation }) {
               style={styles.vendorList}
               renderItem={({ item }) => {
                 // photoUri
-                const photoUri = item.profile_photo
-                  ? `${BASE_URL.replace(/\/$/, "")}/${item.profile_photo}`
-                  : null;
+                const photoUri = photoUrl(item, 256);
                 // fav
                 const fav = favoriteIds.includes(item.id);
                 return (
@@ -22,8 +22,10 @@ export default function RoutesScreen({ navigation }) {
     const vendor = JSON.parse(stored);
     try {
       // res
+      // trajetos simplificados no servidor (tolerância de 5 m) chegam para o mapa
       const res = await axios.get(`${BASE_URL}/vendors/${vendor.id}/routes`, {
         headers: token ? { Authorization: `Bearer ${token}` } : {},
+        params: { tolerance_m: 5 },
       });
       setRoutes(res.data);
     } catch (e) {
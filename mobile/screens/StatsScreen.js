@@ -25,20 +25,12 @@ export default function StatsScreen({ navigation }) {
     const vendor = JSON.parse(stored);
     try {
       // res
-      const res = await axios.get(`${BASE_URL}/vendors/${vendor.id}/routes`, {
+      // totais diários já calculados no servidor
+      const res = await axios.get(`${BASE_URL}/vendors/${vendor.id}/stats/daily`, {
         headers: token ? { Authorization: `Bearer ${token}` } : {},
       });
-      // daily
-      const daily = {};
-      res.data.forEach((r) => {
-        // d
-        const d = r.start_time.split('T')[0];
-        daily[d] = (daily[d] || 0) + r.distance_m;
-      });
-      // sorted
-      const sorted = Object.entries(daily).sort();
-      setData(sorted.map(([, dist]) => Number((dist / 1000).toFixed(2))));
-      setLabels(sorted.map(([date]) => date.slice(5)));
+      setData(res.data.map((d) => Number((d.distance_m / 1000).toFixed(2))));
+      setLabels(res.data.map((d) => d.date.slice(5)));
     } catch (e) {
       console.log('Erro ao carregar stats:', e);
     }
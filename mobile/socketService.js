@@ -5,11 +5,57 @@ let socket = null;
 let reconnectTimeout = null;
 // listeners
 const listeners = new Set();
+// Estado para retomar a ligacao sem voltar a pedir todos os vendedores
+let epoch = null;
+let lastSeq = null;
+// activeVendors
+const activeVendors = new Set();
 
 // getWsUrl
 function getWsUrl() {
   // Convert http(s):// to ws(s)://
-  return `${BASE_URL.replace(/^http/, 'ws')}/ws/locations`;
+  // base
+  const base = `${BASE_URL.replace(/^http/, 'ws')}/ws/locations`;
+  if (epoch !== null && lastSeq !== null) {
+    return `${base}?since=${lastSeq}&epoch=${epoch}`;
+  }
+  return `${base}?snapshot=1`;
+}
+
+// emit
+function emit(update) {
+  if (update.remove === true || update.lat === null) {
+    activeVendors.delete(update.vendor_id);
+  } else {
+    activeVendors.add(update.vendor_id);
+  }
+  listeners.forEach((cb) => cb(update));
+}
+
+// handleMessage
+function handleMessage(data) {
+  if (data.type === 'snapshot') {
+    epoch = data.epoch;
+    lastSeq = data.seq;
+    // present
+    const present = new Set(data.vendors.map(([id]) => id));
+    activeVendors.forEach((id) => {
+      if (!present.has(id)) {
+        emit({ vendor_id: id, lat: null, lng: null, remove: true });
+      }
+    });
+    data.vendors.forEach(([vendor_id, lat, lng]) => emit({ vendor_id, lat, lng }));
+    return;
+  }
+  if (data.type === 'batch') {
+    data.updates.forEach(handleMessage);
+    return;
+  }
+  if (data.type) return;
+  if (typeof data.seq === 'number') {
+    lastSeq = data.seq;
+  }
+  emit(data);
 }
 
 // connect
@@ -29,7 +75,7 @@ function connect() {
     try {
       // data
       const data = JSON.parse(event.data);
-      listeners.forEach((cb) => cb(data));
+      handleMessage(data);
     } catch (e) {
       console.log('Erro ao processar mensagem WS:', e);
     }
@@ -63,6 +109,7 @@ export function subscribe(callback) {
 
 export function disconnect() {
   if (socket) {
+    socket.onclose = null;
     socket.close();
     socket = null;
   }
@@ -71,4 +118,7 @@ export function disconnect() {
     reconnectTimeout = null;
   }
   listeners.clear();
+  activeVendors.clear();
+  epoch = null;
+  lastSeq = null;
 }
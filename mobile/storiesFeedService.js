@@ -0,0 +1,41 @@
+// Serviço para saber, num só pedido, que vendedores do mapa têm stories
+import axios from 'axios';
+import { BASE_URL } from './config';
+import { getSeenStories } from './storyViewService';
+
+// Última resposta, reutilizada quando o servidor responde 304
+let cache = { key: null, etag: null, data: [] };
+
+// fetchStoriesFeed
+// Devolve [{ vendor_id, stories: [...] }] dos vendedores pedidos; envia o ETag
+// da resposta anterior para o servidor só responder 304 se nada mudou
+export async function fetchStoriesFeed(vendorIds) {
+  // ids
+  const ids = Array.from(new Set(vendorIds)).sort((a, b) => a - b).slice(0, 200);
+  if (!ids.length) return [];
+  // key
+  const key = ids.join(',');
+  // headers
+  const headers = cache.key === key && cache.etag ? { 'If-None-Match': cache.etag } : {};
+  // resp
+  const resp = await axios.get(`${BASE_URL}/vendors/stories`, {
+    params: { vendor_ids: key },
+    headers,
+    validateStatus: (status) => status === 200 || status === 304,
+  });
+  if (resp.status === 304) return cache.data;
+  cache = { key, etag: resp.headers.etag || null, data: resp.data };
+  return resp.data;
+}
+
+// vendorsWithUnseenStories
+// Ids dos vendedores com pelo menos uma story ainda não vista neste telemóvel
+export async function vendorsWithUnseenStories(vendorIds) {
+  // feed
+  const feed = await fetchStoriesFeed(vendorIds);
+  // seen
+  const seen = new Set(await getSeenStories());
+  return feed
+    .filter((v) => v.stories.some((s) => !seen.has(s.id)))
+    .map((v) => v.vendor_id);
+}
@@ -0,0 +1,100 @@
+# Benchmark do custo de CPU por atualização de localização vs. número de clientes
+#
+# Compara o envio antigo (send_json em série em cada socket), as filas por
+# ligação a codificar a mensagem em cada socket e o ConnectionManager atual, que
+# codifica cada evento uma vez por formato e envia o mesmo texto a todos.
+#   python scripts/bench_broadcast.py
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from backend.app import realtime
+from backend.app.realtime import ConnectionManager, LocationEvent
+
+UPDATES = 200
+SUBSCRIBERS = (10, 100, 1000, 5000)
+
+
+class NullWebSocket:
+    """WebSocket falso: só conta os bytes enviados."""
+
+    def __init__(self):
+        self.bytes = 0
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        self.bytes += len(text)
+
+    async def send_json(self, data):
+        # o mesmo que o Starlette faz em WebSocket.send_json
+        await self.send_text(json.dumps(data, separators=(",", ":"), ensure_ascii=False))
+
+
+class PerSocketEvent(LocationEvent):
+    """Evento sem cache: codifica o JSON de novo para cada ligação."""
+
+    __slots__ = ()
+
+    def frame(self, fmt, sequenced=False):
+        self._frames.clear()
+        return super().frame(fmt, sequenced)
+
+
+def message(i):
+    return {"vendor_id": i % 50, "lat": 38.7 + i * 1e-5, "lng": -9.1 - i * 1e-5}
+
+
+async def per_socket_encoding(count):
+    sockets = [NullWebSocket() for _ in range(count)]
+    start = time.process_time()
+    for i in range(UPDATES):
+        msg = message(i)
+        for ws in sockets:
+            await ws.send_json(msg)
+    return (time.process_time() - start) / UPDATES
+
+
+async def queued(count, fmt="json", event_class=LocationEvent):
+    realtime.LocationEvent = event_class
+    manager = ConnectionManager(max_pending=UPDATES)
+    sockets = [NullWebSocket() for _ in range(count)]
+    for ws in sockets:
+        await manager.connect(ws, fmt)
+    start = time.process_time()
+    for i in range(UPDATES):
+        manager.broadcast(message(i))
+        await asyncio.sleep(0)  # deixa as tarefas de escrita esvaziarem as filas
+    while any(s.pending for s in manager.subscribers.values()):
+        await asyncio.sleep(0)
+    elapsed = (time.process_time() - start) / UPDATES
+    # um subscritor que falha é desligado sem erro: não medir envios que não houve
+    if sum(ws.bytes for ws in sockets) == 0:
+        raise RuntimeError(f"{event_class.__name__}: nenhum byte enviado")
+    tasks = [s.task for s in manager.subscribers.values()] + [manager._watchdog]
+    manager._watchdog.cancel()
+    for ws in sockets:
+        manager.disconnect(ws)
+    await asyncio.gather(*tasks, return_exceptions=True)
+    realtime.LocationEvent = LocationEvent
+    return elapsed
+
+
+async def main():
+    print("ms de CPU por atualização")
+    print(f"{'clientes':>9} {'send_json série':>16} {'fila+encode/socket':>19} {'fila+encode once':>17} {'array':>8}")
+    for count in SUBSCRIBERS:
+        serial = await per_socket_encoding(count)
+        per_socket = await queued(count, event_class=PerSocketEvent)
+        once = await queued(count)
+        compact = await queued(count, "array")
+        print(f"{count:>9} {serial * 1000:>16.3f} {per_socket * 1000:>19.3f} {once * 1000:>17.3f} {compact * 1000:>8.3f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,54 @@
+# Benchmark dos cálculos de trajeto: ciclo com haversine vs. NumPy
+#
+# Um trajeto de 30 000 pontos corresponde a ~8 horas com um ponto por segundo.
+#   python scripts/bench_geometry.py
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from backend.app.geo import haversine
+from backend.app.geometry import path_length, point_arrays, route_stats, segment_distances
+
+POINTS = 30000
+REPEAT = 20
+
+
+def make_route(count):
+    start = datetime(2024, 7, 1, 9, 0)
+    return [
+        {"lat": 38.7 + i * 1e-5, "lng": -9.1 + (i % 60) * 1e-5, "t": (start + timedelta(seconds=i)).isoformat()}
+        for i in range(count)
+    ]
+
+
+def loop_length(points):
+    dist = 0.0
+    for p1, p2 in zip(points, points[1:]):
+        dist += haversine(p1["lat"], p1["lng"], p2["lat"], p2["lng"])
+    return dist
+
+
+def timed(fn, points):
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        fn(points)
+    return (time.perf_counter() - start) / REPEAT * 1000
+
+
+def main():
+    points = make_route(POINTS)
+    lat, lng = point_arrays(points)
+    kernel = timed(lambda _: segment_distances(lat, lng).sum(), points)
+    print(f"ms por trajeto ({POINTS} pontos)")
+    print(f"{'ciclo haversine':>16} {'path_length':>12} {'só o kernel':>12} {'route_stats':>12}")
+    print(
+        f"{timed(loop_length, points):>16.2f} {timed(path_length, points):>12.2f} "
+        f"{kernel:>12.2f} {timed(route_stats, points):>12.2f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+# Teste de carga: latência dos WebSockets durante uma rajada de logins
+#
+# Arranca o backend (uvicorn, SQLite temporário) neste processo, envia uma
+# localização de 50 em 50 ms e mede quanto tempo demora a chegar a um
+# WebSocket, primeiro sem carga e depois com vários /token em paralelo.
+# Com --inline o bcrypt volta a correr no event loop, como antes.
+#   python scripts/bench_login_burst.py [--inline] [--logins 16]
+import argparse
+import asyncio
+import math
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+PHASE_SECONDS = 3.0
+PROBE_INTERVAL = 0.05
+PASSWORD = "Secret123"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(main, port):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+
+def seed(main, models, database):
+    """Vendedor com trajeto ativo (enviado pela sonda) e contas para o login."""
+    from datetime import datetime, timedelta
+
+    db = database.SessionLocal()
+    hashed = main.pwd_context.hash(PASSWORD)
+    mover = models.Vendor(
+        email="mover@example.com", hashed_password=hashed, email_confirmed=True,
+        subscription_active=True, subscription_valid_until=datetime.utcnow() + timedelta(days=7),
+    )
+    db.add(mover)
+    db.add(models.Vendor(email="login@example.com", hashed_password=hashed, email_confirmed=True))
+    db.commit()
+    db.add(models.Route(vendor_id=mover.id))
+    db.commit()
+    vendor_id = mover.id
+    db.close()
+    return vendor_id, main.create_access_token({"sub": vendor_id})
+
+
+async def measure(base, ws_url, vendor_id, token, load, concurrency, label):
+    """Latências sem carga e com ``concurrency`` tarefas a repetir ``load(http)``."""
+    import httpx
+    import websockets
+
+    latencies = []
+    headers = {"Authorization": f"Bearer {token}"}
+    async with httpx.AsyncClient(base_url=base, timeout=60) as http, websockets.connect(ws_url) as ws:
+        stop = asyncio.Event()
+
+        async def burst():
+            while not stop.is_set():
+                await load(http)
+
+        async def probe(duration):
+            end = time.perf_counter() + duration
+            lng = 0.0
+            while time.perf_counter() < end:
+                lng += 1e-4
+                sent = time.perf_counter()
+                await http.put(f"/vendors/{vendor_id}/location", json={"lat": 38.7, "lng": lng}, headers=headers)
+                while True:
+                    message = await ws.recv()
+                    if f"{lng}" in message:
+                        break
+                latencies.append((time.perf_counter() - sent) * 1000)
+                await asyncio.sleep(PROBE_INTERVAL)
+
+        results = {}
+        await probe(PHASE_SECONDS)
+        results["sem carga"], latencies[:] = list(latencies), []
+        workers = [asyncio.create_task(burst()) for _ in range(concurrency)]
+        await probe(PHASE_SECONDS)
+        stop.set()
+        await asyncio.gather(*workers)
+        results[label] = list(latencies)
+        return results
+
+
+def run(app_main, models, database, load, concurrency, label):
+    """Arranca o servidor, mede e devolve as latências de cada fase."""
+    vendor_id, token = seed(app_main, models, database)
+    port = free_port()
+    server, thread = start_server(app_main, port)
+    try:
+        return asyncio.run(
+            measure(
+                f"http://127.0.0.1:{port}", f"ws://127.0.0.1:{port}/ws/locations",
+                vendor_id, token, load, concurrency, label,
+            )
+        )
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+def report(title, results):
+    print(f"Latência localização -> WebSocket (ms), {title}")
+    print(f"{'fase':>26} {'p50':>7} {'p95':>7} {'máx':>7}")
+    for phase, values in results.items():
+        values.sort()
+        p95 = values[math.ceil(len(values) * 0.95) - 1]
+        print(f"{phase:>26} {statistics.median(values):>7.1f} {p95:>7.1f} {values[-1]:>7.1f}")
+
+
+def load_app():
+    """Importa o backend com uma base de dados SQLite temporária."""
+    tmp = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp}/bench.db"
+    from backend.app import database, main as app_main, models
+
+    models.Base.metadata.create_all(bind=database.engine)
+    return app_main, models, database
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--inline", action="store_true", help="bcrypt no event loop (comportamento antigo)")
+    parser.add_argument("--logins", type=int, default=16)
+    args = parser.parse_args()
+
+    app_main, models, database = load_app()
+    if args.inline:
+        async def verify_inline(password, hashed):
+            return app_main.pwd_context.verify(password, hashed)
+
+        app_main.password_hasher.verify_async = verify_inline
+
+    async def login(http):
+        await http.post("/token", json={"email": "login@example.com", "password": PASSWORD})
+
+    results = run(app_main, models, database, login, args.logins, f"{args.logins} logins em paralelo")
+    report("no event loop" if args.inline else f"{app_main.PASSWORD_HASH_WORKERS} threads de bcrypt", results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# Benchmark de /vendors/nearby com 10 000 vendedores
+#
+# Compara a filtragem atual no telemóvel (haversine a todos os vendedores), o
+# índice geohash em memória e a pesquisa por caixa em SQL (SQLite em memória
+# com o índice ix_vendors_location) seguida de haversine.
+#   python scripts/bench_nearby.py
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from backend.app import models
+from backend.app.geo import haversine
+from backend.app.spatial import GeoIndex
+
+VENDORS = 10000
+QUERIES = 200
+RADII = (500, 2000, 10000)
+# costa entre Viana do Castelo e Vila Real de Santo António
+LAT_RANGE = (37.0, 41.7)
+LNG_RANGE = (-9.5, -7.4)
+
+
+def linear_scan(points, lat, lng, radius_m):
+    return [vid for vid, (v_lat, v_lng) in points.items() if haversine(lat, lng, v_lat, v_lng) <= radius_m]
+
+
+def timed(fn, queries):
+    start = time.perf_counter()
+    for lat, lng in queries:
+        fn(lat, lng)
+    return (time.perf_counter() - start) / len(queries) * 1e6
+
+
+def main():
+    rng = random.Random(1)
+    points = {vid: (rng.uniform(*LAT_RANGE), rng.uniform(*LNG_RANGE)) for vid in range(1, VENDORS + 1)}
+    queries = [(rng.uniform(*LAT_RANGE), rng.uniform(*LNG_RANGE)) for _ in range(QUERIES)]
+
+    index = GeoIndex()
+    for vid, (lat, lng) in points.items():
+        index.update(vid, lat, lng)
+
+    # importado aqui para não criar a aplicação (e a base de dados) ao importar
+    from backend.app.main import nearby_from_db
+
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    db.execute(
+        insert(models.Vendor),
+        [{"id": vid, "email": f"{vid}@x", "current_lat": lat, "current_lng": lng} for vid, (lat, lng) in points.items()],
+    )
+    db.execute(insert(models.Route), [{"vendor_id": vid, "distance_m": 0.0} for vid in points])
+    db.commit()
+
+    print(f"µs por pesquisa ({VENDORS} vendedores)")
+    print(f"{'raio (m)':>9} {'haversine a todos':>18} {'índice geohash':>15} {'caixa SQL':>10}")
+    for radius in RADII:
+        scan = timed(lambda lat, lng: linear_scan(points, lat, lng, radius), queries)
+        indexed = timed(lambda lat, lng: index.nearby(lat, lng, radius), queries)
+        sql = timed(lambda lat, lng: nearby_from_db(db, lat, lng, radius), queries)
+        print(f"{radius:>9} {scan:>18.1f} {indexed:>15.1f} {sql:>10.1f}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
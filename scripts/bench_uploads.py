@@ -0,0 +1,62 @@
+# Teste de carga: latência dos WebSockets durante uploads de stories
+#
+# Como bench_login_burst.py, mas a carga são vários uploads de stories em
+# paralelo. Com --inline os ficheiros voltam a ser copiados com
+# shutil.copyfileobj no event loop, como antes.
+#   python scripts/bench_uploads.py [--inline] [--uploads 8] [--size-mb 20]
+import argparse
+import itertools
+import os
+import shutil
+import tempfile
+from uuid import uuid4
+
+from bench_login_burst import load_app, report, run
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--inline", action="store_true", help="cópia bloqueante no event loop (comportamento antigo)")
+    parser.add_argument("--uploads", type=int, default=8)
+    parser.add_argument("--size-mb", type=int, default=20)
+    args = parser.parse_args()
+
+    app_main, models, database = load_app()
+    # os ficheiros vão para uma pasta temporária, nunca para as pastas reais
+    media_dir = tempfile.mkdtemp(prefix="bench-uploads-")
+    app_main.STORY_DIR = os.path.join(media_dir, "stories")
+    app_main.PROFILE_PHOTO_DIR = os.path.join(media_dir, "profile_photos")
+    os.makedirs(app_main.STORY_DIR)
+    os.makedirs(app_main.PROFILE_PHOTO_DIR)
+    if args.inline:
+        async def save_inline(upload, directory, max_bytes):
+            file_name = f"{uuid4().hex}{os.path.splitext(upload.filename)[1]}"
+            with open(os.path.join(directory, file_name), "wb") as buffer:
+                shutil.copyfileobj(upload.file, buffer)
+            return file_name
+
+        app_main.save_upload = save_inline
+    app_main.STORY_MAX_BYTES = (args.size_mb + 1) * 1024 * 1024
+    payload = os.urandom(args.size_mb * 1024 * 1024)
+    # conteúdo diferente em cada upload: ficheiros iguais seriam gravados uma só vez
+    counter = itertools.count()
+    # o vendedor da sonda (id 1) é também quem publica as stories
+    token = app_main.create_access_token({"sub": 1})
+
+    async def upload(http):
+        data = next(counter).to_bytes(8, "big") + payload[8:]
+        await http.post(
+            "/vendors/1/stories",
+            files={"file": ("story.mp4", data, "video/mp4")},
+            headers={"Authorization": f"Bearer {token}"},
+        )
+
+    try:
+        results = run(app_main, models, database, upload, args.uploads, f"{args.uploads} uploads de {args.size_mb} MB")
+    finally:
+        shutil.rmtree(media_dir, ignore_errors=True)
+    report("cópia no event loop" if args.inline else "uploads em streaming", results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+# Testes do cache de utilizadores autenticados
+import time
+
+from backend.app.auth_cache import Principal, PrincipalCache
+
+
+def test_get_put_and_kind_separation():
+    cache = PrincipalCache()
+    vendor = Principal("vendor", 1, True)
+    cache.put("tok", vendor)
+    assert cache.get("vendor", "tok") is vendor
+    assert cache.get("client", "tok") is None
+    assert cache.get("vendor", "other") is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_entries_expire_after_ttl_and_token_exp(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    cache = PrincipalCache(ttl=30)
+    cache.put("a", Principal("vendor", 1))
+    # o token expira antes do TTL
+    cache.put("b", Principal("vendor", 2), token_exp=time.time() + 5)
+    now[0] += 10
+    assert cache.get("vendor", "a") is not None
+    assert cache.get("vendor", "b") is None
+    now[0] += 30
+    assert cache.get("vendor", "a") is None
+    assert len(cache) == 0
+
+
+def test_lru_eviction_and_invalidate():
+    cache = PrincipalCache(maxsize=2)
+    cache.put("a", Principal("vendor", 1))
+    cache.put("b", Principal("vendor", 1))
+    cache.get("vendor", "a")
+    cache.put("c", Principal("client", 1))
+    assert cache.get("vendor", "b") is None
+    assert cache.get("vendor", "a") is not None
+
+    cache.invalidate("vendor", 1)
+    assert cache.get("vendor", "a") is None
+    assert cache.get("client", "c") is not None
+    assert len(cache) == 1
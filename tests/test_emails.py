@@ -0,0 +1,146 @@
+# Testes da fila de emails
+import asyncio
+import base64
+import threading
+
+from backend.app.emails import EmailQueue, SMTPSender
+
+
+class FakeSMTPServer:
+    """Servidor SMTP mínimo: aceita AUTH PLAIN e guarda as mensagens recebidas."""
+
+    def __init__(self):
+        self.server = None
+        self.connections = 0
+        self.logins = []
+        self.messages = []
+        # número de DATA seguintes a recusar com 451
+        self.fail_next = 0
+        # fecha a ligação depois de cada mensagem
+        self.close_after_message = False
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+
+        async def reply(line):
+            writer.write(line.encode() + b"\r\n")
+            await writer.drain()
+
+        await reply("220 fake ESMTP")
+        try:
+            while True:
+                line = (await reader.readline()).decode().rstrip("\r\n")
+                if not line:
+                    break
+                command = line.split(" ", 1)[0].upper()
+                if command == "EHLO":
+                    await reply("250-fake\r\n250 AUTH PLAIN")
+                elif command == "AUTH":
+                    self.logins.append(base64.b64decode(line.split()[2]).split(b"\0")[1].decode())
+                    await reply("235 ok")
+                elif command == "DATA":
+                    await reply("354 go on")
+                    data = await reader.readuntil(b"\r\n.\r\n")
+                    if self.fail_next:
+                        self.fail_next -= 1
+                        await reply("451 try again later")
+                        continue
+                    self.messages.append(data.decode())
+                    await reply("250 queued")
+                    if self.close_after_message:
+                        break
+                elif command == "QUIT":
+                    await reply("221 bye")
+                    break
+                else:
+                    await reply("250 ok")
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+def make_queue(port, **kwargs):
+    return EmailQueue(
+        lambda: SMTPSender("127.0.0.1", port, "app@example.com", "pw", starttls=False, timeout=5),
+        "app@example.com",
+        **kwargs,
+    )
+
+
+def test_queue_reuses_one_smtp_connection():
+    async def scenario():
+        server = FakeSMTPServer()
+        port = await server.start()
+        queue = make_queue(port)
+        await queue.start()
+        for i in range(3):
+            queue.enqueue(f"c{i}@example.com", "Olá", "Corpo")
+        # também a partir de uma thread (endpoints síncronos)
+        thread = threading.Thread(target=queue.enqueue, args=("t@example.com", "Olá", "Corpo"))
+        thread.start()
+        thread.join()
+        await queue.stop()
+        await server.stop()
+        return server, queue
+
+    server, queue = asyncio.run(scenario())
+    assert len(server.messages) == 4
+    assert "To: t@example.com" in server.messages[-1]
+    assert server.connections == 1
+    assert server.logins == ["app@example.com"]
+    assert queue.metrics() == {"pending": 0, "sent": 4, "failed": 0, "retries": 0}
+
+
+def test_failed_sends_are_retried_with_backoff():
+    async def scenario():
+        server = FakeSMTPServer()
+        port = await server.start()
+        queue = make_queue(port, max_attempts=3, backoff=0.01)
+        await queue.start()
+
+        server.fail_next = 2
+        queue.enqueue("a@example.com", "Olá", "Corpo")
+        await queue.stop()
+        retried = queue.metrics()
+
+        # à terceira falha desiste
+        await queue.start()
+        server.fail_next = 3
+        queue.enqueue("b@example.com", "Olá", "Corpo")
+        await queue.stop()
+        await server.stop()
+        return server, retried, queue.metrics()
+
+    server, retried, gave_up = asyncio.run(scenario())
+    assert retried == {"pending": 0, "sent": 1, "failed": 0, "retries": 2}
+    assert gave_up == {"pending": 0, "sent": 1, "failed": 1, "retries": 4}
+    assert len(server.messages) == 1
+
+
+def test_sender_reconnects_when_server_closes_connection():
+    async def scenario():
+        server = FakeSMTPServer()
+        server.close_after_message = True
+        port = await server.start()
+        queue = make_queue(port)
+        await queue.start()
+        queue.enqueue("a@example.com", "Olá", "Corpo")
+        await asyncio.sleep(0.1)
+        queue.enqueue("b@example.com", "Olá", "Corpo")
+        await queue.stop()
+        await server.stop()
+        return server, queue
+
+    server, queue = asyncio.run(scenario())
+    assert len(server.messages) == 2
+    assert server.connections == 2
+    assert queue.metrics()["retries"] == 0
@@ -0,0 +1,83 @@
+# Testes dos cálculos vetorizados sobre trajetos
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from backend.app.geo import haversine
+from backend.app.geometry import (
+    ENDPOINT_IMPORTANCE,
+    path_length,
+    route_stats,
+    simplification_importance,
+    simplify_points,
+    within_radius,
+)
+
+
+def make_route(count, start=datetime(2024, 7, 1, 10, 0)):
+    return [
+        {"lat": 38.7 + i * 1e-4, "lng": -9.1 + (i % 7) * 1e-4, "t": (start + timedelta(seconds=i)).isoformat()}
+        for i in range(count)
+    ]
+
+
+def test_path_length_matches_scalar_loop():
+    points = make_route(500)
+    expected = sum(
+        haversine(p1["lat"], p1["lng"], p2["lat"], p2["lng"]) for p1, p2 in zip(points, points[1:])
+    )
+    assert path_length(points) == pytest.approx(expected)
+    assert path_length(points[:1]) == 0.0
+    assert path_length([]) == 0.0
+
+
+def test_route_stats():
+    points = [
+        {"lat": 0.0, "lng": 0.0, "t": "2024-07-01T10:00:00"},
+        {"lat": 0.0, "lng": 0.001, "t": "2024-07-01T10:00:10"},
+        {"lat": 0.0, "lng": 0.003, "t": "2024-07-01T10:00:20"},
+    ]
+    stats = route_stats(points)
+    step = haversine(0.0, 0.0, 0.0, 0.001)
+    assert stats["distance_m"] == pytest.approx(3 * step)
+    assert stats["duration_s"] == 20.0
+    assert stats["avg_speed_mps"] == pytest.approx(3 * step / 20)
+    assert stats["max_speed_mps"] == pytest.approx(2 * step / 10)
+    assert stats["bbox"] == [0.0, 0.0, 0.0, 0.003]
+
+    empty = route_stats([])
+    assert empty["distance_m"] == 0.0 and empty["bbox"] is None and empty["avg_speed_mps"] is None
+
+
+def test_within_radius_sorts_by_distance():
+    ids = [10, 20, 30]
+    lats = [38.71, 38.70, 38.80]
+    lngs = [-9.1, -9.1, -9.1]
+    found = within_radius(38.70, -9.1, ids, lats, lngs, 2000)
+    assert [vid for vid, _ in found] == [20, 10]
+    assert found[1][1] == pytest.approx(haversine(38.70, -9.1, 38.71, -9.1))
+    assert within_radius(38.70, -9.1, [], [], [], 2000) == []
+
+
+def test_simplification_keeps_corners_and_endpoints():
+    # L: 50 pontos para norte e 50 para este, com ruído de ~1 m
+    points = [{"lat": 38.7 + i * 1e-4, "lng": -9.1 + (i % 2) * 1e-5} for i in range(50)]
+    points += [{"lat": 38.7049 + (i % 2) * 1e-5, "lng": -9.1 + i * 1e-4} for i in range(1, 50)]
+
+    simplified = simplify_points(points, tolerance_m=5)
+    assert simplified == [points[0], points[49], points[-1]]
+    assert simplify_points(points, max_points=3) == simplified
+    assert len(simplify_points(points, tolerance_m=0.1)) > 50
+    assert simplify_points(points) == points
+
+
+def test_importance_matches_direct_douglas_peucker():
+    lat = np.array([0.0, 0.0001, 0.0, 0.0003, 0.0, 0.0])
+    lng = np.array([0.0, 0.001, 0.002, 0.003, 0.004, 0.005])
+    importance = simplification_importance(lat, lng)
+    assert importance[0] == importance[-1] == ENDPOINT_IMPORTANCE
+    # o pico maior divide primeiro; o menor só entra com tolerância abaixo de ~11 m
+    assert importance[3] == pytest.approx(33.4, abs=0.5)
+    assert importance[1] == pytest.approx(11.1, abs=0.5)
+    assert importance[1] <= importance[3]
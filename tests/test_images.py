@@ -0,0 +1,53 @@
+# Testes das versões das fotos de perfil
+import os
+
+from PIL import Image
+
+from backend.app.images import generate_variants, variant_path
+from backend.app.uploads import FILE_MODE
+
+
+def write_image(path, size, mode="RGB", fmt="PNG", exif=None):
+    image = Image.new(mode, size, (200, 30, 30, 128) if mode == "RGBA" else (200, 30, 30))
+    options = {"exif": exif} if exif else {}
+    image.save(path, fmt, **options)
+
+
+def test_variants_are_generated_in_each_size_and_format(tmp_path):
+    os.makedirs(tmp_path / "profile_photos")
+    write_image(tmp_path / "profile_photos" / "abc.png", (3000, 2000), mode="RGBA")
+
+    variants = generate_variants("profile_photos/abc.png", root=str(tmp_path))
+    assert variants["64"] == {"webp": "profile_photos/abc_64.webp", "jpeg": "profile_photos/abc_64.jpg"}
+    sizes = {}
+    for size in ("64", "256", "1024"):
+        for fmt, path in variants[size].items():
+            with Image.open(tmp_path / path) as image:
+                assert image.format == {"webp": "WEBP", "jpeg": "JPEG"}[fmt]
+                sizes[size] = image.size
+    # miniaturas quadradas; a maior mantém a proporção
+    assert sizes == {"64": (64, 64), "256": (256, 256), "1024": (1024, 683)}
+    original = os.path.getsize(tmp_path / "profile_photos" / "abc.png")
+    assert os.path.getsize(tmp_path / variant_path("profile_photos/abc.png", 64, "webp")) < original
+    # permissões de um ficheiro normal, não as 0600 do temporário
+    assert os.stat(tmp_path / variants["256"]["jpeg"]).st_mode & 0o777 == FILE_MODE
+    # sem ficheiros temporários esquecidos
+    assert not [n for n in os.listdir(tmp_path / "profile_photos") if n.startswith(".")]
+
+
+def test_small_photos_are_not_enlarged_and_exif_rotation_is_applied(tmp_path):
+    exif = Image.Exif()
+    exif[0x0112] = 6  # rodada 90º
+    write_image(tmp_path / "p.jpg", (40, 30), fmt="JPEG", exif=exif.tobytes())
+
+    variants = generate_variants("p.jpg", root=str(tmp_path))
+    with Image.open(tmp_path / variants["64"]["jpeg"]) as image:
+        assert image.size == (30, 30)
+    with Image.open(tmp_path / variants["1024"]["webp"]) as image:
+        assert image.size == (30, 40)
+
+
+def test_non_images_are_ignored(tmp_path):
+    (tmp_path / "x.png").write_bytes(b"fakeimage")
+    assert generate_variants("x.png", root=str(tmp_path)) is None
+    assert os.listdir(tmp_path) == ["x.png"]
@@ -1,7 +1,11 @@
 # Testes automatizados do backend com pytest
 import os
 import importlib
+import json
 import shutil
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 
 import pytest
 from fastapi.testclient import TestClient
@@ -11,6 +15,11 @@ from fastapi.testclient import TestClient
 def client(tmp_path):
     # setup DATABASE_URL for tests
     os.environ["DATABASE_URL"] = f"sqlite:///{tmp_path}/test.db?check_same_thread=False"
+    # stories numa pasta temporária e sem sweepers em segundo plano (os testes
+    # chamam expire_stories/expire_subscriptions diretamente)
+    os.environ["STORY_DIR"] = str(tmp_path / "stories")
+    os.environ["STORY_SWEEP_INTERVAL"] = "0"
+    os.environ["SUBSCRIPTION_SWEEP_INTERVAL"] = "0"
 
     # reload application modules so they pick up the new DATABASE_URL
     from backend.app import database, models, main
@@ -25,6 +34,9 @@ def client(tmp_path):
 
     main.send_email = fake_send_email
 
+    # aceitar eventos do Stripe sem assinatura durante os testes
+    main.stripe.Webhook.construct_event = lambda payload, sig, secret: json.loads(payload)
+
     # create tables
     models.Base.metadata.create_all(bind=database.engine)
 
@@ -36,6 +48,14 @@ def client(tmp_path):
     if os.path.exists("profile_photos"):
         shutil.rmtree("profile_photos")
 
+@pytest.fixture
+def story_dir(client):
+    """Pasta temporária onde o cliente grava (e serve) as stories."""
+    from backend.app import main
+
+    return main.STORY_DIR
+
+
 def register_vendor(client, email="vendor@example.com", password="Secret123", name="Vendor"):
     data = {
         "name": name,
@@ -92,6 +112,32 @@ def get_client_token(client, email="client@example.com", password="Secret123"):
     return resp.json()["access_token"]
 
 
+# Threads das tarefas em segundo plano: o flusher e os sweepers correm no
+# executor do asyncio e as variantes das fotos no do ImagePipeline. Os pedidos
+# que usam asyncio.to_thread (fecho de trajetos, localização após reinício)
+# também correm ali, por isso não servem para contar queries com isto.
+BACKGROUND_THREADS = ("asyncio_", "images")
+
+
+@contextmanager
+def request_statements():
+    """Regista as queries feitas pelos pedidos, sem as das tarefas em segundo plano."""
+    from sqlalchemy import event
+    from backend.app import database
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not threading.current_thread().name.startswith(BACKGROUND_THREADS):
+            statements.append(statement)
+
+    event.listen(database.engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(database.engine, "before_cursor_execute", record)
+
+
 def test_token_generation(client):
     register_vendor(client)
     confirm_latest_email(client)
@@ -195,6 +241,26 @@ def test_location_update_fields(client):
     assert vendor["current_lng"] == -20.3
 
 
+def test_location_update_restores_route_after_restart(client):
+    from backend.app import main
+
+    vendor_id = register_vendor(client).json()["id"]
+    confirm_latest_email(client)
+    activate_subscription(client, vendor_id)
+    headers = {"Authorization": f"Bearer {get_token(client)}"}
+    url = f"/vendors/{vendor_id}/location"
+
+    # sem trajeto aberto não há partilha de localização
+    assert client.put(url, json={"lat": 1.0, "lng": 2.0}, headers=headers).status_code == 400
+
+    route_id = client.post(f"/vendors/{vendor_id}/routes/start", headers=headers).json()["id"]
+    # o worker reiniciou: o trajeto aberto vem da base de dados
+    main.live_store.deactivate(vendor_id)
+    assert client.put(url, json={"lat": 1.0, "lng": 2.0}, headers=headers).status_code == 200
+    assert main.live_store.get(vendor_id).route_id == route_id
+    assert (main.live_store.get(vendor_id).lat, main.live_store.get(vendor_id).lng) == (1.0, 2.0)
+
+
 def test_websocket_location_broadcast(client):
     resp = register_vendor(client)
     vendor_id = resp.json()["id"]
@@ -250,6 +316,8 @@ def test_reviews_endpoints(client):
 def test_review_response_and_delete(client):
     resp = register_vendor(client)
     vendor_id = resp.json()["id"]
+    # confirmar já: o email seguinte é o do cliente
+    confirm_latest_email(client)
     register_client(client)
     confirm_latest_client_email(client)
     ctoken = get_client_token(client)
@@ -259,7 +327,6 @@ def test_review_response_and_delete(client):
         headers={"Authorization": f"Bearer {ctoken}"},
     ).json()
 
-    confirm_latest_email(client)
     token = get_token(client)
 
     resp = client.post(
@@ -407,3 +474,985 @@ def test_story_creation_and_listing(client):
     stories = resp.json()
     assert len(stories) == 1
 
+
+def test_uploads_are_streamed_with_size_limit(client, story_dir):
+    from backend.app import main, uploads
+
+    resp = register_vendor(client)
+    vendor_id = resp.json()["id"]
+    confirm_latest_email(client)
+    headers = {"Authorization": f"Bearer {get_token(client)}"}
+    before = set(os.listdir(story_dir))
+
+    # vários blocos, gravados tal e qual
+    main.STORY_MAX_BYTES = 3 * uploads.CHUNK_SIZE
+    data = os.urandom(2 * uploads.CHUNK_SIZE + 10)
+    resp = client.post(f"/vendors/{vendor_id}/stories", files={"file": ("s.mp4", data, "video/mp4")}, headers=headers)
+    assert resp.status_code == 200
+    media_url = resp.json()["media_url"]
+    assert media_url.endswith(".mp4")
+    path = os.path.join(story_dir, os.path.basename(media_url))
+    with open(path, "rb") as f:
+        assert f.read() == data
+    # legível por outros utilizadores (servidor web/CDN), como um ficheiro normal
+    assert os.stat(path).st_mode & 0o777 == uploads.FILE_MODE
+    assert client.get(f"/{media_url}").content == data
+
+    # acima do limite: 413 e nenhum ficheiro (nem temporário) fica na pasta
+    main.STORY_MAX_BYTES = uploads.CHUNK_SIZE
+    resp = client.post(f"/vendors/{vendor_id}/stories", files={"file": ("s.mp4", data, "video/mp4")}, headers=headers)
+    assert resp.status_code == 413
+    assert set(os.listdir(story_dir)) - before == {os.path.basename(media_url)}
+    assert len(client.get(f"/vendors/{vendor_id}/stories").json()) == 1
+
+    # pouco acima do limite (cabe na margem do formulário): recusado ao gravar
+    small = os.urandom(uploads.CHUNK_SIZE + 10)
+    resp = client.post(f"/vendors/{vendor_id}/stories", files={"file": ("s.mp4", small, "video/mp4")}, headers=headers)
+    assert resp.status_code == 413
+
+    # sem Content-Length (chunked): cortado assim que passa do limite
+    def chunks():
+        for _ in range(4):
+            yield data
+
+    resp = client.post(
+        f"/vendors/{vendor_id}/stories",
+        content=chunks(),
+        headers={**headers, "Content-Type": "multipart/form-data; boundary=x"},
+    )
+    assert resp.status_code == 413
+    assert set(os.listdir(story_dir)) - before == {os.path.basename(media_url)}
+
+    # Content-Length acima do limite: 413 sem ler nada do corpo
+    received, sent = [], []
+
+    async def receive():
+        received.append(True)
+        return {"type": "http.request", "body": b"x" * 1024, "more_body": True}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": f"/vendors/{vendor_id}/stories", "raw_path": b"", "root_path": "",
+        "query_string": b"", "client": ("test", 1), "server": ("test", 80),
+        "headers": [
+            (b"content-length", b"5000000000"),
+            (b"content-type", b"multipart/form-data; boundary=x"),
+            (b"authorization", headers["Authorization"].encode()),
+        ],
+    }
+    client.portal.call(main.app, scope, receive, send)
+    assert sent[0]["status"] == 413
+    assert received == []
+
+
+def test_media_is_content_addressed_and_cacheable(client, story_dir):
+    import hashlib
+
+    resp = register_vendor(client)
+    vendor_id = resp.json()["id"]
+    confirm_latest_email(client)
+    headers = {"Authorization": f"Bearer {get_token(client)}"}
+
+    data = os.urandom(5000)
+    digest = hashlib.sha256(data).hexdigest()
+    urls = []
+    for name in ("a.MP4", "b.mp4"):
+        resp = client.post(f"/vendors/{vendor_id}/stories", files={"file": (name, data, "video/mp4")}, headers=headers)
+        urls.append(resp.json()["media_url"])
+    # o mesmo conteúdo fica num só ficheiro
+    assert urls == [f"stories/{digest}.mp4"] * 2
+    assert [n for n in os.listdir(story_dir) if n.startswith(digest)] == [f"{digest}.mp4"]
+
+    resp = client.get(f"/{urls[0]}")
+    assert resp.content == data
+    assert resp.headers["etag"] == f'"{digest}"'
+    assert resp.headers["cache-control"] == "public, max-age=31536000, immutable"
+
+    resp = client.get(f"/{urls[0]}", headers={"If-None-Match": f'"{digest}"'})
+    assert resp.status_code == 304
+    assert resp.headers["cache-control"].endswith("immutable")
+
+    resp = client.get(f"/{urls[0]}", headers={"Range": "bytes=100-199"})
+    assert resp.status_code == 206
+    assert resp.content == data[100:200]
+    assert resp.headers["content-range"] == "bytes 100-199/5000"
+
+    # ficheiros antigos com nome aleatório: cache curta e ETag do Starlette
+    with open(os.path.join(story_dir, "legacy.mp4"), "wb") as f:
+        f.write(data)
+    resp = client.get("/stories/legacy.mp4")
+    assert resp.headers["cache-control"] == "public, max-age=86400"
+    assert resp.headers["etag"] != f'"{digest}"'
+
+
+def test_expired_stories_are_swept_with_their_files(client, tmp_path):
+    from backend.app import database, main, models, stories
+
+    resp = register_vendor(client)
+    vendor_id = resp.json()["id"]
+    confirm_latest_email(client)
+    headers = {"Authorization": f"Bearer {get_token(client)}"}
+
+    shared, alone, fresh = os.urandom(100), os.urandom(100), os.urandom(100)
+    paths = {}
+    for key, data in (("old", shared), ("alone", alone), ("new", shared), ("fresh", fresh)):
+        resp = client.post(f"/vendors/{vendor_id}/stories", files={"file": ("s.mp4", data, "video/mp4")}, headers=headers)
+        paths[key] = os.path.join(main.STORY_DIR, os.path.basename(resp.json()["media_url"]))
+
+    db = database.SessionLocal()
+    expired = datetime.utcnow() - timedelta(minutes=1)
+    db.query(models.Story).filter(models.Story.id.in_([1, 2])).update({models.Story.expires_at: expired})
+    db.commit()
+    # ficheiros antigos, fora do período de graça
+    for path in paths.values():
+        os.utime(path, (0, 0))
+
+    assert stories.expire_stories(db, main.STORY_DIR) == (2, 1)
+    # o ficheiro partilhado com a story ativa fica
+    assert not os.path.exists(paths["alone"])
+    assert os.path.exists(paths["old"]) and os.path.exists(paths["fresh"])
+    assert sorted(s["id"] for s in client.get(f"/vendors/{vendor_id}/stories").json()) == [3, 4]
+    assert stories.expire_stories(db, main.STORY_DIR) == (0, 0)
+
+    # um ficheiro reenviado há pouco não é apagado...
+    db.query(models.Story).update({models.Story.expires_at: expired})
+    db.commit()
+    client.post(f"/vendors/{vendor_id}/stories", files={"file": ("s.mp4", fresh, "video/mp4")}, headers=headers)
+    db.query(models.Story).update({models.Story.expires_at: expired})
+    db.commit()
+    assert stories.expire_stories(db, main.STORY_DIR) == (3, 1)
+    assert os.path.exists(paths["fresh"])
+    assert not os.path.exists(paths["old"])
+
+    # ...mas sem stories a usá-lo é apagado num sweep seguinte, tal como os
+    # temporários abandonados
+    leftover = os.path.join(main.STORY_DIR, ".upload-abandoned")
+    open(leftover, "wb").close()
+    for path in (paths["fresh"], leftover):
+        os.utime(path, (0, 0))
+    assert stories.expire_stories(db, main.STORY_DIR) == (0, 1)
+    assert os.listdir(main.STORY_DIR) == []
+    db.close()
+
+
+def test_story_sweeper_keeps_files_rewritten_by_uploads(client, tmp_path, monkeypatch):
+    import time
+    from backend.app import stories
+
+    directory = tmp_path / "sweep"
+    directory.mkdir()
+    path = str(directory / "abc.mp4")
+    with open(path, "wb") as f:
+        f.write(b"old")
+    cutoff = time.time() - stories.FILE_GRACE_SECONDS
+
+    # o upload substituiu o ficheiro depois de o sweeper o ver antigo
+    assert stories._remove_if_stale(path, cutoff) is False
+    assert os.listdir(directory) == ["abc.mp4"]
+
+    # o upload grava-o de novo enquanto o antigo está a ser apagado
+    os.utime(path, (0, 0))
+    rename = os.rename
+
+    def rename_during_upload(src, dst):
+        rename(src, dst)
+        with open(src, "wb") as f:
+            f.write(b"new")
+
+    monkeypatch.setattr(stories.os, "rename", rename_during_upload)
+    assert stories._remove_if_stale(path, cutoff) is True
+    with open(path, "rb") as f:
+        assert f.read() == b"new"
+    assert os.listdir(directory) == ["abc.mp4"]
+
+
+def test_stories_of_many_vendors_in_one_request(client):
+    from backend.app import database, models
+
+    ids = []
+    for i in range(3):
+        resp = register_vendor(client, email=f"v{i}@example.com")
+        ids.append(resp.json()["id"])
+        confirm_latest_email(client)
+    for vendor_id in ids[:2]:
+        token = get_token(client, email=f"v{vendor_id - 1}@example.com")
+        for _ in range(vendor_id):
+            client.post(
+                f"/vendors/{vendor_id}/stories",
+                files={"file": ("s.png", os.urandom(10), "image/png")},
+                headers={"Authorization": f"Bearer {token}"},
+            )
+
+    db = database.SessionLocal()
+    db.query(models.Story).filter(models.Story.id == 1).update(
+        {models.Story.expires_at: datetime.utcnow() - timedelta(minutes=1)}
+    )
+    db.commit()
+    db.close()
+
+    resp = client.get("/vendors/stories", params={"vendor_ids": ",".join(map(str, ids))})
+    assert resp.status_code == 200
+    body = resp.json()
+    # o vendedor 1 só tinha uma story, já expirada; o 3 não tem nenhuma
+    assert [v["vendor_id"] for v in body] == [2]
+    assert [s["id"] for s in body[0]["stories"]] == [3, 2]
+
+    assert client.get("/vendors/stories", params={"vendor_ids": "1,x"}).status_code == 400
+    too_many = ",".join(str(i) for i in range(1000))
+    assert client.get("/vendors/stories", params={"vendor_ids": too_many}).status_code == 400
+    assert client.get("/vendors/stories").status_code == 400
+
+
+def test_stories_feed_by_viewport_with_etag(client):
+    from backend.app import main
+
+    vendors = []
+    for i, (lat, lng) in enumerate([(38.70, -9.10), (38.71, -9.11), (41.15, -8.61)]):
+        email = f"v{i}@example.com"
+        vendor_id = register_vendor(client, email=email).json()["id"]
+        confirm_latest_email(client)
+        activate_subscription(client, vendor_id)
+        headers = {"Authorization": f"Bearer {get_token(client, email=email)}"}
+        client.post(f"/vendors/{vendor_id}/routes/start", headers=headers)
+        client.put(f"/vendors/{vendor_id}/location", json={"lat": lat, "lng": lng}, headers=headers)
+        client.post(
+            f"/vendors/{vendor_id}/stories",
+            files={"file": ("s.png", os.urandom(10), "image/png")},
+            headers=headers,
+        )
+        vendors.append((vendor_id, headers))
+    main.live_store.flush()
+
+    lisbon = {"bbox": "38.6,-9.2,38.8,-9.0"}
+    resp = client.get("/vendors/stories", params=lisbon)
+    assert resp.status_code == 200
+    assert [v["vendor_id"] for v in resp.json()] == [vendors[0][0], vendors[1][0]]
+    etag = resp.headers["etag"]
+    assert resp.headers["cache-control"] == "no-cache"
+
+    # sem alterações: 304 sem corpo
+    resp = client.get("/vendors/stories", params=lisbon, headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+    assert resp.content == b""
+    assert resp.headers["etag"] == etag
+
+    # vendor_ids e bbox juntos: só os dois critérios
+    resp = client.get("/vendors/stories", params={**lisbon, "vendor_ids": f"{vendors[1][0]},{vendors[2][0]}"})
+    assert [v["vendor_id"] for v in resp.json()] == [vendors[1][0]]
+
+    # uma story nova muda o ETag
+    vendor_id, headers = vendors[0]
+    client.post(
+        f"/vendors/{vendor_id}/stories",
+        files={"file": ("s.png", os.urandom(10), "image/png")},
+        headers=headers,
+    )
+    resp = client.get("/vendors/stories", params=lisbon, headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert resp.headers["etag"] != etag
+    assert len(resp.json()[0]["stories"]) == 2
+
+    # quem termina o trajeto sai do mapa (também sem posições em memória)
+    client.post(f"/vendors/{vendor_id}/routes/stop", headers=headers)
+    assert [v["vendor_id"] for v in client.get("/vendors/stories", params=lisbon).json()] == [vendors[1][0]]
+    main.live_store.seeded = False
+    assert [v["vendor_id"] for v in client.get("/vendors/stories", params=lisbon).json()] == [vendors[1][0]]
+
+    assert client.get("/vendors/stories", params={"bbox": "1,2,3"}).status_code == 400
+    assert client.get("/vendors/stories", params={"bbox": "50,0,40,1"}).status_code == 400
+
+
+def test_route_points_are_stored_as_rows(client):
+    from backend.app import main, models
+
+    resp = register_vendor(client)
+    vendor_id = resp.json()["id"]
+    confirm_latest_email(client)
+    activate_subscription(client, vendor_id)
+    token = get_token(client)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    route_id = client.post(f"/vendors/{vendor_id}/routes/start", headers=headers).json()["id"]
+    for lat in (1.0, 1.001, 1.002):
+        client.put(f"/vendors/{vendor_id}/location", json={"lat": lat, "lng": 1.0}, headers=headers)
+
+    # os pontos ficam em memória até ao próximo flush em lote
+    db = main.SessionLocal()
+    try:
+        assert db.query(models.RoutePoint).filter_by(route_id=route_id).count() == 0
+        assert main.live_store.flush() == 3
+        route = db.query(models.Route).get(route_id)
+        assert route.points is None
+        assert route.last_lat == 1.002
+        rows = db.query(models.RoutePoint).filter_by(route_id=route_id).all()
+        assert [p.lat for p in rows] == [1.0, 1.001, 1.002]
+        assert db.query(models.Vendor).get(vendor_id).current_lat == 1.002
+    finally:
+        db.close()
+
+    route = client.post(f"/vendors/{vendor_id}/routes/stop", headers=headers).json()
+    assert [p["lat"] for p in route["points"]] == [1.0, 1.001, 1.002]
+    assert route["distance_m"] == pytest.approx(222.4, abs=1)
+
+
+def test_migrate_legacy_route_points(client):
+    from backend.app import main, models, migrations
+
+    resp = register_vendor(client)
+    vendor_id = resp.json()["id"]
+    confirm_latest_email(client)
+    token = get_token(client)
+
+    legacy = [
+        {"lat": 1.0, "lng": 1.0, "t": "2024-07-01T10:00:00"},
+        {"lat": 1.001, "lng": 1.0, "t": "2024-07-01T10:00:01"},
+    ]
+    db = main.SessionLocal()
+    try:
+        route = models.Route(vendor_id=vendor_id, points=json.dumps(legacy), distance_m=111.2)
+        db.add(route)
+        db.commit()
+        route_id = route.id
+
+        # os blobs antigos continuam legíveis antes da migração
+        resp = client.get(f"/vendors/{vendor_id}/routes", headers={"Authorization": f"Bearer {token}"})
+        assert resp.json()[0]["points"] == legacy
+
+        assert migrations.migrate_route_points(db) == 1
+        assert migrations.migrate_route_points(db) == 0
+        assert db.query(models.RoutePoint).filter_by(route_id=route_id).count() == 2
+    finally:
+        db.close()
+
+    resp = client.get(f"/vendors/{vendor_id}/routes", headers={"Authorization": f"Bearer {token}"})
+    assert resp.json()[0]["points"] == legacy
+
+
+def test_route_distance_is_accumulated_live(client):
+    resp = register_vendor(client)
+    vendor_id = resp.json()["id"]
+    confirm_latest_email(client)
+    activate_subscription(client, vendor_id)
+    token = get_token(client)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    client.post(f"/vendors/{vendor_id}/routes/start", headers=headers)
+    client.put(f"/vendors/{vendor_id}/location", json={"lat": 1.0, "lng": 1.0}, headers=headers)
+    client.put(f"/vendors/{vendor_id}/location", json={"lat": 1.001, "lng": 1.0}, headers=headers)
+
+    # a distância do trajeto aberto já está disponível antes de o terminar
+    routes = client.get(f"/vendors/{vendor_id}/routes", headers=headers).json()
+    assert routes[0]["end_time"] is None
+    assert routes[0]["distance_m"] == pytest.approx(111.2, abs=1)
+
+    client.put(f"/vendors/{vendor_id}/location", json={"lat": 1.002, "lng": 1.0}, headers=headers)
+    route = client.post(f"/vendors/{vendor_id}/routes/stop", headers=headers).json()
+    assert route["distance_m"] == pytest.approx(222.4, abs=1)
+
+
+def test_add_missing_columns_upgrades_old_tables(tmp_path):
+    from sqlalchemy import create_engine, inspect, text
+    from backend.app import migrations
+
+    engine = create_engine(f"sqlite:///{tmp_path}/old.db")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE routes (id INTEGER PRIMARY KEY, vendor_id INTEGER, start_time DATETIME, "
+            "end_time DATETIME, points VARCHAR, distance_m FLOAT)"
+        ))
+
+    added = migrations.add_missing_columns(engine)
+    assert "routes.last_lat" in added
+    columns = {c["name"] for c in inspect(engine).get_columns("routes")}
+    assert {"last_lat", "last_lng", "last_point_at"} <= columns
+    assert migrations.add_missing_columns(engine) == []
+
+
+def test_live_store_survives_restart(client):
+    from backend.app import main, live
+
+    resp = register_vendor(client)
+    vendor_id = resp.json()["id"]
+    confirm_latest_email(client)
+    activate_subscription(client, vendor_id)
+    token = get_token(client)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    route_id = client.post(f"/vendors/{vendor_id}/routes/start", headers=headers).json()["id"]
+    client.put(f"/vendors/{vendor_id}/location", json={"lat": 1.0, "lng": 1.0}, headers=headers)
+    main.live_store.flush()
+
+    # um novo processo recupera o trajeto aberto e continua a acumular distância
+    store = live.LiveLocationStore(main.SessionLocal)
+    store.seed()
+    position = store.get(vendor_id)
+    assert (position.route_id, position.lat, position.lng) == (route_id, 1.0, 1.0)
+    store.update(vendor_id, 1.001, 1.0, position.t)
+    store.flush()
+
+    routes = client.get(f"/vendors/{vendor_id}/routes", headers=headers).json()
+    assert routes[0]["distance_m"] == pytest.approx(111.2, abs=1)
+    assert len(routes[0]["points"]) == 2
+
+
+def test_websocket_area_subscription(client):
+    resp = register_vendor(client)
+    vendor_id = resp.json()["id"]
+    confirm_latest_email(client)
+    activate_subscription(client, vendor_id)
+    token = get_token(client)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    client.post(f"/vendors/{vendor_id}/routes/start", headers=headers)
+    with client.websocket_connect("/ws/locations") as websocket:
+        websocket.send_text("not json")
+        assert websocket.receive_json()["type"] == "error"
+        websocket.send_json({"bbox": [38.6, -9.3, 38.8, -9.0]})
+        assert websocket.receive_json() == {"type": "subscribed"}
+
+        # fora da zona: não é enviado
+        client.put(f"/vendors/{vendor_id}/location", json={"lat": 41.15, "lng": -8.61}, headers=headers)
+        client.put(f"/vendors/{vendor_id}/location", json={"lat": 38.7, "lng": -9.1}, headers=headers)
+        assert websocket.receive_json() == {"vendor_id": vendor_id, "lat": 38.7, "lng": -9.1}
+
+
+def test_websocket_batched_updates(client):
+    resp = register_vendor(client)
+    vendor_id = resp.json()["id"]
+    confirm_latest_email(client)
+    activate_subscription(client, vendor_id)
+    token = get_token(client)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    client.post(f"/vendors/{vendor_id}/routes/start", headers=headers)
+    with client.websocket_connect("/ws/locations?batch_ms=500") as websocket:
+        client.put(f"/vendors/{vendor_id}/location", json={"lat": 1.0, "lng": 2.0}, headers=headers)
+        client.put(f"/vendors/{vendor_id}/location", json={"lat": 1.5, "lng": 2.5}, headers=headers)
+        assert websocket.receive_json() == {
+            "type": "batch",
+            "updates": [{"vendor_id": vendor_id, "lat": 1.5, "lng": 2.5}],
+        }
+
+
+def test_websocket_snapshot_and_resume(client):
+    resp = register_vendor(client)
+    vendor_id = resp.json()["id"]
+    confirm_latest_email(client)
+    activate_subscription(client, vendor_id)
+    token = get_token(client)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    client.post(f"/vendors/{vendor_id}/routes/start", headers=headers)
+    client.put(f"/vendors/{vendor_id}/location", json={"lat": 1.0, "lng": 2.0}, headers=headers)
+
+    with client.websocket_connect("/ws/locations?snapshot=1") as websocket:
+        snapshot = websocket.receive_json()
+        assert snapshot["type"] == "snapshot"
+        assert snapshot["vendors"] == [[vendor_id, 1.0, 2.0]]
+        client.put(f"/vendors/{vendor_id}/location", json={"lat": 1.5, "lng": 2.5}, headers=headers)
+        delta = websocket.receive_json()
+        assert delta == {"vendor_id": vendor_id, "lat": 1.5, "lng": 2.5, "seq": snapshot["seq"] + 1}
+
+    client.post(f"/vendors/{vendor_id}/routes/stop", headers=headers)
+    url = f"/ws/locations?since={delta['seq']}&epoch={snapshot['epoch']}"
+    with client.websocket_connect(url) as websocket:
+        assert websocket.receive_json() == {
+            "vendor_id": vendor_id, "lat": None, "lng": None, "remove": True, "seq": delta["seq"] + 1,
+        }
+
+
+def test_location_events_are_shared_between_workers(client):
+    from backend.app import main
+
+    resp = register_vendor(client)
+    vendor_id = resp.json()["id"]
+    confirm_latest_email(client)
+    activate_subscription(client, vendor_id)
+    token = get_token(client)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    published = []
+    main.pubsub.publish = published.append
+    route_id = client.post(f"/vendors/{vendor_id}/routes/start", headers=headers).json()["id"]
+    client.put(f"/vendors/{vendor_id}/location", json={"lat": 1.0, "lng": 2.0}, headers=headers)
+    assert [e["kind"] for e in published] == ["start", "location"]
+    assert published[1]["route_id"] == route_id
+
+    # evento de outro worker: chega aos WebSockets deste sem ser gravado de novo
+    with client.websocket_connect("/ws/locations") as websocket:
+        event = {**published[1], "lat": 3.0, "lng": 4.0}
+        client.portal.call(main.apply_remote_event, event)
+        assert websocket.receive_json() == {"vendor_id": vendor_id, "lat": 3.0, "lng": 4.0}
+    assert main.live_store.get(vendor_id).lat == 3.0
+    assert main.live_store.pending_count() == 1
+
+    client.portal.call(main.apply_remote_event, {"kind": "stop", "vendor_id": vendor_id})
+    assert main.live_store.get(vendor_id) is None
+
+
+def test_points_buffered_by_another_worker_after_stop_are_discarded(client):
+    from backend.app import database, live, main, models
+
+    vendor_id = register_vendor(client).json()["id"]
+    confirm_latest_email(client)
+    activate_subscription(client, vendor_id)
+    headers = {"Authorization": f"Bearer {get_token(client)}"}
+    route_id = client.post(f"/vendors/{vendor_id}/routes/start", headers=headers).json()["id"]
+    client.put(f"/vendors/{vendor_id}/location", json={"lat": 1.0, "lng": 1.0}, headers=headers)
+
+    # o outro worker recebeu dois pontos; grava o primeiro antes do stop
+    other = live.LiveLocationStore(main.SessionLocal)
+    other.activate(vendor_id, route_id, 1.0, 1.0)
+    other.update(vendor_id, 1.001, 1.0, datetime.utcnow())
+    assert other.flush() == 1
+    other.update(vendor_id, 1.002, 1.0, datetime.utcnow())
+
+    # o stop avisa os outros workers para gravarem já
+    published = []
+    main.pubsub.publish = published.append
+    route = client.post(f"/vendors/{vendor_id}/routes/stop", headers=headers).json()
+    assert [e["kind"] for e in published] == ["stop"]
+    assert len(route["points"]) == 2
+    assert route["distance_m"] == pytest.approx(111.2, abs=1)
+
+    # o ponto que chegou depois de fechar o trajeto não o altera
+    assert other.flush() == 0
+    assert other.discarded == 1
+    db = database.SessionLocal()
+    closed = db.get(models.Route, route_id)
+    assert closed.distance_m == pytest.approx(route["distance_m"])
+    assert db.query(models.RoutePoint).filter_by(route_id=route_id).count() == 2
+    assert db.get(models.Vendor, vendor_id).current_lat is None
+    db.close()
+    daily = client.get(f"/vendors/{vendor_id}/stats/daily", headers=headers).json()
+    assert daily[0]["distance_m"] == pytest.approx(route["distance_m"])
+
+
+def test_vendor_listing_query_count_is_constant(client):
+    from backend.app import database, models
+
+    def add_vendors(start, count):
+        db = database.SessionLocal()
+        for i in range(start, start + count):
+            vendor = models.Vendor(
+                name=f"V{i}", email=f"v{i}@example.com", product="Gelados", profile_photo="p.png",
+                rating_sum=6, rating_count=2,
+            )
+            db.add(vendor)
+            db.flush()
+            db.add(models.Route(vendor_id=vendor.id))
+        db.commit()
+        db.close()
+
+    def listing_statements():
+        with request_statements() as statements:
+            vendors = client.get("/vendors/").json()
+        return vendors, len(statements)
+
+    add_vendors(0, 2)
+    vendors, few = listing_statements()
+    assert [v["rating_average"] for v in vendors] == [3.0, 3.0]
+
+    add_vendors(2, 30)
+    vendors, many = listing_statements()
+    assert len(vendors) == 32
+    assert many == few == 1
+
+
+def test_rating_aggregates_follow_review_writes(client):
+    from backend.app import database, migrations, models
+
+    resp = register_vendor(client)
+    vendor_id = resp.json()["id"]
+    confirm_latest_email(client)
+    client_id = register_client(client).json()["id"]
+    confirm_latest_client_email(client)
+    ctoken = get_client_token(client)
+    cheaders = {"Authorization": f"Bearer {ctoken}"}
+
+    reviews = [
+        client.post(f"/vendors/{vendor_id}/reviews", json={"rating": r}, headers=cheaders).json()
+        for r in (5, 4, 1)
+    ]
+    token = get_token(client)
+    headers = {"Authorization": f"Bearer {token}"}
+    for _ in range(2):  # apagar duas vezes não desconta a avaliação duas vezes
+        client.delete(f"/vendors/{vendor_id}/reviews/{reviews[2]['id']}", headers=headers)
+
+    vendor = next(v for v in client.get("/vendors/").json() if v["id"] == vendor_id)
+    assert vendor["rating_average"] == 4.5
+
+    # favoritos usam os mesmos valores
+    client.post(f"/clients/{client_id}/favorites/{vendor_id}", headers=cheaders)
+    favorites = client.get(f"/clients/{client_id}/favorites", headers=cheaders).json()
+    assert [v["rating_average"] for v in favorites] == [4.5]
+
+    # o backfill recalcula a partir das avaliações ativas
+    db = database.SessionLocal()
+    db.query(models.Vendor).update({models.Vendor.rating_sum: None, models.Vendor.rating_count: None})
+    db.commit()
+    migrations.backfill_vendor_ratings(db)
+    vendor = db.get(models.Vendor, vendor_id)
+    assert (vendor.rating_sum, vendor.rating_count) == (9, 2)
+    db.close()
+
+
+def test_concurrent_review_deletes_discount_rating_once(client):
+    from types import SimpleNamespace
+    from backend.app import database, main, models
+
+    vendor_id = register_vendor(client).json()["id"]
+    confirm_latest_email(client)
+    register_client(client)
+    confirm_latest_client_email(client)
+    cheaders = {"Authorization": f"Bearer {get_client_token(client)}"}
+    for rating in (5, 1):
+        review = client.post(f"/vendors/{vendor_id}/reviews", json={"rating": rating}, headers=cheaders).json()
+
+    # este pedido leu a review ainda ativa quando o outro a apagou
+    stale = database.SessionLocal()
+    stale_review = stale.get(models.Review, review["id"])
+    assert stale_review.active is True
+    headers = {"Authorization": f"Bearer {get_token(client)}"}
+    client.delete(f"/vendors/{vendor_id}/reviews/{review['id']}", headers=headers)
+    main.delete_review(vendor_id, review["id"], db=stale, current_vendor=SimpleNamespace(id=vendor_id))
+    stale.close()
+
+    db = database.SessionLocal()
+    vendor = db.get(models.Vendor, vendor_id)
+    assert (vendor.rating_sum, vendor.rating_count) == (5, 1)
+    db.close()
+
+def test_nearby_vendors(client):
+    from backend.app import main
+
+    vendors = []
+    for i, (lat, lng) in enumerate([(38.7000, -9.1000), (38.7020, -9.1000), (38.7500, -9.1000)]):
+        vendor_id = register_vendor(client, email=f"v{i}@example.com").json()["id"]
+        confirm_latest_email(client)
+        activate_subscription(client, vendor_id)
+        headers = {"Authorization": f"Bearer {get_token(client, email=f'v{i}@example.com')}"}
+        client.post(f"/vendors/{vendor_id}/routes/start", headers=headers)
+        client.put(f"/vendors/{vendor_id}/location", json={"lat": lat, "lng": lng}, headers=headers)
+        vendors.append(vendor_id)
+    main.live_store.flush()
+    db = main.SessionLocal()
+    db.query(main.models.Vendor).filter(main.models.Vendor.id.in_([vendors[0], vendors[2]])).update(
+        {main.models.Vendor.product: "Gelados"}
+    )
+    db.commit()
+    db.close()
+
+    resp = client.get("/vendors/nearby", params={"lat": 38.7001, "lng": -9.1, "radius_m": 1000})
+    assert resp.status_code == 200
+    nearby = resp.json()
+    assert [v["id"] for v in nearby] == vendors[:2]
+    assert nearby[0]["distance_m"] < nearby[1]["distance_m"] < 1000
+
+    resp = client.get("/vendors/nearby", params={"lat": 38.7001, "lng": -9.1, "radius_m": 1000, "product": "Gelados"})
+    assert [v["id"] for v in resp.json()] == vendors[:1]
+
+    # sem posições em memória a pesquisa é feita na base de dados
+    main.live_store.seeded = False
+    resp = client.get("/vendors/nearby", params={"lat": 38.7001, "lng": -9.1, "radius_m": 10000})
+    assert [v["id"] for v in resp.json()] == vendors
+
+    assert client.get("/vendors/nearby", params={"lat": 38.7, "lng": -9.1, "radius_m": 0}).status_code == 422
+
+
+def test_route_stats_endpoint(client):
+    vendor_id = register_vendor(client).json()["id"]
+    confirm_latest_email(client)
+    activate_subscription(client, vendor_id)
+    headers = {"Authorization": f"Bearer {get_token(client)}"}
+
+    route_id = client.post(f"/vendors/{vendor_id}/routes/start", headers=headers).json()["id"]
+    for lng in (0.0, 0.001, 0.002):
+        client.put(f"/vendors/{vendor_id}/location", json={"lat": 0.0, "lng": lng}, headers=headers)
+
+    stats = client.get(f"/vendors/{vendor_id}/routes/{route_id}/stats", headers=headers).json()
+    assert stats["id"] == route_id
+    assert stats["distance_m"] == pytest.approx(222.4, abs=0.5)
+    assert stats["bbox"] == [0.0, 0.0, 0.0, 0.002]
+
+    route = client.post(f"/vendors/{vendor_id}/routes/stop", headers=headers).json()
+    assert route["distance_m"] == pytest.approx(stats["distance_m"])
+    assert client.get(f"/vendors/{vendor_id}/routes/999/stats", headers=headers).status_code == 404
+
+
+def test_simplified_route_retrieval(client):
+    from backend.app import database, models
+
+    vendor_id = register_vendor(client).json()["id"]
+    confirm_latest_email(client)
+    activate_subscription(client, vendor_id)
+    headers = {"Authorization": f"Bearer {get_token(client)}"}
+
+    client.post(f"/vendors/{vendor_id}/routes/start", headers=headers)
+    # linha reta para norte com uma curva a meio
+    track = [(38.7 + i * 1e-4, -9.1) for i in range(20)] + [(38.7019, -9.1 + i * 1e-4) for i in range(1, 20)]
+    for lat, lng in track:
+        client.put(f"/vendors/{vendor_id}/location", json={"lat": lat, "lng": lng}, headers=headers)
+
+    # trajeto aberto: simplificado em memória
+    open_route = client.get(f"/vendors/{vendor_id}/routes", params={"tolerance_m": 5}, headers=headers).json()[0]
+    assert len(open_route["points"]) == 3
+
+    client.post(f"/vendors/{vendor_id}/routes/stop", headers=headers)
+    db = database.SessionLocal()
+    assert db.query(models.RoutePoint).filter(models.RoutePoint.importance == None).count() == 0
+    db.close()
+
+    raw = client.get(f"/vendors/{vendor_id}/routes", headers=headers).json()[0]
+    assert len(raw["points"]) == len(track)
+    simplified = client.get(f"/vendors/{vendor_id}/routes", params={"tolerance_m": 5}, headers=headers).json()[0]
+    assert [(p["lat"], p["lng"]) for p in simplified["points"]] == [track[0], track[19], track[-1]]
+    capped = client.get(f"/vendors/{vendor_id}/routes", params={"max_points": 2}, headers=headers).json()[0]
+    assert [(p["lat"], p["lng"]) for p in capped["points"]] == [track[0], track[-1]]
+    assert client.get(f"/vendors/{vendor_id}/routes", params={"max_points": 1}, headers=headers).status_code == 422
+
+
+def test_paginated_route_summaries(client):
+    from backend.app import database, models
+
+    vendor_id = register_vendor(client).json()["id"]
+    confirm_latest_email(client)
+    activate_subscription(client, vendor_id)
+    headers = {"Authorization": f"Bearer {get_token(client)}"}
+
+    db = database.SessionLocal()
+    start = datetime(2024, 7, 1, 9, 0)
+    for i in range(5):
+        route = models.Route(
+            vendor_id=vendor_id, start_time=start + timedelta(days=i), end_time=start + timedelta(days=i, hours=2),
+            distance_m=1000.0 * i,
+        )
+        db.add(route)
+        db.flush()
+        db.add(models.RoutePoint(route_id=route.id, lat=38.7, lng=-9.1, t=route.start_time))
+    # dois trajetos com o mesmo início não se perdem entre páginas
+    db.add(models.Route(vendor_id=vendor_id, start_time=start, distance_m=7.0))
+    db.commit()
+    db.close()
+
+    seen, cursor = [], None
+    while True:
+        params = {"fields": "summary", "limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        resp = client.get(f"/vendors/{vendor_id}/routes", params=params, headers=headers)
+        assert resp.status_code == 200
+        page = resp.json()
+        assert all("points" not in r for r in page)
+        seen += page
+        cursor = resp.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert len(seen) == 6 and len({r["id"] for r in seen}) == 6
+    assert [r["distance_m"] for r in seen[:4]] == [4000.0, 3000.0, 2000.0, 1000.0]
+
+    full = client.get(f"/vendors/{vendor_id}/routes", params={"limit": 1}, headers=headers).json()
+    assert full[0]["points"] == [{"lat": 38.7, "lng": -9.1, "t": "2024-07-05T09:00:00"}]
+
+    detail = client.get(f"/vendors/{vendor_id}/routes/{full[0]['id']}", headers=headers)
+    assert detail.status_code == 200 and detail.json() == full[0]
+    assert client.get(f"/vendors/{vendor_id}/routes/9999", headers=headers).status_code == 404
+    assert client.get(f"/vendors/{vendor_id}/routes", params={"cursor": "???"}, headers=headers).status_code == 400
+
+
+def test_route_listing_flushes_only_for_pending_full_reads(client):
+    from backend.app import main
+
+    tokens = {}
+    for i in range(2):
+        email = f"v{i}@example.com"
+        vendor_id = register_vendor(client, email=email).json()["id"]
+        confirm_latest_email(client)
+        activate_subscription(client, vendor_id)
+        tokens[vendor_id] = {"Authorization": f"Bearer {get_token(client, email=email)}"}
+    mover, idle = tokens
+    client.post(f"/vendors/{mover}/routes/start", headers=tokens[mover])
+    client.put(f"/vendors/{mover}/location", json={"lat": 1.0, "lng": 1.0}, headers=tokens[mover])
+    assert main.live_store.pending_count() == 1
+
+    # o resumo e quem não tem pontos por gravar não fazem flush
+    summary = client.get(f"/vendors/{mover}/routes", params={"fields": "summary"}, headers=tokens[mover]).json()
+    assert [r["distance_m"] for r in summary] == [0.0]
+    client.get(f"/vendors/{idle}/routes", headers=tokens[idle])
+    assert main.live_store.pending_count() == 1
+
+    full = client.get(f"/vendors/{mover}/routes", headers=tokens[mover]).json()
+    assert len(full[0]["points"]) == 1
+    assert main.live_store.pending_count() == 0
+
+def test_daily_stats_rollup(client):
+    from backend.app import database, migrations, models
+
+    vendor_id = register_vendor(client).json()["id"]
+    confirm_latest_email(client)
+    activate_subscription(client, vendor_id)
+    headers = {"Authorization": f"Bearer {get_token(client)}"}
+
+    # start com um trajeto ainda aberto fecha-o e também conta
+    for _ in range(2):
+        client.post(f"/vendors/{vendor_id}/routes/start", headers=headers)
+        for lng in (0.0, 0.001):
+            client.put(f"/vendors/{vendor_id}/location", json={"lat": 0.0, "lng": lng}, headers=headers)
+    client.post(f"/vendors/{vendor_id}/routes/stop", headers=headers)
+
+    today = datetime.utcnow().date().isoformat()
+    stats = client.get(f"/vendors/{vendor_id}/stats/daily", headers=headers).json()
+    assert len(stats) == 1
+    assert stats[0]["date"] == today and stats[0]["route_count"] == 2
+    assert stats[0]["distance_m"] == pytest.approx(2 * 111.2, abs=0.5)
+
+    resp = client.get(f"/vendors/{vendor_id}/stats/daily", params={"from": "2000-01-01", "to": "2000-12-31"}, headers=headers)
+    assert resp.json() == []
+
+    # o backfill chega aos mesmos totais
+    db = database.SessionLocal()
+    db.query(models.DailyStat).delete()
+    db.commit()
+    assert migrations.backfill_daily_stats(db) == 1
+    db.close()
+    rebuilt = client.get(f"/vendors/{vendor_id}/stats/daily", headers=headers).json()
+    assert rebuilt[0]["route_count"] == 2
+    assert rebuilt[0]["distance_m"] == pytest.approx(stats[0]["distance_m"])
+
+
+def test_authenticated_vendor_is_cached_until_invalidated(client):
+    from backend.app import main
+
+    vendor_id = register_vendor(client).json()["id"]
+    confirm_latest_email(client)
+    activate_subscription(client, vendor_id)
+    headers = {"Authorization": f"Bearer {get_token(client)}"}
+    client.post(f"/vendors/{vendor_id}/routes/start", headers=headers)
+
+    # com o token em cache, uma atualização de localização não vai à base de dados
+    with request_statements() as statements:
+        resp = client.put(f"/vendors/{vendor_id}/location", json={"lat": 1.0, "lng": 2.0}, headers=headers)
+    assert resp.status_code == 200
+    assert statements == []
+
+    # desativar a subscrição apaga o cache e o pedido seguinte já é recusado
+    main.ADMIN_TOKEN = "admin"
+    client.post(f"/admin/vendors/{vendor_id}/deactivate", headers={"X-Admin-Token": "admin"})
+    resp = client.put(f"/vendors/{vendor_id}/location", json={"lat": 1.0, "lng": 2.1}, headers=headers)
+    assert resp.status_code == 403
+
+    # e o webhook do Stripe volta a ativá-la
+    activate_subscription(client, vendor_id)
+    resp = client.put(f"/vendors/{vendor_id}/location", json={"lat": 1.0, "lng": 2.2}, headers=headers)
+    assert resp.status_code == 200
+
+    # o mesmo token não serve como cliente
+    assert client.get(f"/clients/{vendor_id}/favorites", headers=headers).status_code == 401
+
+
+def test_expired_subscription_is_swept_in_background(client):
+    from backend.app import database, main, models, subscriptions
+
+    vendor_id = register_vendor(client).json()["id"]
+    confirm_latest_email(client)
+    activate_subscription(client, vendor_id)
+    headers = {"Authorization": f"Bearer {get_token(client)}"}
+    client.post(f"/vendors/{vendor_id}/routes/start", headers=headers)
+    assert len(main.principal_cache) == 1
+
+    db = database.SessionLocal()
+    db.query(models.Vendor).update({models.Vendor.subscription_valid_until: datetime.utcnow() - timedelta(days=1)})
+    db.commit()
+    main.principal_cache.clear()
+
+    # o pedido recusa a subscrição expirada sem escrever na base de dados
+    with request_statements() as statements:
+        resp = client.put(f"/vendors/{vendor_id}/location", json={"lat": 1.0, "lng": 2.0}, headers=headers)
+    assert resp.status_code == 403
+    assert not [s for s in statements if not s.lstrip().upper().startswith("SELECT")]
+    assert db.get(models.Vendor, vendor_id).subscription_active is True
+
+    # o sweeper desativa-a num único UPDATE e limpa o cache
+    assert len(main.principal_cache) == 1
+    expired = subscriptions.expire_subscriptions(db)
+    assert expired == [vendor_id]
+    main.invalidate_vendors(expired)
+    assert len(main.principal_cache) == 0
+    db.expire_all()
+    assert db.get(models.Vendor, vendor_id).subscription_active is False
+    assert subscriptions.expire_subscriptions(db) == []
+    db.close()
+
+
+def test_admin_metrics_report_password_hashing(client):
+    from backend.app import main
+
+    register_vendor(client)
+    confirm_latest_email(client)
+    get_token(client)
+    assert client.post("/token", json={"email": "vendor@example.com", "password": "Wrong123"}).status_code == 400
+
+    assert client.get("/admin/metrics").status_code == 401
+    main.ADMIN_TOKEN = "admin"
+    metrics = client.get("/admin/metrics", headers={"X-Admin-Token": "admin"}).json()
+    hashing = metrics["password_hashing"]
+    # um hash no registo e duas verificações no /token
+    assert hashing["completed"] == 3
+    assert hashing["queued"] == 0 and hashing["active"] == 0
+    assert hashing["workers"] == main.PASSWORD_HASH_WORKERS
+    assert set(metrics["auth_cache"]) == {"size", "hits", "misses"}
+
+
+def test_profile_photo_variants_are_generated_in_background(client):
+    import io
+    from PIL import Image
+    from backend.app import database, main, migrations, models
+
+    def png(color):
+        buffer = io.BytesIO()
+        Image.new("RGB", (800, 600), color).save(buffer, "PNG")
+        return buffer.getvalue()
+
+    data = {"name": "V", "email": "v@example.com", "password": "Secret123", "product": "Gelados"}
+    resp = client.post("/vendors/", data=data, files={"profile_photo": ("p.png", png("red"), "image/png")})
+    vendor = resp.json()
+    confirm_latest_email(client)
+    headers = {"Authorization": f"Bearer {get_token(client, email='v@example.com')}"}
+    resp = client.post(
+        "/clients/",
+        data={"name": "C", "email": "c@example.com", "password": "Secret123"},
+        files={"profile_photo": ("c.png", png("blue"), "image/png")},
+    )
+    client_id = resp.json()["id"]
+
+    # a resposta não espera pelas versões: ficam prontas pouco depois
+    main.image_pipeline.shutdown(wait=True)
+    listed = client.get("/vendors/").json()[0]
+    stem = os.path.splitext(vendor["profile_photo"])[0]
+    assert listed["profile_photo_variants"]["64"] == {"webp": f"{stem}_64.webp", "jpeg": f"{stem}_64.jpg"}
+    assert client.get(f"/{listed['profile_photo_variants']['64']['webp']}").status_code == 200
+    client_out = client.get(f"/clients/{client_id}").json()
+    assert set(client_out["profile_photo_variants"]) == {"64", "256", "1024"}
+
+    # uma foto nova apaga as versões antigas até as novas estarem prontas
+    main.image_pipeline = main.ImagePipeline(database.SessionLocal)
+    resp = client.patch(
+        f"/vendors/{vendor['id']}/profile",
+        files={"profile_photo": ("n.png", png("green"), "image/png")},
+        headers=headers,
+    )
+    updated = resp.json()
+    main.image_pipeline.shutdown(wait=True)
+    variants = client.get("/vendors/").json()[0]["profile_photo_variants"]
+    assert variants["256"]["jpeg"] == os.path.splitext(updated["profile_photo"])[0] + "_256.jpg"
+
+    # fotos antigas, enviadas antes das versões existirem
+    db = database.SessionLocal()
+    db.query(models.Vendor).update({models.Vendor.photo_variants: None})
+    db.commit()
+    assert migrations.generate_missing_photo_variants(db) == 1
+    db.close()
+    assert client.get("/vendors/").json()[0]["profile_photo_variants"] == variants
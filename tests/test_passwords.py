@@ -0,0 +1,74 @@
+# Testes do hash de passwords fora do event loop
+import asyncio
+import threading
+import time
+
+from backend.app.passwords import PasswordHasher
+
+
+class SlowContext:
+    """Substitui o CryptContext: demora e conta quantas chamadas correm ao mesmo tempo."""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.running = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def _work(self):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(self.delay)
+        with self.lock:
+            self.running -= 1
+
+    def hash(self, password):
+        self._work()
+        return "h:" + password
+
+    def verify(self, password, hashed):
+        self._work()
+        return hashed == "h:" + password
+
+
+def test_sync_hash_and_verify():
+    hasher = PasswordHasher(SlowContext(0), workers=1)
+    assert hasher.hash("abc") == "h:abc"
+    assert hasher.verify("abc", "h:abc")
+    assert not hasher.verify("abd", "h:abc")
+    assert hasher.metrics()["completed"] == 3
+    hasher.shutdown()
+
+
+def test_burst_is_limited_and_event_loop_stays_free():
+    context = SlowContext()
+    hasher = PasswordHasher(context, workers=2)
+
+    async def burst():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.005)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        results = asyncio.gather(*(hasher.verify_async("p", "h:p") for _ in range(8)))
+        await asyncio.sleep(0.01)
+        queued = hasher.metrics()["queued"]
+        done = await results
+        task.cancel()
+        return queued, done, ticks
+
+    queued, done, ticks = asyncio.run(burst())
+    assert done == [True] * 8
+    assert context.peak == 2
+    assert queued == 6
+    # 4 rondas de 50 ms: o loop continuou a correr o ticker entretanto
+    assert ticks >= 20
+    metrics = hasher.metrics()
+    assert metrics["max_queued"] >= 6
+    assert metrics["queued"] == 0 and metrics["active"] == 0 and metrics["completed"] == 8
+    hasher.shutdown()
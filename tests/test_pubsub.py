@@ -0,0 +1,127 @@
+# Testes da partilha de eventos entre workers
+import asyncio
+import threading
+
+from backend.app.pubsub import InProcessBroker, InProcessPubSub, RedisPubSub, encode_command, read_reply
+
+
+class FakeRedisServer:
+    """Servidor mínimo com PUBLISH/SUBSCRIBE do protocolo do Redis."""
+
+    def __init__(self):
+        self.subscribers = {}
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        for writers in self.subscribers.values():
+            for writer in writers:
+                writer.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                command = await read_reply(reader)
+                name = command[0].upper()
+                if name == b"SUBSCRIBE":
+                    for channel in command[1:]:
+                        self.subscribers.setdefault(channel, set()).add(writer)
+                        writer.write(b"*3\r\n$9\r\nsubscribe\r\n$%d\r\n%s\r\n:1\r\n" % (len(channel), channel))
+                elif name == b"PUBLISH":
+                    channel, message = command[1], command[2]
+                    receivers = self.subscribers.get(channel, set())
+                    for sub in receivers:
+                        sub.write(encode_command(b"message", channel, message))
+                    writer.write(b":%d\r\n" % len(receivers))
+                else:
+                    writer.write(b"+OK\r\n")
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            for writers in self.subscribers.values():
+                writers.discard(writer)
+
+
+def test_in_process_events_reach_other_nodes_only():
+    async def scenario():
+        broker = InProcessBroker()
+        a, b = InProcessPubSub(broker), InProcessPubSub(broker)
+        received_a, received_b = [], []
+        await a.start(received_a.append)
+        await b.start(received_b.append)
+
+        a.publish({"kind": "location", "vendor_id": 1})
+        # também pode ser chamado a partir de uma thread (endpoints síncronos)
+        thread = threading.Thread(target=a.publish, args=({"kind": "stop", "vendor_id": 1},))
+        thread.start()
+        thread.join()
+        await asyncio.sleep(0.01)
+
+        assert received_a == []
+        assert [e["kind"] for e in received_b] == ["location", "stop"]
+        await a.stop()
+        await b.stop()
+
+    asyncio.run(scenario())
+
+
+def test_redis_backend_fans_out_between_workers():
+    async def scenario():
+        server = FakeRedisServer()
+        port = await server.start()
+        workers = [RedisPubSub(f"redis://127.0.0.1:{port}/0") for _ in range(3)]
+        received = [[] for _ in workers]
+        for worker, events in zip(workers, received):
+            await worker.start(events.append)
+        for worker in workers:
+            await asyncio.wait_for(worker.connected.wait(), 1)
+
+        for i in range(5):
+            workers[0].publish({"kind": "location", "vendor_id": 7, "lat": float(i), "lng": 0.0})
+        await asyncio.sleep(0.1)
+
+        assert received[0] == []
+        for events in received[1:]:
+            assert [e["lat"] for e in events] == [0.0, 1.0, 2.0, 3.0, 4.0]
+        assert workers[0].published == 5
+
+        for worker in workers:
+            await worker.stop()
+        await server.stop()
+
+    asyncio.run(scenario())
+
+
+def test_redis_backend_reconnects():
+    async def scenario():
+        server = FakeRedisServer()
+        port = await server.start()
+        a = RedisPubSub(f"redis://127.0.0.1:{port}", reconnect_delay=0.05)
+        b = RedisPubSub(f"redis://127.0.0.1:{port}", reconnect_delay=0.05)
+        received = []
+        await a.start(lambda e: None)
+        await b.start(received.append)
+        await asyncio.wait_for(b.connected.wait(), 1)
+
+        # derruba as ligações de subscrição; o worker volta a subscrever
+        for writers in server.subscribers.values():
+            for writer in list(writers):
+                writer.close()
+        await asyncio.sleep(0.02)
+        await asyncio.wait_for(b.connected.wait(), 1)
+
+        a.publish({"kind": "stop", "vendor_id": 3})
+        await asyncio.sleep(0.1)
+        assert [e["vendor_id"] for e in received] == [3]
+
+        await a.stop()
+        await b.stop()
+        await server.stop()
+
+    asyncio.run(scenario())
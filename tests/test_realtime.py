@@ -0,0 +1,279 @@
+# Testes da distribuição de localizações por WebSocket
+import asyncio
+import json
+
+from backend.app.realtime import Area, ConnectionManager
+
+
+class FakeWebSocket:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.sent = []
+        self.frames = []
+        self.closed = False
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        await asyncio.sleep(self.delay)
+        self.frames.append(text)
+        self.sent.append(json.loads(text))
+
+    async def close(self):
+        self.closed = True
+
+
+def test_broadcast_does_not_wait_for_slow_clients():
+    async def scenario():
+        manager = ConnectionManager()
+        slow, fast = FakeWebSocket(delay=0.2), FakeWebSocket()
+        await manager.connect(slow)
+        await manager.connect(fast)
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        for i in range(10):
+            manager.broadcast({"vendor_id": i, "lat": 1.0, "lng": 2.0})
+        assert loop.time() - started < 0.05
+
+        await asyncio.sleep(0.05)
+        assert len(fast.sent) == 10
+        assert len(slow.sent) <= 1
+        for ws in (slow, fast):
+            manager.disconnect(ws)
+
+    asyncio.run(scenario())
+
+
+def test_pending_updates_are_coalesced_per_vendor():
+    async def scenario():
+        manager = ConnectionManager(max_pending=3)
+        ws = FakeWebSocket(delay=0.05)
+        await manager.connect(ws)
+
+        manager.broadcast({"vendor_id": 1, "lat": 0.0, "lng": 0.0})
+        await asyncio.sleep(0.01)  # a primeira mensagem já está a ser enviada
+        for lat in (1.0, 2.0, 3.0):
+            manager.broadcast({"vendor_id": 1, "lat": lat, "lng": 0.0})
+        for vendor_id in (2, 3, 4):
+            manager.broadcast({"vendor_id": vendor_id, "lat": 9.0, "lng": 9.0})
+        manager.broadcast({"vendor_id": 3, "lat": None, "lng": None, "remove": True})
+
+        await asyncio.sleep(0.3)
+        # vendedor 1 só manda a última posição e, como a fila é limitada a 3,
+        # a mais antiga é descartada
+        assert ws.sent == [
+            {"vendor_id": 1, "lat": 0.0, "lng": 0.0},
+            {"vendor_id": 2, "lat": 9.0, "lng": 9.0},
+            {"vendor_id": 4, "lat": 9.0, "lng": 9.0},
+            {"vendor_id": 3, "lat": None, "lng": None, "remove": True},
+        ]
+        assert manager.subscribers[ws].dropped == 1
+        manager.disconnect(ws)
+
+    asyncio.run(scenario())
+
+
+def test_failed_connection_is_dropped():
+    class BrokenWebSocket(FakeWebSocket):
+        async def send_text(self, text):
+            raise RuntimeError("connection lost")
+
+    async def scenario():
+        manager = ConnectionManager()
+        ws = BrokenWebSocket()
+        await manager.connect(ws)
+        manager.broadcast({"vendor_id": 1, "lat": 1.0, "lng": 1.0})
+        await asyncio.sleep(0.01)
+        assert manager.active_connections == []
+        assert ws.closed
+
+    asyncio.run(scenario())
+
+
+def test_area_subscriptions_only_receive_local_vendors():
+    async def scenario():
+        manager = ConnectionManager()
+        lisbon, porto, everyone = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+        for ws in (lisbon, porto, everyone):
+            await manager.connect(ws)
+        manager.set_area(lisbon, Area.from_message({"bbox": [38.6, -9.3, 38.8, -9.0]}))
+        manager.set_area(porto, Area.from_message({"geohashes": ["ez3f"]}))
+
+        manager.broadcast({"vendor_id": 1, "lat": 38.70, "lng": -9.14})  # Lisboa
+        manager.broadcast({"vendor_id": 2, "lat": 41.15, "lng": -8.61})  # Porto
+        manager.broadcast({"vendor_id": 3, "lat": 37.02, "lng": -7.93})  # Faro
+        await asyncio.sleep(0.01)
+        assert [m["vendor_id"] for m in lisbon.sent] == [1]
+        assert [m["vendor_id"] for m in porto.sent] == [2]
+        assert [m["vendor_id"] for m in everyone.sent] == [1, 2, 3]
+
+        # sair da zona e parar de partilhar continuam a chegar a quem o via
+        manager.broadcast({"vendor_id": 1, "lat": 37.02, "lng": -7.93})
+        manager.broadcast({"vendor_id": 1, "lat": None, "lng": None, "remove": True})
+        manager.broadcast({"vendor_id": 3, "lat": None, "lng": None, "remove": True})
+        await asyncio.sleep(0.01)
+        assert [m["vendor_id"] for m in lisbon.sent] == [1, 1]
+        assert lisbon.sent[-1]["lat"] == 37.02
+        assert len(porto.sent) == 1
+
+        manager.set_area(lisbon, None)
+        manager.broadcast({"vendor_id": 2, "lat": 41.15, "lng": -8.61})
+        await asyncio.sleep(0.01)
+        assert lisbon.sent[-1]["vendor_id"] == 2
+        for ws in (lisbon, porto, everyone):
+            manager.disconnect(ws)
+        assert manager.cells == {}
+
+    asyncio.run(scenario())
+
+
+def test_large_areas_use_coarser_cells():
+    area = Area.from_message({"bbox": [36.9, -9.6, 42.2, -6.2]})  # Portugal continental
+    assert 0 < len(area.cells) <= 64
+    assert area.contains(38.70, -9.14)
+    assert not area.contains(40.42, -3.70)  # Madrid
+
+
+def test_events_are_encoded_once_per_format():
+    async def scenario():
+        manager = ConnectionManager()
+        json_clients = [FakeWebSocket() for _ in range(3)]
+        array_client = FakeWebSocket()
+        for ws in json_clients:
+            await manager.connect(ws)
+        await manager.connect(array_client, "array")
+
+        manager.broadcast({"vendor_id": 7, "lat": 38.7, "lng": -9.1})
+        manager.broadcast({"vendor_id": 8, "lat": None, "lng": None, "remove": True})
+        await asyncio.sleep(0.01)
+
+        frames = [ws.frames[0] for ws in json_clients]
+        assert frames[0] == '{"vendor_id":7,"lat":38.7,"lng":-9.1}'
+        # o mesmo objeto str é reutilizado por todas as ligações
+        assert all(f is frames[0] for f in frames)
+        assert array_client.frames == ["[7,38.7,-9.1]", "[8,null,null]"]
+
+    asyncio.run(scenario())
+
+
+def test_stuck_connection_is_closed_after_send_timeout():
+    class StuckWebSocket(FakeWebSocket):
+        async def send_text(self, text):
+            await asyncio.Event().wait()
+
+    async def scenario():
+        manager = ConnectionManager(send_timeout=0.05)
+        stuck, ok = StuckWebSocket(), FakeWebSocket()
+        await manager.connect(stuck)
+        await manager.connect(ok)
+        manager.broadcast({"vendor_id": 1, "lat": 1.0, "lng": 1.0})
+        await asyncio.sleep(0.15)
+        assert manager.active_connections == [ok]
+        assert stuck.closed
+        assert len(ok.sent) == 1
+        manager.disconnect(ok)
+
+    asyncio.run(scenario())
+
+
+def test_batched_clients_get_one_frame_per_interval():
+    async def scenario():
+        manager = ConnectionManager()
+        batched, compact = FakeWebSocket(), FakeWebSocket()
+        await manager.connect(batched, batch_interval=0.1)  # limitado a 0,5 s
+        await manager.connect(compact, "array", batch_interval=0.5)
+        assert manager.subscribers[batched].batch_interval == 0.5
+
+        for lat in (1.0, 2.0, 3.0):
+            for vendor_id in (1, 2):
+                manager.broadcast({"vendor_id": vendor_id, "lat": lat, "lng": 0.0})
+        manager.send_to(batched, {"type": "subscribed"})
+        await asyncio.sleep(0.3)
+        assert batched.sent == []
+
+        await asyncio.sleep(0.3)
+        assert batched.sent == [
+            {"type": "subscribed"},
+            {
+                "type": "batch",
+                "updates": [
+                    {"vendor_id": 1, "lat": 3.0, "lng": 0.0},
+                    {"vendor_id": 2, "lat": 3.0, "lng": 0.0},
+                ],
+            },
+        ]
+        assert compact.frames == ["[[1,3.0,0.0],[2,3.0,0.0]]"]
+
+        # sem alterações não é enviado nada
+        await asyncio.sleep(0.6)
+        assert len(batched.sent) == 2
+        manager.disconnect(batched)
+        manager.disconnect(compact)
+
+    asyncio.run(scenario())
+
+
+def test_snapshot_then_sequenced_deltas_and_resume():
+    async def scenario():
+        manager = ConnectionManager()
+        manager.load_positions([(1, 38.7, -9.1), (2, None, None)])
+        manager.broadcast({"vendor_id": 3, "lat": 41.1, "lng": -8.6})
+
+        ws = FakeWebSocket()
+        await manager.connect(ws, sequenced=True)
+        await asyncio.sleep(0.01)
+        manager.broadcast({"vendor_id": 1, "lat": 38.8, "lng": -9.2})
+        await asyncio.sleep(0.01)
+        snapshot, delta = ws.sent
+        assert snapshot == {
+            "type": "snapshot",
+            "epoch": manager.epoch,
+            "seq": 1,
+            "vendors": [[1, 38.7, -9.1], [3, 41.1, -8.6]],
+        }
+        assert delta == {"vendor_id": 1, "lat": 38.8, "lng": -9.2, "seq": 2}
+        manager.disconnect(ws)
+
+        # eventos perdidos enquanto o cliente estava desligado
+        manager.broadcast({"vendor_id": 3, "lat": None, "lng": None, "remove": True})
+        manager.broadcast({"vendor_id": 1, "lat": 38.9, "lng": -9.3})
+
+        resumed = FakeWebSocket()
+        await manager.connect(resumed, "array", sequenced=True, since=2, epoch=manager.epoch)
+        await asyncio.sleep(0.01)
+        assert resumed.frames == ["[3,null,null,3]", "[1,38.9,-9.3,4]"]
+
+        # epoch de outro processo ou sequência já fora do histórico: snapshot
+        for since, epoch in ((2, "other"), (0, manager.epoch)):
+            small = ConnectionManager(history_size=1)
+            small.epoch = manager.epoch
+            for lat in (1.0, 2.0, 3.0):
+                small.broadcast({"vendor_id": 1, "lat": lat, "lng": 0.0})
+            fresh = FakeWebSocket()
+            await small.connect(fresh, sequenced=True, since=since, epoch=epoch)
+            await asyncio.sleep(0.01)
+            assert fresh.sent[0]["type"] == "snapshot"
+            assert fresh.sent[0]["vendors"] == [[1, 3.0, 0.0]]
+            small.disconnect(fresh)
+        manager.disconnect(resumed)
+
+    asyncio.run(scenario())
+
+
+def test_sequenced_overflow_sends_new_snapshot():
+    async def scenario():
+        manager = ConnectionManager(max_pending=2)
+        ws = FakeWebSocket(delay=0.05)
+        await manager.connect(ws, sequenced=True)
+        await asyncio.sleep(0.01)  # snapshot inicial a ser enviado
+        for vendor_id in (1, 2, 3):
+            manager.broadcast({"vendor_id": vendor_id, "lat": 1.0, "lng": 1.0})
+        await asyncio.sleep(0.2)
+        assert [m["type"] for m in ws.sent] == ["snapshot", "snapshot"]
+        assert ws.sent[-1]["seq"] == 3
+        assert len(ws.sent[-1]["vendors"]) == 3
+        manager.disconnect(ws)
+
+    asyncio.run(scenario())
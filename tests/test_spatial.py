@@ -0,0 +1,49 @@
+# Testes do índice espacial usado em /vendors/nearby
+import random
+
+import pytest
+
+from backend.app.geo import bounding_box, haversine
+from backend.app.spatial import GeoIndex
+
+
+def brute_force(points, lat, lng, radius_m):
+    found = [(vid, haversine(lat, lng, p[0], p[1])) for vid, p in points.items()]
+    return sorted((item for item in found if item[1] <= radius_m), key=lambda item: item[1])
+
+
+def test_nearby_matches_brute_force():
+    rng = random.Random(7)
+    index = GeoIndex()
+    points = {}
+    for vendor_id in range(2000):
+        points[vendor_id] = (rng.uniform(38.6, 38.9), rng.uniform(-9.4, -9.0))
+        index.update(vendor_id, *points[vendor_id])
+
+    for radius in (200, 1000, 5000, 40000):
+        for _ in range(10):
+            lat, lng = rng.uniform(38.6, 38.9), rng.uniform(-9.4, -9.0)
+            found = index.nearby(lat, lng, radius)
+            expected = brute_force(points, lat, lng, radius)
+            assert [vid for vid, _ in found] == [vid for vid, _ in expected]
+            assert [d for _, d in found] == pytest.approx([d for _, d in expected])
+
+
+def test_moved_and_removed_vendors_leave_their_old_cell():
+    index = GeoIndex()
+    index.update(1, 38.7, -9.1)
+    index.update(1, 41.15, -8.61)  # Lisboa -> Porto
+    assert index.nearby(38.7, -9.1, 1000) == []
+    assert [vid for vid, _ in index.nearby(41.15, -8.61, 1000)] == [1]
+
+    index.remove(1)
+    assert index.nearby(41.15, -8.61, 1000) == []
+    assert index.cells == {} and len(index) == 0
+
+
+def test_nearby_across_the_antimeridian():
+    south, west, north, east = bounding_box(0.0, 179.999, 1000)
+    assert west > east
+    index = GeoIndex()
+    index.update(1, 0.0, -179.999)
+    assert [vid for vid, _ in index.nearby(0.0, 179.999, 1000)] == [1]